@@ -0,0 +1,312 @@
+"""bench.py
+
+簡介：
+- Flask 服務的負載測試與效能基準工具。預設會在本機啟動 fake_ipc_server（可設定計算延遲與抖動），
+  並在同一個行程中以 werkzeug 啟動 my_flask1，因此在一般 Linux 主機上即可離線量測。
+- 以多個並行 client 送出請求：
+  - 指定 --rate 時為開放式負載 (open loop)：依固定速率排程送出，延遲由「預定送出時間」起算，
+    避免伺服器變慢時少算排隊時間 (coordinated omission)；
+  - 未指定時為封閉式負載：--concurrency 個 client 一筆接一筆送出。
+- 報告 p50 / p95 / p99 延遲、每秒請求數、錯誤率、HTTP 狀態碼分布，並細分：
+  - 依結果來源（cache hit / scaled / computed）分組的延遲；
+  - 回應的 Server-Timing 標頭中各階段的耗時（伺服器有提供時）；
+  - fake IPC server 端各 RPC 方法的呼叫次數與處理時間。
+- --save 把報告存成 baseline JSON；--compare 與 baseline 比較，超過容許範圍時以非 0 結束（可用於 CI）。
+
+用法：
+    python bench.py --requests 500 --concurrency 16 --latency 0.2 --jitter 0.05
+    python bench.py --duration 30 --rate 50 --distinct 20 --save baseline.json
+    python bench.py --duration 30 --rate 50 --distinct 20 --compare baseline.json
+    python bench.py --url http://localhost:5001 --requests 200      # 測試已在執行的服務
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ENDPOINTS = {
+    "Co2BYTKM": ("distance", "factor", "load", "amount"),
+    "Co2BYOilKM": ("distance", "factor", "load", "amount", "oilUse"),
+}
+# 與 baseline 比較的指標：(路徑, 數值越大越差?)
+COMPARED = (
+    (("latency_ms", "p50"), True),
+    (("latency_ms", "p95"), True),
+    (("latency_ms", "p99"), True),
+    (("rps",), False),
+    (("error_rate",), True),
+)
+_TIMING = re.compile(r"\s*([\w.-]+)(?:;[^,]*?dur=([\d.]+))?[^,]*")
+
+
+# region: 統計
+
+def percentile(values, p):
+    """最近秩 (nearest-rank) 百分位數。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def parse_server_timing(header):
+    """解析 Server-Timing 標頭，回傳 {階段: 毫秒}。"""
+    stages = {}
+    for part in (header or "").split(","):
+        match = _TIMING.match(part)
+        if match and match.group(1) and match.group(2):
+            stages[match.group(1)] = stages.get(match.group(1), 0.0) + float(match.group(2))
+    return stages
+
+# endregion
+
+
+# region: 負載產生
+
+def make_payloads(endpoint, distinct, seed):
+    """產生請求內容；distinct 為不同輸入的數量（越小 cache 命中率越高，0 表示每筆都不同）。"""
+    fields = ENDPOINTS[endpoint]
+    rng = random.Random(seed)
+
+    def payload():
+        return {f: round(rng.uniform(0.1, 100.0), 3) for f in fields}
+
+    if distinct:
+        pool = [payload() for _ in range(distinct)]
+        return (rng.choice(pool) for _ in itertools.count())
+    return (payload() for _ in itertools.count())
+
+
+class Recorder:
+    """收集每筆請求的結果（thread-safe）。"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, sample):
+        with self._lock:
+            self.samples.append(sample)
+
+
+def _send(session_local, url, payload, scheduled, recorder, timeout):
+    session = getattr(session_local, "session", None)
+    if session is None:
+        session = session_local.session = requests.Session()
+    sent = time.perf_counter()
+    sample = {"scheduled": scheduled, "sent": sent}
+    try:
+        res = session.post(url, json=payload, timeout=timeout)
+        sample["status"] = res.status_code
+        sample["stages"] = parse_server_timing(res.headers.get("Server-Timing"))
+        try:
+            body = res.json()
+        except ValueError:
+            body = {}
+        sample["source"] = (body.get("cache") or {}).get("source") if isinstance(body, dict) else None
+        sample["ok"] = res.status_code < 400
+    except requests.RequestException as e:
+        sample["status"] = type(e).__name__
+        sample["ok"] = False
+    sample["done"] = time.perf_counter()
+    recorder.add(sample)
+
+
+def run_load(url, payloads, concurrency, rate=None, total=None, duration=None, timeout=60.0):
+    """送出請求直到達到 total 筆或 duration 秒，回傳 (samples, 實際經過秒數)。"""
+    recorder = Recorder()
+    local = threading.local()
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+    count = itertools.count()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        if rate:
+            # 開放式負載：依速率排程，執行緒池滿時請求會排隊（排隊時間計入延遲）
+            interval = 1.0 / rate
+            for i in count:
+                scheduled = start + i * interval
+                if (total is not None and i >= total) or (deadline and scheduled >= deadline):
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(_send, local, url, next(payloads), scheduled, recorder, timeout)
+        else:
+            lock = threading.Lock()
+
+            def worker():
+                while True:
+                    with lock:
+                        i = next(count)
+                        payload = next(payloads)
+                    if (total is not None and i >= total) or (deadline and time.perf_counter() >= deadline):
+                        return
+                    _send(local, url, payload, time.perf_counter(), recorder, timeout)
+
+            for _ in range(concurrency):
+                pool.submit(worker)
+    return recorder.samples, time.perf_counter() - start
+
+
+def build_report(samples, elapsed, config, server_stats=None):
+    latencies = [(s["done"] - s["scheduled"]) * 1000 for s in samples]
+    service = [(s["done"] - s["sent"]) * 1000 for s in samples]
+    errors = sum(1 for s in samples if not s["ok"])
+    statuses = {}
+    by_source = {}
+    stages = {}
+    for s, latency in zip(samples, latencies):
+        statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+        if s["ok"]:
+            by_source.setdefault(s.get("source") or "unknown", []).append(latency)
+        for stage, ms in (s.get("stages") or {}).items():
+            stages.setdefault(stage, []).append(ms)
+    report = {
+        "config": config,
+        "requests": len(samples),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(samples) / elapsed, 3) if elapsed > 0 else None,
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "status_codes": statuses,
+        "latency_ms": summarize(latencies),
+        "service_ms": summarize(service),
+        "by_source": {k: summarize(v) for k, v in by_source.items()},
+        "stages_ms": {k: summarize(v) for k, v in stages.items()},
+    }
+    if server_stats is not None:
+        report["fake_ipc"] = server_stats
+    return report
+
+# endregion
+
+
+# region: baseline 比較
+
+def _lookup(report, path):
+    for key in path:
+        report = (report or {}).get(key)
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """與 baseline 比較，回傳 [(指標, baseline, 目前, 變化比例, 是否退步)]。"""
+    rows = []
+    for path, higher_is_worse in COMPARED:
+        old, new = _lookup(baseline, path), _lookup(report, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else (0.0 if new == old else math.inf)
+        worse = change > tolerance if higher_is_worse else change < -tolerance
+        if path == ("error_rate",):
+            worse = new > old + tolerance / 10
+        rows.append((".".join(path), old, new, change, worse))
+    return rows
+
+# endregion
+
+
+def _start_app(args):
+    """啟動 fake IPC server 與 Flask app（同一個行程），回傳 (url, fake_server, http_server)。"""
+    from fake_ipc_server import FakeIpcServer
+
+    fake = FakeIpcServer(port=args.ipc_port, latency=args.latency, jitter=args.jitter,
+                         error_rate=args.error_rate, seed=args.seed).start()
+    os.environ["LCA_BACKEND"] = "ipc"
+    os.environ["OPENLCA_IPC_ENDPOINTS"] = fake.url
+    os.environ.setdefault("OPENLCA_IPC_CONCURRENCY", str(args.ipc_concurrency))
+    os.environ.setdefault("SUPABASE_JOURNAL", "")
+    from werkzeug.serving import make_server
+
+    import my_flask1
+
+    server = make_server("127.0.0.1", 0, my_flask1.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", fake, server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="my_flask1 負載測試")
+    parser.add_argument("--url", help="測試已在執行的服務（不啟動 fake IPC server 與 app）")
+    parser.add_argument("--endpoint", default="Co2BYTKM", choices=sorted(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=None, help="總請求數（預設 200，與 --duration 擇一）")
+    parser.add_argument("--duration", type=float, default=None, help="測試秒數")
+    parser.add_argument("--concurrency", type=int, default=8, help="並行 client 數")
+    parser.add_argument("--rate", type=float, default=None, help="每秒請求數（開放式負載）")
+    parser.add_argument("--distinct", type=int, default=0, help="不同輸入的數量（0 表示每筆都不同）")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake IPC 計算延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0.01, help="fake IPC 計算延遲抖動（±秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake IPC 計算失敗機率")
+    parser.add_argument("--ipc-port", type=int, default=0, help="fake IPC server 的 port（0 表示自動）")
+    parser.add_argument("--ipc-concurrency", type=int, default=4, help="每個 IPC client 的並行上限")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="把報告存成 baseline JSON")
+    parser.add_argument("--compare", help="與 baseline JSON 比較")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="允許的退步比例（預設 10%%）")
+    args = parser.parse_args(argv)
+    if args.requests is None and args.duration is None:
+        args.requests = 200
+
+    fake = server = None
+    if args.url:
+        base = args.url.rstrip("/")
+    else:
+        base, fake, server = _start_app(args)
+    config = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "url")}
+    url = f"{base}/calculate/{args.endpoint}"
+    try:
+        samples, elapsed = run_load(
+            url, make_payloads(args.endpoint, args.distinct, args.seed), args.concurrency,
+            rate=args.rate, total=args.requests, duration=args.duration, timeout=args.timeout)
+        report = build_report(samples, elapsed, config, fake.stats() if fake else None)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if fake is not None:
+            fake.stop()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"baseline saved to {args.save}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance)
+        regressed = False
+        for name, old, new, change, worse in rows:
+            regressed |= worse
+            flag = "REGRESSION" if worse else "ok"
+            print(f"{name:16} {old:>12.3f} -> {new:>12.3f}  ({change:+.1%})  {flag}", file=sys.stderr)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""bulk_import.py
+
+簡介：
+- 大量匯入行程資料（distance、factor、load、amount、oilUse）：以 generator 串流解析 CSV / NDJSON，
+  每 chunk 筆以 NumPy 一次轉換與檢查數值，不會把整個檔案讀進記憶體。
+- 計算與寫入由 my_flask1.import_results() 負責（local 模式每個 chunk 向量化計算，ipc 模式以固定數量的
+  進行中計算送往連線池），結果依完成順序逐筆輸出成 CSV 或 NDJSON，記憶體用量與檔案筆數無關。
+- 欄位名稱不分大小寫，也接受常見別名（例如 KM、ton、coefficient、oil_use）；可選的 id 欄位會原樣帶到結果，
+  可選的 model 欄位（Co2BYTKM / Co2BYOilKM 或模型名稱）可讓同一個檔案混合兩種模型。
+
+用法：
+    python bulk_import.py trips.csv --model Co2BYTKM -o results.csv
+    python bulk_import.py trips.ndjson --output-format ndjson --no-persist
+    python bulk_import.py trips.csv --url http://localhost:5001 -o results.csv   # 上傳到執行中的服務 (/import)
+
+可客製化項目：
+- FIELD_ALIASES：欄位名稱的別名
+- chunk_size：每次驗證（local 模式為每次向量化計算）的筆數
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from sweep import chunked
+
+FORMATS = ("csv", "ndjson")
+# 正規化後的欄位名稱（小寫、去除空白 / 底線 / 連字號）→ 欄位
+FIELD_ALIASES = {
+    "distance": "distance", "km": "distance",
+    "factor": "factor", "coefficient": "factor", "cofficient": "factor",
+    "load": "load", "ton": "load",
+    "amount": "amount",
+    "oiluse": "oilUse", "oil": "oilUse",
+    "id": "id", "tripid": "id",
+    "model": "model",
+}
+RESULT_COLUMNS = ("index", "id", "model", "status", "message", "ipcc_id")
+
+
+@dataclass
+class ImportRecord:
+    """一筆匯入資料；error 不為 None 表示驗證或計算失敗。"""
+    index: int
+    route: str
+    inputs: dict = field(default_factory=dict)
+    id: object = None
+    error: str = None
+
+
+# region: 解析與驗證
+
+def detect_format(filename=None, content_type=None, default="csv"):
+    """依副檔名或 Content-Type 判斷檔案格式（csv / ndjson）。"""
+    name = (filename or "").lower()
+    kind = (content_type or "").split(";")[0].strip().lower()
+    if name.endswith((".ndjson", ".jsonl")) or kind in ("application/x-ndjson", "application/jsonl"):
+        return "ndjson"
+    if name.endswith(".csv") or kind in ("text/csv", "application/csv"):
+        return "csv"
+    return default
+
+
+def _text(stream):
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    if not hasattr(stream, "read1"):
+        stream = io.BufferedReader(stream)
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def iter_rows(stream, fmt):
+    """逐筆產生原始資料 (dict)；NDJSON 無法解析的行產生 ValueError（交給驗證時記錄成錯誤）。"""
+    text = _text(stream)
+    if fmt == "csv":
+        yield from csv.DictReader(text)
+        return
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"JSON 格式錯誤: {e}")
+
+
+def _canonical(raw):
+    row_id = route = None
+    values = {}
+    for key, value in raw.items():
+        if key is None:
+            continue
+        name = FIELD_ALIASES.get(re.sub(r"[\s_\-]", "", str(key)).lower())
+        if name == "id":
+            row_id = value
+        elif name == "model":
+            route = value or None
+        elif name:
+            values[name] = value
+    return row_id, route, values
+
+
+def _route(value, routes):
+    if value in routes:
+        return value
+    return next((r for r, spec in routes.items() if spec.model == value), None)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def validate_chunk(chunk, routes, default_route):
+    """驗證一個 chunk 的 [(index, 原始資料)]，回傳相同順序的 ImportRecord 列表。
+
+    routes 為 {route: ModelSpec}（my_flask1.model_registry）；數值欄位以 NumPy 一次轉換整個 chunk，
+    只有轉換失敗時才逐筆找出錯誤的值。
+    """
+    records = []
+    groups = {}
+    for index, raw in chunk:
+        if isinstance(raw, Exception) or not isinstance(raw, dict):
+            message = str(raw) if isinstance(raw, Exception) else "每筆資料必須是 JSON 物件"
+            records.append(ImportRecord(index, default_route, error=message))
+            continue
+        row_id, route_value, values = _canonical(raw)
+        route = _route(route_value or default_route, routes)
+        record = ImportRecord(index, route or route_value, values, row_id)
+        records.append(record)
+        if route is None:
+            record.error = f"未知的模型: {route_value or default_route}"
+            continue
+        fields = routes[route].required
+        missing = [f for f in fields if values.get(f) in (None, "")]
+        if missing:
+            record.error = f"缺少參數: {', '.join(missing)}"
+            continue
+        record.inputs = {f: values[f] for f in fields}
+        groups.setdefault(route, []).append(record)
+
+    for route, group in groups.items():
+        converted = {}
+        for f in routes[route].required:
+            column = [r.inputs[f] for r in group]
+            try:
+                values = np.asarray(column, dtype=float)
+            except (TypeError, ValueError):
+                values = np.array([_to_float(v) for v in column])
+            invalid = ~np.isfinite(values)
+            for record, bad in zip(group, invalid.tolist()):
+                if bad and record.error is None:
+                    record.error = f"參數不是有效數值: {f}={record.inputs[f]!r}"
+            converted[f] = values.tolist()
+        # 只有驗證通過的資料才換成 float；錯誤列保留原始值回傳（與缺少參數的錯誤列一致，也不會寫出 NaN）
+        for i, record in enumerate(group):
+            if record.error is None:
+                record.inputs = {f: column[i] for f, column in converted.items()}
+    return records
+
+
+def read_records(stream, fmt, routes, default_route, chunk_size=1000, max_rows=None):
+    """串流解析並每 chunk_size 筆驗證一次，逐筆產生 ImportRecord。
+
+    超過 max_rows 筆時產生一筆錯誤後停止。
+    """
+    rows = enumerate(iter_rows(stream, fmt))
+    for chunk in chunked(rows, chunk_size):
+        if max_rows and chunk[-1][0] >= max_rows:
+            chunk = [(i, raw) for i, raw in chunk if i < max_rows]
+            yield from validate_chunk(chunk, routes, default_route)
+            yield ImportRecord(max_rows, default_route, error=f"筆數超過上限 {max_rows}，之後的資料未匯入")
+            return
+        yield from validate_chunk(chunk, routes, default_route)
+
+# endregion
+
+
+# region: 結果輸出
+
+class ImportSummary:
+    """匯入的筆數統計（成功、失敗、已送出寫入）。"""
+
+    def __init__(self):
+        self.total = 0
+        self.ok = 0
+        self.errors = 0
+        self.persisted = 0
+        self.started = time.perf_counter()
+
+    def add(self, record, db_status=None):
+        self.total += 1
+        if record.error is None:
+            self.ok += 1
+        else:
+            self.errors += 1
+        if db_status and db_status.get("status") == "queued":
+            self.persisted += 1
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "ok": self.ok,
+            "errors": self.errors,
+            "persisted": self.persisted,
+            "elapsed_s": round(time.perf_counter() - self.started, 3),
+        }
+
+
+def result_fields(routes):
+    """所有模型的參數欄位（依 routes 的順序、不重複）加上 amount。"""
+    names = itertools.chain.from_iterable(spec.fields for spec in routes.values())
+    return tuple(dict.fromkeys(itertools.chain(names, ("amount",))))
+
+
+def _line(obj):
+    # allow_nan=False：NaN / Infinity 不是合法的 JSON，寧可在這裡失敗也不輸出無法解析的行
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False) + "\n"
+
+
+def format_ndjson(results, summary):
+    """results 為 (ImportRecord, impacts, db_status)；每筆輸出一行，最後一行為統計。"""
+    for record, impacts, db_status in results:
+        summary.add(record, db_status)
+        if record.error is not None:
+            yield _line({"type": "error", "index": record.index, "id": record.id, "model": record.route,
+                         "inputs": record.inputs, "message": record.error})
+            continue
+        yield _line({
+            "type": "result",
+            "index": record.index,
+            "id": record.id,
+            "model": record.route,
+            "inputs": record.inputs,
+            "impacts": {i["category"]: i["value"] for i in impacts},
+            "db_status": db_status,
+        })
+    yield _line({"type": "summary", **summary.to_dict()})
+
+
+def format_csv(results, summary, fields, buffer_limit=1000):
+    """以 CSV 輸出結果，每個衝擊類別一欄。
+
+    衝擊類別在第一筆成功的結果之後才知道，之前的錯誤列先暫存（最多 buffer_limit 筆）。
+    """
+    base = list(RESULT_COLUMNS) + list(fields)
+    buffer = io.StringIO()
+    header = None
+    pending = []
+
+    def render(rows, columns, with_header=False):
+        writer = csv.DictWriter(buffer, columns, extrasaction="ignore")
+        if with_header:
+            writer.writeheader()
+        writer.writerows(rows)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    for record, impacts, db_status in results:
+        summary.add(record, db_status)
+        row = {
+            "index": record.index,
+            "id": record.id,
+            "model": record.route,
+            "status": "ok" if record.error is None else "error",
+            "message": record.error or "",
+            "ipcc_id": (db_status or {}).get("ipcc_id"),
+            **record.inputs,
+        }
+        for impact in impacts or ():
+            row[impact["category"]] = impact["value"]
+        if header is None:
+            if not impacts and len(pending) < buffer_limit:
+                pending.append(row)
+                continue
+            header = base + [i["category"] for i in impacts or ()]
+            yield render(pending + [row], header, with_header=True)
+            pending = []
+            continue
+        yield render([row], header)
+    if header is None:
+        yield render(pending, base, with_header=True)
+
+# endregion
+
+
+def _run_local(args, output):
+    # 不在背景暖機：匯入本身就會建立連線並解析模型
+    os.environ.setdefault("WARMUP_AUTOSTART", "0")
+    import my_flask1
+
+    routes = my_flask1.model_registry
+    summary = ImportSummary()
+    with open(args.path, "rb") as f:
+        records = read_records(f, args.format or detect_format(args.path), routes, args.model,
+                               chunk_size=args.chunk_size, max_rows=args.max_rows)
+        results = my_flask1.import_results(records, persist=args.persist)
+        if args.output_format == "csv":
+            chunks = format_csv(results, summary, result_fields(routes))
+        else:
+            chunks = format_ndjson(results, summary)
+        for text in chunks:
+            output.write(text)
+    my_flask1.shutdown()
+    return summary.to_dict()
+
+
+def _run_remote(args, output):
+    import requests
+
+    params = {"model": args.model, "output": args.output_format, "persist": "1" if args.persist else "0"}
+    fmt = args.format or detect_format(args.path)
+    headers = {"Content-Type": "text/csv" if fmt == "csv" else "application/x-ndjson"}
+    with open(args.path, "rb") as f:
+        res = requests.post(args.url.rstrip("/") + "/import", params=params, data=f, headers=headers, stream=True)
+        if res.status_code >= 400:
+            raise SystemExit(f"匯入失敗 ({res.status_code}): {res.text}")
+        for text in res.iter_content(chunk_size=None, decode_unicode=True):
+            output.write(text)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="大量匯入行程資料 (CSV / NDJSON) 並計算排放量")
+    parser.add_argument("path", help="CSV 或 NDJSON 檔案")
+    parser.add_argument("--model", default="Co2BYTKM", help="預設模型（檔案中沒有 model 欄位時使用）")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="輸入格式（預設依副檔名判斷）")
+    parser.add_argument("-o", "--output", default="-", help="結果檔案（預設輸出到 stdout）")
+    parser.add_argument("--output-format", choices=FORMATS, default="csv")
+    parser.add_argument("--no-persist", dest="persist", action="store_false", help="不寫入 Supabase")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--max-rows", type=int, default=None)
+    parser.add_argument("--url", help="上傳到執行中的服務，而不是在本行程計算")
+    args = parser.parse_args(argv)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        if args.url:
+            summary = _run_remote(args, output)
+        else:
+            summary = _run_local(args, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if summary is not None:
+        print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+        return 1 if summary["errors"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""cf_index.py
+
+簡介：
+- 把 JSON-LD 匯出中的單位 (unit_groups/)、流屬性換算 (flows/ 的 flowProperties)、衝擊類別與方法
+  (lcia_categories/、lcia_methods/) 預先編譯成索引：流 UUID → 欄索引，特徵化係數存成 CSR 稀疏矩陣。
+- 陣列以 .npy 檔儲存並以 mmap 載入，啟動時不必再 json.load 數百個流與衝擊類別文件。
+  ID 陣列（流、單位、流屬性鍵、衝擊類別）依字串排序儲存，查詢時直接在 mmap 的陣列上 np.searchsorted，
+  載入時不建立 Python dict（worker 行程之間共用同一份頁面快取）。
+  字串長度依最長的 ID 決定（不限於 UUID 的 36 字元），較長的 ID 不會被截斷而查不到或誤判相符。
+- manifest.json 記錄兩層指紋：
+  1) 來源檔案的大小與修改時間 (stat)：相同時直接使用索引，只需 stat 檔案；
+  2) 各文件的 @id / version / lastChange：stat 不同時才解析 JSON 比對，內容版本相同只更新 stat 指紋，
+     version / lastChange 或文件清單有變動才重建索引。
+- 係數已換算為流的參考單位（與 openLCA 建立 C 矩陣的方式相同）。
+
+用法：
+    index = cf_index.load(root)             # 需要時自動重建
+    python cf_index.py [root] [--force]     # 預先建立索引（例如部署時）
+
+可客製化項目：
+- path：索引目錄（預設為 <root>/.lca_index）
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from scipy import sparse
+
+INDEX_VERSION = 3
+DEFAULT_DIR = ".lca_index"
+SOURCE_FOLDERS = ("flows", "unit_groups", "flow_properties", "lcia_categories", "lcia_methods")
+ARRAYS = (
+    "flow_ids", "unit_ids", "unit_factors", "property_keys", "property_factors",
+    "category_ids", "cf_data", "cf_indices", "cf_indptr",
+)
+_build_lock = threading.Lock()
+
+
+# region: 指紋
+
+def _source_files(root):
+    for folder in SOURCE_FOLDERS:
+        path = os.path.join(root, folder)
+        if not os.path.isdir(path):
+            continue
+        for entry in sorted(os.scandir(path), key=lambda e: e.name):
+            if entry.name.endswith(".json"):
+                yield folder, entry
+
+
+def stat_fingerprint(root):
+    """來源檔案的 (名稱, 大小, 修改時間) 指紋，只需要 stat，不讀取內容。"""
+    digest = hashlib.sha256()
+    for folder, entry in _source_files(root):
+        st = entry.stat()
+        digest.update(f"{folder}/{entry.name}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def content_fingerprint(docs):
+    """各文件 (@id, version, lastChange) 的指紋；docs 為 {folder: {id: doc}}。"""
+    digest = hashlib.sha256()
+    for folder in SOURCE_FOLDERS:
+        for uid, doc in sorted(docs.get(folder, {}).items()):
+            digest.update(f"{folder}/{uid}:{doc.get('version')}:{doc.get('lastChange')}\n".encode())
+    return digest.hexdigest()
+
+
+def _read_docs(root):
+    docs = {}
+    for folder, entry in _source_files(root):
+        with open(entry.path, encoding="utf-8") as f:
+            docs.setdefault(folder, {})[entry.name[:-5]] = json.load(f)
+    return docs
+
+# endregion
+
+
+# region: 建立索引
+
+def build(root, path=None, docs=None):
+    """解析 JSON-LD 匯出並寫入索引，回傳 manifest。"""
+    path = path or os.path.join(root, DEFAULT_DIR)
+    stat_fp = stat_fingerprint(root)
+    docs = docs if docs is not None else _read_docs(root)
+
+    # 單位換算係數（相對於單位組的參考單位）
+    units = {}
+    for group in docs.get("unit_groups", {}).values():
+        for unit in group.get("units", []):
+            units[unit["@id"]] = unit.get("conversionFactor", 1.0)
+
+    # 流屬性換算係數：(流, 流屬性) → conversionFactor
+    properties = {}
+    for flow_id, flow in docs.get("flows", {}).items():
+        for fp in flow.get("flowProperties", []):
+            properties[f"{flow_id}|{fp['flowProperty']['@id']}"] = fp.get("conversionFactor", 1.0)
+
+    # 特徵化係數（換算為流的參考單位）
+    categories = docs.get("lcia_categories", {})
+    category_ids = sorted(categories)
+    category_cfs = []
+    flow_ids = set(docs.get("flows", {}))
+    for cid in category_ids:
+        cfs = {}
+        for factor in categories[cid].get("impactFactors", []):
+            flow_id = factor["flow"]["@id"]
+            unit_id = (factor.get("unit") or {}).get("@id")
+            per_unit = units.get(unit_id, 1.0) if unit_id else 1.0
+            prop_id = (factor.get("flowProperty") or {}).get("@id")
+            conversion = properties.get(f"{flow_id}|{prop_id}") if prop_id else None
+            if conversion is not None:
+                per_unit /= conversion
+            cfs[flow_id] = cfs.get(flow_id, 0.0) + factor.get("value", 0.0) / per_unit
+        category_cfs.append(cfs)
+        flow_ids.update(cfs)
+    flow_ids = sorted(flow_ids)
+    flow_index = {fid: i for i, fid in enumerate(flow_ids)}
+    rows, cols, vals = [], [], []
+    for row, cfs in enumerate(category_cfs):
+        for flow_id, value in cfs.items():
+            rows.append(row), cols.append(flow_index[flow_id]), vals.append(value)
+    cf = sparse.csr_matrix((vals, (rows, cols)), shape=(len(category_ids), len(flow_ids)))
+
+    # 所有 ID 陣列都依排序儲存（係數陣列跟著重新排列），CfIndex 以 np.searchsorted 查詢
+    unit_ids = sorted(units)
+    property_keys = sorted(properties)
+    arrays = {
+        "flow_ids": _id_array(flow_ids),
+        "unit_ids": _id_array(unit_ids),
+        "unit_factors": np.array([units[u] for u in unit_ids], dtype=float),
+        "property_keys": _id_array(property_keys),
+        "property_factors": np.array([properties[k] for k in property_keys], dtype=float),
+        "category_ids": _id_array(category_ids),
+        "cf_data": cf.data.astype(float),
+        "cf_indices": cf.indices.astype(np.int32),
+        "cf_indptr": cf.indptr.astype(np.int64),
+    }
+    methods = {}
+    for mid, method in docs.get("lcia_methods", {}).items():
+        methods[mid] = {
+            "name": method.get("name"),
+            "categories": [
+                {k: ref.get(k) for k in ("@id", "name", "category", "refUnit")}
+                for ref in method.get("impactCategories", [])
+            ],
+        }
+    manifest = {
+        "index_version": INDEX_VERSION,
+        "stat_fingerprint": stat_fp,
+        "content_fingerprint": content_fingerprint(docs),
+        "methods": methods,
+        "counts": {"flows": len(flow_ids), "categories": len(category_ids), "factors": int(cf.nnz)},
+    }
+
+    os.makedirs(path, exist_ok=True)
+    suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+    for name, array in arrays.items():
+        target = os.path.join(path, name + ".npy")
+        with open(target + suffix, "wb") as f:
+            np.save(f, array)
+        os.replace(target + suffix, target)
+    # manifest 最後寫入：讀取端看到新的 manifest 時所有陣列都已就緒
+    _write_manifest(path, manifest, suffix)
+    return manifest
+
+
+def _id_array(ids):
+    """已排序 ID 的固定長度字串陣列，長度取最長的 ID（np.save / mmap 需要固定長度）。"""
+    return np.array(ids, dtype=f"U{max((len(i) for i in ids), default=1)}")
+
+
+def _write_manifest(path, manifest, suffix=".tmp"):
+    target = os.path.join(path, "manifest.json")
+    with open(target + suffix, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(target + suffix, target)
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("index_version") != INDEX_VERSION:
+        return None
+    if not all(os.path.exists(os.path.join(path, name + ".npy")) for name in ARRAYS):
+        return None
+    return manifest
+
+
+def load(root, path=None, force=False):
+    """載入索引；來源的 version / lastChange 有變動（或索引不存在）時先重建。"""
+    path = path or os.path.join(root, DEFAULT_DIR)
+    with _build_lock:
+        manifest = None if force else _read_manifest(path)
+        stat_fp = stat_fingerprint(root)
+        if manifest is None:
+            manifest = build(root, path)
+        elif manifest["stat_fingerprint"] != stat_fp:
+            docs = _read_docs(root)
+            if manifest["content_fingerprint"] == content_fingerprint(docs):
+                # 只有修改時間變了（例如重新 checkout）：更新指紋即可，不必重建
+                manifest["stat_fingerprint"] = stat_fp
+                _write_manifest(path, manifest, f".tmp-{os.getpid()}")
+            else:
+                manifest = build(root, path, docs=docs)
+    return CfIndex(path, manifest)
+
+# endregion
+
+
+def _positions(keys, values):
+    """values 在已排序的 keys 中的位置；不存在的值為 -1。"""
+    values = np.asarray(values, dtype=str)
+    if not len(keys):
+        return np.full(values.shape, -1, dtype=np.int64)
+    found = np.searchsorted(keys, values)
+    clipped = np.minimum(found, len(keys) - 1)
+    return np.where(keys[clipped] == values, clipped, -1)
+
+
+def _position(keys, value):
+    i = int(np.searchsorted(keys, value))
+    return i if i < len(keys) and keys[i] == value else -1
+
+
+class CfIndex:
+    """以 mmap 載入的單位 / 流屬性 / 特徵化係數索引。"""
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in ARRAYS}
+        self._flow_ids = arrays["flow_ids"]
+        self._unit_ids = arrays["unit_ids"]
+        self._unit_factors = arrays["unit_factors"]
+        self._property_keys = arrays["property_keys"]
+        self._property_factors = arrays["property_factors"]
+        self._category_ids = arrays["category_ids"]
+        self._method_names = {m["name"]: mid for mid, m in manifest["methods"].items()}
+        self.cf = sparse.csr_matrix(
+            (arrays["cf_data"], arrays["cf_indices"], arrays["cf_indptr"]),
+            shape=(len(self._category_ids), len(self._flow_ids)), copy=False)
+
+    def unit_factor(self, unit_id):
+        i = _position(self._unit_ids, unit_id)
+        return float(self._unit_factors[i]) if i >= 0 else 1.0
+
+    def property_factor(self, flow_id, property_id):
+        """流在某流屬性下的 conversionFactor；流沒有該屬性時回傳 None。"""
+        i = _position(self._property_keys, f"{flow_id}|{property_id}")
+        return float(self._property_factors[i]) if i >= 0 else None
+
+    def method_id(self, uid=None, name=None):
+        if uid:
+            return uid if uid in self.manifest["methods"] else None
+        return self._method_names.get(name)
+
+    def method_categories(self, method_id):
+        """方法中各衝擊類別的 Ref 資料（@id / name / category / refUnit）。"""
+        return self.manifest["methods"][method_id]["categories"]
+
+    def matrix(self, category_ids, envi_ids):
+        """特徵化矩陣 C（類別 × 干預流）；索引中沒有係數的流對應到全 0 的欄。"""
+        # 方法引用了索引中不存在的類別時，該列維持 0
+        rows = _positions(self._category_ids, category_ids)
+        present = np.flatnonzero(rows >= 0)
+        flows = _positions(self._flow_ids, envi_ids)
+        known = np.flatnonzero(flows >= 0)
+        select = sparse.csr_matrix(
+            (np.ones(len(known)), (flows[known], known)),
+            shape=(len(self._flow_ids), len(envi_ids)))
+        part = (self.cf[rows[present]] @ select).tocoo()
+        return sparse.csr_matrix(
+            (part.data, (present[part.row], part.col)),
+            shape=(len(category_ids), len(envi_ids)))
+
+    def stats(self):
+        return {"path": self.path, **self.manifest["counts"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="建立 JSON-LD 匯出的特徵化係數索引")
+    parser.add_argument("root", nargs="?", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--path", default=None, help="索引目錄（預設為 <root>/.lca_index）")
+    parser.add_argument("--force", action="store_true", help="不論指紋是否相同都重建")
+    args = parser.parse_args()
+    index = load(args.root, args.path, force=args.force)
+    print(json.dumps(index.stats(), ensure_ascii=False))
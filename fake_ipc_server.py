@@ -0,0 +1,239 @@
+"""fake_ipc_server.py
+
+簡介：
+- 模擬 openLCA IPC Server 的 JSON-RPC 介面，供效能測試 (bench.py) 與離線開發使用，不需要安裝 openLCA。
+- 支援 my_flask1 / model_cache / jobs 會用到的方法：data/get、data/get/descriptor(s)、data/get/parameters、
+  result/calculate、result/state、result/total-impacts、result/dispose。
+- 計算時間可設定固定延遲 (latency) 與隨機抖動 (jitter)，也可設定錯誤率，模擬 openLCA 計算忙碌或失敗的情況。
+- stall：每個 RPC 回應前等待的秒數（可在執行中修改），模擬卡住、不回應的 openLCA（測試連線池的逾時與剔除）。
+- 計算結果為 amount × 各參數值的乘積（依衝擊類別乘上不同係數），方便驗證結果是否正確。
+- /stats（HTTP GET）回傳各 RPC 方法的呼叫次數與處理時間，以及尚未 dispose 的結果數。
+
+用法：
+    python fake_ipc_server.py --port 3001 --latency 0.5 --jitter 0.2
+或在程式中：
+    server = FakeIpcServer(port=0, latency=0.05).start()   # port=0 表示自動選擇
+    ...
+    server.stop()
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 預設模型：名稱 → 輸入參數（依名稱排序，與 openLCA 回傳的順序相同）
+DEFAULT_MODELS = {
+    "廚餘處理量": ("cofficient", "KM", "ton"),
+    "燃料消耗碳排": ("cofficient", "distance", "oil", "ton"),
+}
+# 預設衝擊類別：名稱 → 相對於參數乘積的係數
+DEFAULT_CATEGORIES = {
+    "IPCC 2021 GWP 100": 1.0,
+    "IPCC 2021 GWP 20": 1.5,
+}
+
+
+class FakeIpcServer:
+    """以 ThreadingHTTPServer 實作的假 openLCA IPC Server。"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 models=None, categories=None, method_name="IPCC 2021 AR6", seed=None, stall=0.0):
+        self.latency = latency
+        self.stall = stall
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.models = dict(models or DEFAULT_MODELS)
+        self.categories = dict(categories or DEFAULT_CATEGORIES)
+        self.method_name = method_name
+        self._random = random.Random(seed)
+        self._results = {}
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ipc", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # region: JSON-RPC 方法
+
+    def _entity(self, kind, uid=None, name=None):
+        if kind == "ProductSystem":
+            name = name or next((n for n in self.models if _uid(kind, n) == uid), None)
+            if name not in self.models:
+                return None
+            return {"@type": kind, "@id": _uid(kind, name), "name": name,
+                    "version": "01.00.000", "lastChange": "2024-01-01T00:00:00Z"}
+        if kind == "ImpactMethod":
+            name = name or self.method_name
+            return {"@type": kind, "@id": _uid(kind, name), "name": name,
+                    "impactCategories": [self._category(c) for c in self.categories]}
+        if kind == "UnitGroup":
+            return {"@type": kind, "@id": _uid(kind, "Units of mass"), "name": "Units of mass",
+                    "units": [{"@type": "Unit", "@id": _uid("Unit", "kg"), "name": "kg", "isRefUnit": True},
+                              {"@type": "Unit", "@id": _uid("Unit", "t"), "name": "t", "conversionFactor": 1000.0}]}
+        return {"@type": kind, "@id": uid or _uid(kind, name), "name": name}
+
+    def _category(self, name):
+        return {"@type": "ImpactCategory", "@id": _uid("ImpactCategory", name), "name": name, "refUnit": "kg CO2 eq"}
+
+    def _descriptors(self, kind):
+        if kind == "ProductSystem":
+            names = list(self.models)
+        elif kind == "UnitGroup":
+            names = ["Units of mass"]
+        elif kind == "ImpactMethod":
+            names = [self.method_name]
+        else:
+            names = []
+        return [{"@type": kind, "@id": _uid(kind, n), "name": n} for n in names]
+
+    def _calculate(self, setup):
+        if self.error_rate and self._random.random() < self.error_rate:
+            return None, "simulated calculation error"
+        delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        value = float(setup.get("amount", 1.0) or 1.0)
+        for p in setup.get("parameters") or []:
+            value *= float(p.get("value", 1.0))
+        uid = str(uuid.uuid4())
+        with self._lock:
+            self._results[uid] = (time.monotonic() + delay, value)
+        return {"@type": "ResultState", "@id": uid, "isReady": False, "isScheduled": True}, None
+
+    def _state(self, uid):
+        with self._lock:
+            result = self._results.get(uid)
+        if result is None:
+            return None, f"no result with id {uid}"
+        ready = time.monotonic() >= result[0]
+        return {"@type": "ResultState", "@id": uid, "isReady": ready, "isScheduled": not ready}, None
+
+    def _impacts(self, uid):
+        with self._lock:
+            result = self._results.get(uid)
+        if result is None:
+            return None, f"no result with id {uid}"
+        return [{"@type": "ImpactValue", "impactCategory": self._category(name), "amount": result[1] * k}
+                for name, k in self.categories.items()], None
+
+    def dispatch(self, method, params):
+        """處理一個 JSON-RPC 呼叫，回傳 (result, error)。"""
+        params = params or {}
+        kind = params.get("@type")
+        if method == "data/get":
+            entity = self._entity(kind, params.get("@id"), params.get("name"))
+            return (entity, None) if entity else (None, f"{kind} not found")
+        if method == "data/get/descriptor":
+            entity = self._entity(kind, params.get("@id"), params.get("name"))
+            return ({k: entity[k] for k in ("@type", "@id", "name")}, None) if entity else (None, "not found")
+        if method == "data/get/descriptors":
+            return self._descriptors(kind), None
+        if method == "data/get/parameters":
+            name = next((n for n in self.models if _uid("ProductSystem", n) == params.get("@id")), None)
+            if name is None:
+                return None, "product system not found"
+            return [{"@type": "ParameterRedef", "name": p, "value": 1.0} for p in self.models[name]], None
+        if method == "result/calculate":
+            return self._calculate(params)
+        if method == "result/state":
+            return self._state(params.get("@id"))
+        if method == "result/total-impacts":
+            return self._impacts(params.get("@id"))
+        if method == "result/dispose":
+            with self._lock:
+                self._results.pop(params.get("@id"), None)
+            return {}, None
+        return None, f"unknown method: {method}"
+
+    # endregion
+
+    def _record(self, method, seconds):
+        with self._lock:
+            count, total = self._calls.get(method, (0, 0.0))
+            self._calls[method] = (count + 1, total + seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": {m: {"count": c, "total_ms": round(t * 1000, 3)} for m, (c, t) in self._calls.items()},
+                "open_results": len(self._results),
+            }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 標頭與內容分兩次寫入，未關閉 Nagle 時 keep-alive 連線每次呼叫會多等一次 delayed ACK (~40ms)
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._send(server.stats())
+
+            def do_POST(self):
+                start = time.perf_counter()
+                if server.stall:
+                    time.sleep(server.stall)
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                method = req.get("method")
+                result, error = server.dispatch(method, req.get("params"))
+                resp = {"jsonrpc": "2.0", "id": req.get("id")}
+                if error:
+                    resp["error"] = {"code": 500, "message": error}
+                else:
+                    resp["result"] = result
+                self._send(resp)
+                server._record(method, time.perf_counter() - start)
+
+        return Handler
+
+
+def _uid(kind, name):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"fake-ipc/{kind}/{name}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="假的 openLCA IPC Server（效能測試用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--latency", type=float, default=0.5, help="每次計算的平均秒數")
+    parser.add_argument("--jitter", type=float, default=0.1, help="計算時間的隨機抖動（±秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="計算失敗的機率 (0-1)")
+    args = parser.parse_args()
+    fake = FakeIpcServer(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Fake openLCA IPC server on {fake.url} (latency={args.latency}s ±{args.jitter}s)")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,293 @@
+"""history_store.py
+
+簡介：
+- 在本機 SQLite 中維護已儲存排放量的彙總 (rollup)：依時間區間（小時 / 日）、模型與衝擊類別記錄
+  筆數、總和、最小 / 最大值，以及估計百分位數用的對數直方圖。
+- 每次儲存結果時呼叫 record()，先累加在記憶體中，背景執行緒每隔 flush_interval 秒合併寫入 SQLite；
+  查詢時直接合併記憶體中尚未寫入的彙總（請求中不寫入 SQLite，其他 worker 鎖住檔案時查詢不會失敗），
+  因此剛儲存的結果立即可查。
+- 直方圖以相對誤差 RELATIVE_ACCURACY 的對數區間計數（類似 DDSketch），不同時間區間 / 模型的直方圖可以直接相加，
+  查詢任意範圍的百分位數時不需要原始資料；各 worker 行程共用同一個 SQLite 檔，合併寫入在交易中完成。
+- 範圍查詢只讀取彙總列（區間數 × 模型數 × 類別數），不必掃描遠端的每一筆 IPCC 資料。
+
+可客製化項目：
+- RESOLUTIONS：彙總的時間粒度
+- RELATIVE_ACCURACY：百分位數的相對誤差
+- hour_retention：小時彙總保留多久（秒，None 表示永久保留；日彙總一律保留）
+"""
+
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {"hour": 3600, "day": 86400}
+RELATIVE_ACCURACY = 0.01
+GROUP_FIELDS = ("bucket", "model", "category")
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+
+# region: 對數直方圖
+
+def histogram_key(value):
+    """數值所屬的直方圖區間：正數 "p{k}"、負數 "n{k}"、0 為 "z"（k 為以 gamma 為底的對數區間）。"""
+    if value == 0:
+        return "z"
+    k = math.ceil(math.log(abs(value)) / _LOG_GAMMA)
+    return f"p{k}" if value > 0 else f"n{k}"
+
+
+def _bucket_value(key):
+    if key == "z":
+        return 0.0
+    k = int(key[1:])
+    value = 2 * _GAMMA ** k / (_GAMMA + 1)
+    return value if key[0] == "p" else -value
+
+
+def _order(key):
+    if key == "z":
+        return (1, 0)
+    k = int(key[1:])
+    return (2, k) if key[0] == "p" else (0, -k)
+
+
+def quantiles(histogram, ps, lo=None, hi=None):
+    """由直方圖估計百分位數（最近秩），ps 為 0–100 的數值；結果限制在 [lo, hi] 內。"""
+    total = sum(histogram.values())
+    if not total:
+        return {p: None for p in ps}
+    keys = sorted(histogram, key=_order)
+    result = {}
+    for p in ps:
+        rank = max(1, math.ceil(p / 100 * total))
+        seen = 0
+        for key in keys:
+            seen += histogram[key]
+            if seen >= rank:
+                value = _bucket_value(key)
+                if lo is not None:
+                    value = max(lo, value)
+                if hi is not None:
+                    value = min(hi, value)
+                result[p] = value
+                break
+    return result
+
+# endregion
+
+
+class _Rollup:
+    """單一 (時間區間, 模型, 類別) 的彙總，可與其他彙總合併。"""
+
+    __slots__ = ("count", "sum", "min", "max", "histogram")
+
+    def __init__(self, count=0, total=0.0, lo=math.inf, hi=-math.inf, histogram=None):
+        self.count = count
+        self.sum = total
+        self.min = lo
+        self.max = hi
+        self.histogram = histogram if histogram is not None else {}
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        key = histogram_key(value)
+        self.histogram[key] = self.histogram.get(key, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for key, n in other.histogram.items():
+            self.histogram[key] = self.histogram.get(key, 0) + n
+
+    def to_dict(self, percentiles):
+        data = {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+        for p, value in quantiles(self.histogram, percentiles, self.min, self.max).items():
+            data[f"p{p:g}"] = value
+        return data
+
+
+class HistoryStore:
+    """以 SQLite 保存依時間區間 / 模型 / 衝擊類別彙總的排放量。"""
+
+    def __init__(self, path, flush_interval=1.0, hour_retention=90 * 86400):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.hour_retention = hour_retention
+        self.recorded = 0
+        self.flushes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._db = self._connect(path)
+
+    @staticmethod
+    def _connect(path):
+        # timeout：多個 worker 行程同時合併寫入時等待對方的交易結束
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS rollups ("
+            "resolution TEXT NOT NULL, bucket INTEGER NOT NULL, model TEXT NOT NULL, category TEXT NOT NULL, "
+            "count INTEGER NOT NULL, sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL, histogram TEXT NOT NULL, "
+            "PRIMARY KEY (resolution, bucket, model, category))"
+        )
+        return db
+
+    def reopen(self):
+        """重新建立 SQLite 連線（fork 出的 worker 行程不能沿用父行程的連線）。"""
+        with self._db_lock:
+            self._db = self._connect(self.path)
+
+    # region: 寫入
+
+    def record(self, model, impacts, timestamp=None):
+        """記錄一次儲存的結果；impacts 為 {衝擊類別: 數值}。"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for resolution, seconds in RESOLUTIONS.items():
+                bucket = int(timestamp // seconds * seconds)
+                for category, value in impacts.items():
+                    if value is None:
+                        continue
+                    key = (resolution, bucket, model, category)
+                    rollup = self._pending.get(key)
+                    if rollup is None:
+                        rollup = self._pending[key] = _Rollup()
+                    rollup.add(float(value))
+            self.recorded += 1
+
+    def flush(self):
+        """把記憶體中累加的彙總合併寫入 SQLite，回傳寫入的列數。"""
+        with self._lock:
+            if not self._pending:
+                return 0
+        # 持有 _db_lock 時才取出彙總：query() 看到的不是記憶體中的彙總，就是已提交的資料，不會漏算或重複
+        with stage("history_flush"), self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            db = self._db
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                for key, rollup in pending.items():
+                    row = db.execute(
+                        "SELECT count, sum, min, max, histogram FROM rollups "
+                        "WHERE resolution = ? AND bucket = ? AND model = ? AND category = ?", key).fetchone()
+                    merged = rollup
+                    if row is not None:
+                        merged = _Rollup(row[0], row[1], row[2], row[3], json.loads(row[4]))
+                        merged.merge(rollup)
+                    db.execute(
+                        "INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        key + (merged.count, merged.sum, merged.min, merged.max,
+                               json.dumps(merged.histogram, separators=(",", ":"))))
+                if self.hour_retention is not None:
+                    db.execute("DELETE FROM rollups WHERE resolution = 'hour' AND bucket < ?",
+                               (time.time() - self.hour_retention,))
+                db.execute("COMMIT")
+            except BaseException:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                # 寫入失敗的彙總放回記憶體，下次再合併
+                with self._lock:
+                    for key, rollup in pending.items():
+                        current = self._pending.get(key)
+                        if current is not None:
+                            rollup.merge(current)
+                        self._pending[key] = rollup
+                raise
+        self.flushes += 1
+        return len(pending)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name="history-store", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("history flush failed: %s", e)
+
+    # endregion
+
+    def query(self, start, end, resolution="day", models=None, categories=None,
+              group_by=("bucket", "model", "category"), percentiles=(50, 95)):
+        """查詢 [start, end) 之間的彙總，依 group_by 中的欄位分組合併，回傳 list of dict。
+
+        start / end 為 epoch 秒；區間以開始時間對齊，部分落在範圍內的區間也會包含在內。
+        尚未寫入 SQLite 的彙總直接從記憶體合併；讀取 SQLite 失敗（例如檔案被鎖住）時丟出 sqlite3.Error。
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"不支援的時間粒度: {resolution}")
+        unknown = [f for f in group_by if f not in GROUP_FIELDS]
+        if unknown:
+            raise ValueError(f"不支援的分組欄位: {', '.join(unknown)}")
+        seconds = RESOLUTIONS[resolution]
+        first = int(start // seconds * seconds)
+        sql = ("SELECT bucket, model, category, count, sum, min, max, histogram FROM rollups "
+               "WHERE resolution = ? AND bucket >= ? AND bucket < ?")
+        args = [resolution, first, end]
+        for column, values in (("model", models), ("category", categories)):
+            if values:
+                sql += f" AND {column} IN ({','.join('?' * len(values))})"
+                args.extend(values)
+        with self._db_lock:
+            with self._lock:
+                pending = [
+                    (bucket, model, category, _Rollup(r.count, r.sum, r.min, r.max, dict(r.histogram)))
+                    for (res, bucket, model, category), r in self._pending.items()
+                    if res == resolution and first <= bucket < end
+                    and (not models or model in models) and (not categories or category in categories)
+                ]
+            rows = self._db.execute(sql, args).fetchall()
+        stored = [(bucket, model, category, _Rollup(count, total, lo, hi, json.loads(histogram)))
+                  for bucket, model, category, count, total, lo, hi, histogram in rows]
+
+        groups = {}
+        for bucket, model, category, rollup in sorted(stored + pending, key=lambda item: item[:3]):
+            row = {"bucket": bucket, "model": model, "category": category}
+            key = tuple(row[f] for f in group_by)
+            if key in groups:
+                groups[key].merge(rollup)
+            else:
+                groups[key] = rollup
+        return [{**dict(zip(group_by, key)), **rollup.to_dict(percentiles)} for key, rollup in groups.items()]
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {"path": self.path, "recorded": self.recorded, "pending_rollups": pending, "flushes": self.flushes}
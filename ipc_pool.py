@@ -0,0 +1,290 @@
+"""ipc_pool.py
+
+簡介：
+- 管理多個 openLCA IPC client（可分佈在不同的 port / host），讓並行的 HTTP 請求分散到多個 openLCA 實例，
+  而不是全部排隊在同一個 socket 上。
+- 排程：選擇「進行中請求最少」的健康 client；每個 client 有並行上限（olca_ipc.Client 本身不是 thread-safe，預設 1）。
+- 連線失敗的 server 會被暫時剔除 (eject)，請求自動改送到其他 server 重試；背景健康檢查會在 server 恢復後重新加入。
+- 提供與 olca_ipc.Client 相同的查詢介面（get / get_parameters / find / get_descriptors），可直接交給 model_cache 使用。
+- olca_ipc.Client 的 HTTP 請求本身沒有逾時：池中的 client 換成有預設 timeout 的 session，
+  沒有回應的 server 會以 requests.Timeout 視為連線失敗並被剔除，健康檢查也不會卡住。
+
+可客製化項目：
+- endpoints：port 或 URL 列表，例如 "3001,3000" 或 "http://10.0.0.5:8080"
+- max_concurrency：每個 client 同時處理的請求數上限
+- health_interval：背景健康檢查間隔秒數
+- eject_seconds：連線失敗後剔除多久才再嘗試
+- retries：連線失敗時改送到其他 server 的重試次數
+- max_waiting：以 shed=True 取得 client 時，等待中的請求數達到此值就直接丟出 PoolOverloaded（None 表示不限制）
+- request_timeout / probe_timeout：每個 IPC 請求與健康檢查等待回應的秒數（None 表示不限制）
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import olca_ipc as ipc
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 視為「server 已失效」的例外（JSON-RPC 的錯誤回應不算）
+CONNECTION_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError)
+
+
+class PoolUnavailable(RuntimeError):
+    """沒有可用的 IPC client（全部失效或等待逾時）。"""
+
+
+class PoolOverloaded(PoolUnavailable):
+    """等待 openLCA IPC 連線的請求過多（backpressure），稍後再試。"""
+
+
+class _TimeoutSession(requests.Session):
+    """每個請求都帶預設 timeout 的 requests.Session（olca_ipc.Client 呼叫 post 時不會指定 timeout）。"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(*args, **kwargs)
+
+
+def with_timeout(client, timeout):
+    """把 olca_ipc.Client 的 session 換成有 timeout 的版本；其他類型的 client（本機引擎、測試替身）原樣回傳。"""
+    session = getattr(client, "_s", None)
+    if timeout is not None and isinstance(session, requests.Session):
+        session.close()
+        client._s = _TimeoutSession(timeout)
+    return client
+
+
+class PoolMember:
+    """池中的單一 client 與其狀態。"""
+
+    def __init__(self, client, endpoint, probe=None):
+        self.client = client
+        self.endpoint = endpoint
+        # 健康檢查使用獨立的 client，避免與進行中的請求共用同一個連線
+        self.probe = probe
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.last_error = None
+
+    def available(self, now):
+        # 剔除時間已過的 server 允許再試一次（半開狀態）
+        return self.healthy or now >= self.ejected_until
+
+    def status(self):
+        return {
+            "endpoint": self.endpoint,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "served": self.served,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+def parse_endpoints(value):
+    """把 "3001,3000" 或 "http://host:8080, 3002" 轉為 ipc.Client 可用的 endpoint 列表。"""
+    endpoints = []
+    for item in str(value).split(","):
+        item = item.strip()
+        if not item:
+            continue
+        endpoints.append(int(item) if item.isdigit() else item)
+    return endpoints
+
+
+class IpcClientPool:
+    """多個 IPC client 的連線池與負載平衡排程器。"""
+
+    def __init__(self, endpoints=None, clients=None, max_concurrency=1, health_interval=10.0,
+                 eject_seconds=30.0, retries=1, acquire_timeout=60.0, max_waiting=None, client_factory=ipc.Client,
+                 request_timeout=60.0, probe_timeout=5.0):
+        members = [
+            PoolMember(with_timeout(client_factory(e), request_timeout), e,
+                       probe=with_timeout(client_factory(e), probe_timeout))
+            for e in (endpoints or [])
+        ]
+        members += [PoolMember(c, type(c).__name__) for c in (clients or [])]
+        if not members:
+            raise ValueError("IpcClientPool 至少需要一個 endpoint 或 client")
+        self.members = members
+        self.max_concurrency = max_concurrency
+        self.health_interval = health_interval
+        self.eject_seconds = eject_seconds
+        self.retries = retries
+        self.acquire_timeout = acquire_timeout
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self._cond = threading.Condition()
+        self._health_thread = None
+        self._stopped = threading.Event()
+
+    @classmethod
+    def from_env(cls, endpoints, **kwargs):
+        return cls(endpoints=parse_endpoints(endpoints), **kwargs)
+
+    # region: 排程
+
+    @contextmanager
+    def acquire(self, timeout=None, exclude=(), shed=False):
+        """取得一個 client（進行中請求最少者），離開 with 區塊時歸還。
+
+        shed=True 時若需要排隊且等待中的請求已達 max_waiting，直接丟出 PoolOverloaded 而不排隊。
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        queued = False
+        with self._cond:
+            try:
+                while True:
+                    now = time.monotonic()
+                    candidates = [m for m in self.members if m not in exclude and m.available(now)]
+                    if not candidates:
+                        raise PoolUnavailable("沒有可用的 openLCA IPC server")
+                    free = [m for m in candidates if m.outstanding < self.max_concurrency]
+                    if free:
+                        member = min(free, key=lambda m: (m.outstanding, m.served))
+                        member.outstanding += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise PoolUnavailable("等待 openLCA IPC 連線逾時")
+                    if not queued:
+                        if shed and self.max_waiting is not None and self.waiting >= self.max_waiting:
+                            raise PoolOverloaded(f"openLCA 計算佇列已滿（{self.waiting} 筆等待中），請稍後再試")
+                        queued = True
+                        self.waiting += 1
+                    self._cond.wait(min(remaining, 1.0))
+            finally:
+                if queued:
+                    self.waiting -= 1
+        try:
+            yield member
+        finally:
+            with self._cond:
+                member.outstanding -= 1
+                member.served += 1
+                self._cond.notify()
+
+    def run(self, fn, shed=False):
+        """以池中的 client 執行 fn(client)；連線失敗時剔除該 server 並改送其他 server 重試。"""
+        tried = []
+        last_error = None
+        for _ in range(self.retries + 1):
+            try:
+                with self.acquire(exclude=tried, shed=shed) as member:
+                    try:
+                        result = fn(member.client)
+                    except CONNECTION_ERRORS as e:
+                        self._eject(member, e)
+                        tried.append(member)
+                        last_error = e
+                        continue
+                    self._mark_healthy(member)
+                    return result
+            except PoolUnavailable:
+                if last_error is None:
+                    raise
+                break
+        raise PoolUnavailable(f"openLCA IPC 連線失敗: {last_error}")
+
+    def _eject(self, member, error):
+        if member.healthy:
+            logger.warning("openLCA IPC server %s ejected: %s", member.endpoint, error)
+        with self._cond:
+            member.healthy = False
+            member.failures += 1
+            member.last_error = str(error)
+            member.ejected_until = time.monotonic() + self.eject_seconds
+            self._cond.notify_all()
+
+    def _mark_healthy(self, member):
+        if not member.healthy:
+            logger.info("openLCA IPC server %s is healthy again", member.endpoint)
+            with self._cond:
+                member.healthy = True
+                member.last_error = None
+                self._cond.notify_all()
+
+    # endregion
+
+    # region: 健康檢查
+
+    def check_health(self):
+        """同時探測每個 server（最多等待 probe_timeout 秒）；能回應 JSON-RPC（即使是錯誤訊息）即視為健康。"""
+        members = [m for m in self.members if m.probe is not None]
+        if members:
+            with ThreadPoolExecutor(max_workers=len(members), thread_name_prefix="ipc-probe") as executor:
+                list(executor.map(self._probe, members))
+        return self.stats()
+
+    def _probe(self, member):
+        try:
+            member.probe.rpc_call("data/get/descriptor", {"@type": "ImpactMethod", "@id": "health-check"})
+        except CONNECTION_ERRORS as e:
+            self._eject(member, e)
+        except Exception:
+            # 回應格式錯誤仍代表 server 有在運作
+            self._mark_healthy(member)
+        else:
+            self._mark_healthy(member)
+
+    def start_health_checks(self):
+        """啟動背景健康檢查執行緒（重複呼叫不會建立多個執行緒）。"""
+        if self.health_interval is None or self._health_thread is not None:
+            return
+        self._stopped.clear()
+
+        def loop():
+            while not self._stopped.wait(self.health_interval):
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=loop, name="ipc-pool-health", daemon=True)
+        self._health_thread.start()
+
+    def close(self):
+        self._stopped.set()
+        self._health_thread = None
+
+    # endregion
+
+    @property
+    def capacity(self):
+        return len(self.members) * self.max_concurrency
+
+    def stats(self):
+        with self._cond:
+            return {
+                "capacity": self.capacity,
+                "outstanding": sum(m.outstanding for m in self.members),
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "members": [m.status() for m in self.members],
+            }
+
+    # region: 與 olca_ipc.Client 相同的查詢介面（給 model_cache 使用）
+
+    def get(self, model_type, uid=None, name=None):
+        return self.run(lambda c: c.get(model_type, uid=uid, name=name))
+
+    def get_parameters(self, model_type, uid):
+        return self.run(lambda c: c.get_parameters(model_type, uid))
+
+    def find(self, model_type, name):
+        return self.run(lambda c: c.find(model_type, name))
+
+    def get_descriptors(self, model_type):
+        return self.run(lambda c: c.get_descriptors(model_type))
+
+    # endregion
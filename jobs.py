@@ -0,0 +1,270 @@
+"""jobs.py
+
+簡介：
+- 長時間計算的非同步工作 (job) 子系統：送出後立即取得 job id，之後查詢狀態/進度或以 SSE 接收結果，
+  不必讓 Flask worker 卡在 wait_until_ready() 裡。
+- JobManager 以有上限的 ThreadPoolExecutor 執行工作；等待中的工作數超過上限時拒絕新工作。
+- run_calculation() 負責 openLCA 計算的完整生命週期（calculate → 等待 → get_total_impacts → dispose），
+  無論成功、失敗或取消，dispose() 一定會執行。
+- 尚未 dispose 的結果會記錄下來：關閉服務時 begin_shutdown() 讓輪詢中的計算提早中止，
+  dispose_outstanding() 再釋放仍卡在 openLCA 呼叫中的結果，避免 openLCA 端累積未釋放的結果。
+
+可客製化項目：
+- max_workers：同時執行的工作數
+- max_pending：等待 + 執行中的工作數上限
+- retention：完成的工作保留多久（秒）後清除
+- max_events：每個工作保留的事件數上限（超過時捨棄最舊的事件，落後太多的 SSE 連線會跳過被捨棄的事件）
+"""
+
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+CANCELLED = "cancelled"
+FINISHED = (DONE, ERROR, CANCELLED)
+
+# 尚未 dispose 的計算結果：id(result) → result
+_outstanding = {}
+_outstanding_lock = threading.Lock()
+_shutting_down = threading.Event()
+
+
+class JobCancelled(Exception):
+    """工作已被取消。"""
+
+
+class JobQueueFull(RuntimeError):
+    """等待中的工作數已達上限。"""
+
+
+def run_calculation(client, setup, cancelled=None, poll_interval=0.5):
+    """執行一次 openLCA 計算並回傳 list[o.ImpactValue]。
+
+    - 以 get_state() 輪詢取代 wait_until_ready()，每次輪詢之間檢查 cancelled()
+    - 無論成功、失敗或取消都會呼叫 dispose() 釋放 openLCA 端的結果
+    - 各步驟的耗時記錄在 metrics 的 calculate / wait_until_ready / get_total_impacts / dispose 階段
+    """
+    if _shutting_down.is_set():
+        raise JobCancelled("服務正在關閉")
+    with stage("calculate"):
+        result = client.calculate(setup)
+    with _outstanding_lock:
+        _outstanding[id(result)] = result
+    try:
+        with stage("wait_until_ready"):
+            state = result.get_state()
+            while state.is_scheduled and not state.error:
+                if _shutting_down.is_set():
+                    raise JobCancelled("服務正在關閉")
+                if cancelled is not None and cancelled():
+                    raise JobCancelled("計算已取消")
+                time.sleep(poll_interval)
+                state = result.get_state()
+        if state.error:
+            raise RuntimeError(f"計算失敗: {state.error}")
+        with stage("get_total_impacts"):
+            return result.get_total_impacts()
+    finally:
+        with _outstanding_lock:
+            disposed = _outstanding.pop(id(result), None) is None
+        if not disposed:
+            with stage("dispose"):
+                result.dispose()
+
+
+def outstanding_count():
+    with _outstanding_lock:
+        return len(_outstanding)
+
+
+def begin_shutdown():
+    """之後送出的計算直接取消，輪詢中的計算在下次輪詢時中止並 dispose。"""
+    _shutting_down.set()
+
+
+def dispose_outstanding():
+    """dispose 所有尚未釋放的結果（關閉服務的最後一步），回傳釋放的數量。"""
+    with _outstanding_lock:
+        results = list(_outstanding.values())
+        _outstanding.clear()
+    for result in results:
+        try:
+            result.dispose()
+        except Exception as e:
+            logger.warning("dispose on shutdown failed: %s", e)
+    return len(results)
+
+
+class Job:
+    """單一工作的狀態、進度與事件紀錄（供 SSE 依序推送）。
+
+    事件以遞增的序號定位（wait_events 的 start）；只保留最近 max_events 筆，dropped 為已捨棄的筆數。
+    """
+
+    def __init__(self, total=1, max_events=1000):
+        self.id = str(uuid.uuid4())
+        self.status = PENDING
+        self.total = total
+        self.completed = 0
+        self.message = None
+        self.results = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = deque(maxlen=max_events)
+        self.dropped = 0
+        self.future = None
+        self._cancel = threading.Event()
+        self._cond = threading.Condition()
+
+    @property
+    def progress(self):
+        return round(self.completed / self.total, 4) if self.total else 1.0
+
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            self._finish(CANCELLED, error="計算已取消")
+
+    def emit(self, event, data):
+        """新增一筆事件並喚醒等待中的 SSE 連線。"""
+        with self._cond:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append((event, data))
+            self._cond.notify_all()
+
+    def add_result(self, result):
+        """記錄一筆完成的結果（多筆工作會逐筆推送）。"""
+        with self._cond:
+            self.results.append(result)
+            self.completed += 1
+        self.emit("result", {"index": self.completed - 1, "progress": self.progress, **result})
+
+    def wait_events(self, start, timeout):
+        """回傳 (下一個序號, 序號 start 之後仍保留的事件)；沒有新事件時最多等待 timeout 秒。"""
+        with self._cond:
+            if self.dropped + len(self.events) <= start and self.status not in FINISHED:
+                self._cond.wait(timeout)
+            skip = max(0, start - self.dropped)
+            return self.dropped + len(self.events), list(itertools.islice(self.events, skip, None))
+
+    def _start(self):
+        with self._cond:
+            self.status = RUNNING
+            self.started_at = time.time()
+        self.emit("status", self.to_dict(with_results=False))
+
+    def _finish(self, status, error=None):
+        with self._cond:
+            if self.status in FINISHED:
+                return
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+        self.emit(status, self.to_dict(with_results=False))
+
+    def to_dict(self, with_results=True):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "completed": self.completed,
+            "total": self.total,
+            "message": self.message,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if with_results:
+            data["results"] = list(self.results)
+        return data
+
+
+class JobManager:
+    """以有上限的執行緒池執行工作，並保存工作狀態供查詢。"""
+
+    def __init__(self, max_workers=4, max_pending=100, retention=3600, max_events=1000):
+        self.max_pending = max_pending
+        self.retention = retention
+        self.max_events = max_events
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, total=1, **kwargs):
+        """送出工作 fn(job, *args, **kwargs)，回傳 Job；佇列已滿時丟出 JobQueueFull。"""
+        self._prune()
+        with self._lock:
+            active = sum(1 for j in self._jobs.values() if j.status not in FINISHED)
+            if active >= self.max_pending:
+                raise JobQueueFull("等待中的工作過多，請稍後再試")
+            job = Job(total=total, max_events=self.max_events)
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {"jobs": counts, "max_pending": self.max_pending}
+
+    def shutdown(self, wait=True):
+        """取消所有未完成的工作並關閉執行緒池（執行中的計算會在下次輪詢時中止並 dispose）。"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.status not in FINISHED:
+                job.cancel()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job, fn, args, kwargs):
+        if job.is_cancelled():
+            job._finish(CANCELLED, error="計算已取消")
+            return
+        job._start()
+        try:
+            fn(job, *args, **kwargs)
+        except JobCancelled as e:
+            job._finish(CANCELLED, error=str(e))
+        except Exception as e:
+            job._finish(ERROR, error=str(e))
+        else:
+            job._finish(CANCELLED if job.is_cancelled() else DONE)
+
+    def _prune(self):
+        """清除超過保留時間的已完成工作。"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [k for k, j in self._jobs.items() if j.finished_at and j.finished_at < cutoff]
+            for k in expired:
+                del self._jobs[k]
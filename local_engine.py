@@ -0,0 +1,450 @@
+"""local_engine.py
+
+簡介：
+- 直接讀取專案中的 openLCA JSON-LD 匯出（processes/、product_systems/、flows/、
+  lcia_categories/、lcia_methods/、unit_groups/ 等資料夾），在本機完成 LCA 計算。
+- 建立技術矩陣 A、環境干預矩陣 B 與特徵化矩陣 C（NumPy / SciPy sparse），
+  以 s = A⁻¹f、g = B·s、h = C·g 求解，不需要 openLCA IPC Server。
+- LocalClient 提供與 olca_ipc.Client 相同的部分介面（get / find / get_parameters / calculate），
+  因此 model_cache 與 Flask endpoint 可以不經修改地切換到本機計算。
+
+可客製化項目：
+- root：JSON-LD 匯出的根目錄（預設為本檔案所在目錄）
+- index_dir：特徵化係數 / 單位換算索引的目錄（預設為 <root>/.lca_index，見 cf_index.py）
+
+注意：
+- 只支援 processLinks 明確連結的產品流（未連結的產品輸入視為 cut-off），不處理分配 (allocation)。
+- 衝擊評估方法必須存在於匯出中（例如 "IPCC 2013 GWP 100a (incl. CO2 uptake)"）。
+"""
+
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import olca_schema as o
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+
+import cf_index
+from formula import CompiledFormulas
+
+# olca_schema 型別與 JSON-LD 資料夾的對應
+FOLDERS = {
+    o.ProductSystem: "product_systems",
+    o.Process: "processes",
+    o.Flow: "flows",
+    o.FlowProperty: "flow_properties",
+    o.UnitGroup: "unit_groups",
+    o.ImpactMethod: "lcia_methods",
+    o.ImpactCategory: "lcia_categories",
+    o.Parameter: "parameters",
+}
+
+class JsonLdStore:
+    """讀取並快取 JSON-LD 文件，依 @id 或 name 查詢。"""
+
+    def __init__(self, root):
+        self.root = root
+        self._docs = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def ids(self, folder):
+        path = os.path.join(self.root, folder)
+        if not os.path.isdir(path):
+            return []
+        return sorted(f[:-5] for f in os.listdir(path) if f.endswith(".json"))
+
+    def get(self, folder, uid):
+        key = (folder, uid)
+        doc = self._docs.get(key)
+        if doc is None:
+            path = os.path.join(self.root, folder, uid + ".json")
+            if not os.path.exists(path):
+                return None
+            with open(path, encoding="utf-8") as f:
+                doc = json.load(f)
+            with self._lock:
+                self._docs[key] = doc
+        return doc
+
+    def find(self, folder, name):
+        """依名稱尋找文件的 @id（第一次查詢時建立名稱索引）。"""
+        with self._lock:
+            names = self._names.get(folder)
+        if names is None:
+            names = {}
+            for uid in self.ids(folder):
+                doc = self.get(folder, uid)
+                names.setdefault(doc.get("name"), uid)
+            with self._lock:
+                self._names[folder] = names
+        return names.get(name)
+
+
+class LocalEngine:
+    """以 JSON-LD 匯出建立矩陣並在本機求解的 LCA 計算引擎。"""
+
+    def __init__(self, root=None, index_dir=None):
+        self.store = JsonLdStore(root or os.path.dirname(os.path.abspath(__file__)))
+        self.index_dir = index_dir
+        self._index = None
+        self._systems = {}
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        """單位 / 流屬性 / 特徵化係數的 mmap 索引（第一次使用時載入，來源變動時自動重建）。"""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = cf_index.load(self.store.root, self.index_dir)
+        return self._index
+
+    # region: 單位換算
+
+    def unit_factor(self, unit_id):
+        """單位相對於其單位組參考單位的換算係數（例如 t → 1000）。"""
+        return self.index.unit_factor(unit_id)
+
+    def to_reference(self, flow_id, unit_id, property_id):
+        """把某流在指定單位/流屬性下的 1 個單位換算成該流參考單位的量。"""
+        factor = self.unit_factor(unit_id) if unit_id else 1.0
+        conversion = self.index.property_factor(flow_id, property_id) if property_id else None
+        return factor / conversion if conversion is not None else factor
+
+    # endregion
+
+    # region: 模型編譯
+
+    def system(self, system_id):
+        """取得（並快取）ProductSystem 的矩陣結構。"""
+        with self._lock:
+            compiled = self._systems.get(system_id)
+        if compiled is None:
+            compiled = _CompiledSystem(self, system_id)
+            with self._lock:
+                self._systems[system_id] = compiled
+        return compiled
+
+    def method(self, method_id):
+        """取得（並快取）衝擊評估方法的特徵化係數表。"""
+        with self._lock:
+            compiled = self._methods.get(method_id)
+        if compiled is None:
+            compiled = _CompiledMethod(self, method_id)
+            with self._lock:
+                self._methods[method_id] = compiled
+        return compiled
+
+    def invalidate(self):
+        """清除所有已載入的文件與編譯結果（匯出內容變更時使用）。"""
+        with self._lock:
+            self.store = JsonLdStore(self.store.root)
+            self._index = None
+            self._systems.clear()
+            self._methods.clear()
+
+    # endregion
+
+    def calculate(self, setup):
+        """求解 CalculationSetup，回傳 list[o.ImpactValue]。"""
+        system, method = self._resolve(setup)
+        demand = system.demand(setup.amount, setup.unit)
+        totals = system.inventory(setup.parameters or [], demand)
+        impacts = method.characterize(system.envi_ids, totals)
+        return [
+            o.ImpactValue(impact_category=ref, amount=float(value))
+            for ref, value in zip(method.category_refs, impacts)
+        ]
+
+
+    def calculate_batch(self, setup):
+        """一次求解多組輸入，回傳 (衝擊類別 Ref 列表, 結果矩陣 n × 類別數)。
+
+        setup.amount 與 setup.parameters 中各 ParameterRedef 的 value 可以是長度 n 的陣列，
+        其餘欄位與 calculate() 相同。
+        """
+        amounts = np.atleast_1d(np.asarray(setup.amount, dtype=float))
+        system, method = self._resolve(setup)
+        demands = system.demand(amounts, setup.unit)
+        totals = system.inventory_batch(setup.parameters or [], demands)
+        impacts = method.characterize(system.envi_ids, totals)
+        return list(method.category_refs), np.asarray(impacts).T
+
+    def _resolve(self, setup):
+        target = setup.target
+        system_id = target.id if target.id else self.store.find("product_systems", target.name)
+        if not system_id or self.store.get("product_systems", system_id) is None:
+            raise ValueError(f"找不到產品系統: {target.name or target.id}")
+        method_ref = setup.impact_method
+        if method_ref is None:
+            raise ValueError("CalculationSetup 缺少 impact_method")
+        method_id = self.index.method_id(method_ref.id, method_ref.name)
+        if not method_id:
+            raise ValueError(f"找不到衝擊評估方法: {method_ref.name or method_ref.id}")
+        return self.system(system_id), self.method(method_id)
+
+
+class _CompiledSystem:
+    """ProductSystem 的靜態結構：矩陣索引、交換量公式與參數定義。"""
+
+    def __init__(self, engine, system_id):
+        self.engine = engine
+        doc = engine.store.get("product_systems", system_id)
+        self.id = system_id
+        self.doc = doc
+        process_ids = [p["@id"] for p in doc.get("processes", [])]
+        ref_process = doc["refProcess"]["@id"]
+        if ref_process not in process_ids:
+            process_ids.insert(0, ref_process)
+        self.process_ids = process_ids
+        self.ref_col = process_ids.index(ref_process)
+        self.processes = {uid: engine.store.get("processes", uid) for uid in process_ids}
+
+        # 技術流：每個 process 的定量參考交換
+        self.tech_index = {}
+        for col, uid in enumerate(process_ids):
+            ref = _reference_exchange(self.processes[uid])
+            self.tech_index[(uid, ref["flow"]["@id"])] = col
+
+        # processLinks：被連結的輸入交換 → 提供者的列
+        links = {}
+        for link in doc.get("processLinks", []):
+            key = (link["process"]["@id"], link["exchange"]["internalId"])
+            links[key] = self.tech_index.get((link["provider"]["@id"], link["flow"]["@id"]))
+
+        # 交換量：(矩陣, 列, 欄, 符號×單位換算, 數值, 公式, process)
+        self.entries = []
+        envi_index = {}
+        for col, uid in enumerate(process_ids):
+            process = self.processes[uid]
+            for ex in process.get("exchanges", []):
+                flow = ex["flow"]
+                sign = 1.0 if not ex.get("isInput") else -1.0
+                if ex.get("isAvoidedProduct"):
+                    sign = -sign
+                factor = sign * engine.to_reference(
+                    flow["@id"], (ex.get("unit") or {}).get("@id"),
+                    (ex.get("flowProperty") or {}).get("@id"))
+                if flow.get("flowType") == "ELEMENTARY_FLOW":
+                    row = envi_index.setdefault(flow["@id"], len(envi_index))
+                    matrix = "B"
+                elif ex.get("isQuantitativeReference"):
+                    row, matrix = col, "A"
+                elif (uid, ex.get("internalId")) in links and links[(uid, ex.get("internalId"))] is not None:
+                    row, matrix = links[(uid, ex.get("internalId"))], "A"
+                else:
+                    continue
+                formula = (ex.get("amountFormula") or "").strip() or None
+                self.entries.append((matrix, row, col, factor, ex.get("amount", 0.0), formula, uid))
+        self.envi_ids = list(envi_index)
+        self.a_rows = np.array([e[1] for e in self.entries if e[0] == "A"], dtype=int)
+        self.a_cols = np.array([e[2] for e in self.entries if e[0] == "A"], dtype=int)
+        self.b_rows = np.array([e[1] for e in self.entries if e[0] == "B"], dtype=int)
+        self.b_cols = np.array([e[2] for e in self.entries if e[0] == "B"], dtype=int)
+        # B 的每個非零項加總到對應干預流的彙總矩陣（干預流 × 非零項）
+        self.b_aggregate = sparse.csr_matrix(
+            (np.ones(len(self.b_rows)), (self.b_rows, np.arange(len(self.b_rows)))),
+            shape=(len(self.envi_ids), len(self.b_rows)))
+
+        # 參數：全域參數與各 process 的參數
+        self.global_parameters = [
+            engine.store.get("parameters", pid) for pid in engine.store.ids("parameters")
+        ]
+        self.ref_exchange = _reference_exchange(self.processes[ref_process])
+
+        # 交換量公式與參數相依關係只編譯一次，之後每次計算直接代入數值
+        self.formulas = CompiledFormulas(
+            self.global_parameters,
+            {uid: process.get("parameters", []) for uid, process in self.processes.items()},
+            [(e[6], e[5], e[4]) for e in self.entries])
+        self.factors = np.array([e[3] for e in self.entries], dtype=float)
+        self.a_mask = np.array([e[0] == "A" for e in self.entries], dtype=bool)
+
+    def demand(self, amount, unit):
+        """把 setup 的 amount / unit 換算為參考流的參考單位量。"""
+        if amount is None:
+            amount = self.doc.get("targetAmount", 1.0)
+        unit_id = unit.id if unit is not None else (self.doc.get("targetUnit") or {}).get("@id")
+        if unit is not None and not unit_id and unit.name:
+            group = self.engine.store.get("unit_groups", _unit_group_of(self.engine, self.ref_exchange))
+            unit_id = next((u["@id"] for u in (group or {}).get("units", []) if u["name"] == unit.name), None)
+        prop = (self.doc.get("targetFlowProperty") or {}).get("@id")
+        return amount * self.engine.to_reference(self.ref_exchange["flow"]["@id"], unit_id, prop)
+
+    def entry_values(self, redefs, n):
+        """計算所有交換量（已代入參數），回傳 A 與 B 的數值陣列（形狀為 非零項 × n）。
+
+        參數重新定義的值可以是長度 n 的 NumPy 陣列，編譯後的公式會對整批資料一次計算。
+        """
+        redefined = {}
+        for r in redefs:
+            if r.value is not None:
+                redefined[(r.context.id if r.context is not None else None, r.name)] = r.value
+        values = self.formulas.evaluate(redefined, n) * self.factors[:, None]
+        return values[self.a_mask], values[~self.a_mask]
+
+    def inventory(self, redefs, demand):
+        """求解 s = A⁻¹f 並回傳總干預量 g = B·s。"""
+        return self.inventory_batch(redefs, np.array([demand], dtype=float))[:, 0]
+
+    def inventory_batch(self, redefs, demands):
+        """對 n 組參數/需求量求解，回傳干預量矩陣 g（干預流 × n）。
+
+        若技術矩陣 A 與重新定義的參數無關（常見情況），只需求解一次 A⁻¹f，
+        其餘只是 B 的向量化乘加；否則逐列求解。
+        """
+        demands = np.asarray(demands, dtype=float)
+        n = demands.shape[0]
+        a, b = self.entry_values(redefs, n)
+        size = len(self.process_ids)
+        f = np.zeros(size)
+        f[self.ref_col] = 1.0
+        if n == 0:
+            return np.zeros((len(self.envi_ids), 0))
+        if np.all(a == a[:, :1]):
+            tech = sparse.csc_matrix((a[:, 0], (self.a_rows, self.a_cols)), shape=(size, size))
+            scaling = np.atleast_1d(spsolve(tech, f))
+            contributions = b * scaling[self.b_cols][:, None] * demands[None, :]
+            return self.b_aggregate @ contributions
+        totals = np.zeros((len(self.envi_ids), n))
+        for r in range(n):
+            tech = sparse.csc_matrix((a[:, r], (self.a_rows, self.a_cols)), shape=(size, size))
+            scaling = np.atleast_1d(spsolve(tech, f)) * demands[r]
+            envi = sparse.csr_matrix((b[:, r], (self.b_rows, self.b_cols)),
+                                     shape=(len(self.envi_ids), size))
+            totals[:, r] = envi @ scaling
+        return totals
+
+
+class _CompiledMethod:
+    """衝擊評估方法：各衝擊類別的特徵化係數（取自 cf_index，已換算為流的參考單位）。"""
+
+    def __init__(self, engine, method_id):
+        self.index = engine.index
+        refs = self.index.method_categories(method_id)
+        self.category_ids = [ref["@id"] for ref in refs]
+        self.category_refs = [
+            o.Ref(ref_type=o.RefType.ImpactCategory, id=ref["@id"], name=ref.get("name"),
+                  category=ref.get("category"), ref_unit=ref.get("refUnit"))
+            for ref in refs
+        ]
+        self._matrices = {}
+
+    def matrix(self, envi_ids):
+        """對應某個干預流順序的特徵化矩陣 C（類別 × 流）。"""
+        key = tuple(envi_ids)
+        cached = self._matrices.get(key)
+        if cached is None:
+            cached = self.index.matrix(self.category_ids, envi_ids)
+            self._matrices[key] = cached
+        return cached
+
+    def characterize(self, envi_ids, totals):
+        """h = C·g；totals 可為單一向量或（干預流 × n）矩陣。"""
+        return self.matrix(envi_ids) @ totals
+
+
+class LocalResult:
+    """與 olca_ipc 的 Result 相同用法的本機計算結果（計算在 calculate() 時已完成）。"""
+
+    def __init__(self, impacts=None, error=None):
+        self.uid = str(uuid.uuid4())
+        self._impacts = impacts or []
+        self.error = error
+
+    def get_state(self):
+        return o.ResultState(id=self.uid, error=self.error, is_ready=self.error is None,
+                             is_scheduled=False)
+
+    def wait_until_ready(self):
+        return self.get_state()
+
+    def get_total_impacts(self):
+        return list(self._impacts)
+
+    def dispose(self):
+        self._impacts = []
+
+
+class LocalClient:
+    """以 LocalEngine 實作 olca_ipc.Client 常用介面的替代 client。"""
+
+    def __init__(self, root=None, engine=None):
+        self.engine = engine or LocalEngine(root)
+
+    @property
+    def store(self):
+        return self.engine.store
+
+    def get(self, model_type, uid=None, name=None):
+        folder = FOLDERS.get(model_type)
+        if folder is None:
+            return None
+        if uid is None and name is not None:
+            uid = self.store.find(folder, name)
+        doc = self.store.get(folder, uid) if uid else None
+        return model_type.from_dict(doc) if doc else None
+
+    def get_descriptors(self, model_type):
+        folder = FOLDERS.get(model_type)
+        if folder is None:
+            return []
+        return [_descriptor(model_type, self.store.get(folder, uid)) for uid in self.store.ids(folder)]
+
+    def get_descriptor(self, model_type, uid=None, name=None):
+        folder = FOLDERS.get(model_type)
+        if folder is None:
+            return None
+        if uid is None and name is not None:
+            uid = self.store.find(folder, name)
+        doc = self.store.get(folder, uid) if uid else None
+        return _descriptor(model_type, doc) if doc else None
+
+    def find(self, model_type, name):
+        return self.get_descriptor(model_type, name=name)
+
+    def get_parameters(self, model_type, uid):
+        """回傳 ProductSystem 可重新定義的輸入參數（依名稱排序，不分大小寫，與 openLCA 相同）。"""
+        if model_type is not o.ProductSystem:
+            entity = self.get(model_type, uid)
+            return list(getattr(entity, "parameters", None) or [])
+        system = self.engine.system(uid)
+        redefs = []
+        for param in system.global_parameters:
+            if param.get("isInputParameter"):
+                redefs.append(o.ParameterRedef(name=param["name"], value=param.get("value")))
+        for pid, process in system.processes.items():
+            context = o.Ref(ref_type=o.RefType.Process, id=pid, name=process.get("name"))
+            for param in process.get("parameters", []):
+                if param.get("isInputParameter"):
+                    redefs.append(o.ParameterRedef(
+                        name=param["name"], value=param.get("value"), context=context))
+        return sorted(redefs, key=lambda r: r.name.lower())
+
+    def calculate(self, setup):
+        try:
+            return LocalResult(impacts=self.engine.calculate(setup))
+        except Exception as e:
+            return LocalResult(error=str(e))
+
+
+def _descriptor(model_type, doc):
+    return o.Ref(ref_type=o.RefType[model_type.__name__], id=doc["@id"], name=doc.get("name"),
+                 category=doc.get("category"), ref_unit=doc.get("refUnit"))
+
+
+def _reference_exchange(process):
+    for ex in process.get("exchanges", []):
+        if ex.get("isQuantitativeReference"):
+            return ex
+    raise ValueError(f"process 沒有定量參考交換: {process.get('name')}")
+
+
+def _unit_group_of(engine, exchange):
+    prop = engine.store.get("flow_properties", (exchange.get("flowProperty") or {}).get("@id", ""))
+    return (prop or {}).get("unitGroup", {}).get("@id", "")
@@ -0,0 +1,225 @@
+"""metrics.py
+
+簡介：
+- 輕量的指標收集（不依賴 prometheus_client）：Counter、Histogram 與以函式取值的 Gauge，
+  render() 輸出 Prometheus text 格式，供 /metrics 使用。
+- stage(name)：量測計算路徑中每個階段的耗時（模型查詢、get_parameters、單位解析、calculate、
+  等待計算完成、get_total_impacts、dispose、Supabase 寫入…），寫入 lca_stage_duration_seconds 直方圖。
+- 在請求範圍內（begin_request() 之後）各階段的耗時也會記錄下來，可輸出成 Server-Timing 標頭，
+  或在請求過慢時由 SlowRequestLog 抽樣寫入 log。
+- 每個請求的階段紀錄存在 contextvars 中，不同執行緒 / 請求互不干擾；背景執行緒只會寫入直方圖。
+
+可客製化項目：
+- DEFAULT_BUCKETS：直方圖的區間上限（秒）
+"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """以函式取值的 gauge；fn() 回傳數值，或 {label 值 tuple: 數值}。"""
+
+    def __init__(self, name, documentation, fn, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.debug("gauge %s failed: %s", self.name, e)
+            return lines
+        values = value if isinstance(value, dict) else {(): value}
+        for key, v in values.items():
+            if v is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics = [m for m in self._metrics if m.name != metric.name] + [metric]
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, fn, labelnames=()):
+        return self.register(Gauge(name, documentation, fn, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "lca_stage_duration_seconds", "Duration of each step of the calculation path.", ("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "lca_stage_errors_total", "Steps of the calculation path that raised an exception.", ("stage",))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "lca_http_request_duration_seconds", "HTTP request duration.", ("endpoint", "method", "status"))
+
+
+# region: 階段計時
+
+@contextmanager
+def stage(name):
+    """量測一個階段的耗時（寫入直方圖，並記錄到目前請求的 Server-Timing）。"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+
+def begin_request():
+    """開始記錄目前請求的各階段耗時，回傳 token（交給 end_request）。"""
+    return _request_stages.set([])
+
+
+def end_request(token=None):
+    """結束記錄並回傳 [(階段, 秒)]。"""
+    stages = _request_stages.get() or []
+    try:
+        _request_stages.reset(token)
+    except (TypeError, ValueError):
+        # token 不存在或屬於其他 context（例如在不同執行緒結束請求）
+        _request_stages.set(None)
+    return stages
+
+
+def server_timing(stages, total=None):
+    """把 [(階段, 秒)] 轉成 Server-Timing 標頭（同名階段加總，單位為毫秒）。"""
+    merged = {}
+    for name, seconds in stages:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in merged.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+# endregion
+
+
+class SlowRequestLog:
+    """超過門檻的請求依抽樣比例寫入 log（含各階段耗時）。"""
+
+    def __init__(self, threshold=1.0, sample_rate=0.1, log=None):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.log = log or logging.getLogger("slow_requests")
+
+    def record(self, method, path, status, seconds, stages):
+        if self.threshold is None or seconds < self.threshold:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        self.log.warning("slow request %s %s -> %s in %.3fs [%s]",
+                         method, path, status, seconds, server_timing(stages) or "no stages")
+        return True
@@ -0,0 +1,183 @@
+"""model_cache.py
+
+簡介：
+- 快取 openLCA 模型的中繼資料（ProductSystem、參數列表、單位、衝擊評估方法），
+  讓每個請求不必再重複四、五次 IPC 查詢。
+- 每個模型只解析一次，並保存為 CalculationSetup 樣板；之後的請求只需要填入 amount 與參數值。
+- 提供明確的失效 (invalidate) 與依 ProductSystem 的 version / lastChange 欄位做過期檢查。
+- 過期檢查與重新解析會呼叫 openLCA，只持有該模型自己的鎖：其他模型的請求不會被卡住；
+  同一個模型同時只有一個執行緒在檢查，其他執行緒等它完成後直接使用結果。
+
+可客製化項目：
+- method_name：衝擊評估方法名稱（預設 "IPCC 2021 AR6"）
+- unit_group / unit_name：計算所用的單位（預設 "Units of mass" 中的 "t"）
+- revalidate_after：每隔多少秒比對一次 version/lastChange（0 表示每次都比對，None 表示不比對）
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+
+import olca_schema as o
+
+from metrics import stage
+
+
+@dataclass
+class ModelMetadata:
+    """單一模型解析後的中繼資料與 CalculationSetup 樣板。"""
+
+    name: str
+    model: o.ProductSystem
+    parameters: list
+    unit: o.Unit | None
+    method: o.ImpactMethod
+    version: str | None = None
+    last_change: str | None = None
+    checked_at: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        # 只保留參照 (Ref)，避免每次計算都把整個 ProductSystem 序列化送給 openLCA
+        self._target = o.as_ref(self.model)
+        self._method = o.as_ref(self.method)
+
+    def build_setup(self, amount, values, parameters=None):
+        """依樣板建立 CalculationSetup。
+
+        values 依 parameters 的順序排列，第 i 個值會重新定義第 i 個參數；
+        parameters 省略時為模型的全部參數（model_registry 會傳入依名稱綁定後的參數子集）。
+        """
+        parameters = self.parameters if parameters is None else parameters
+        redefs = [
+            o.ParameterRedef(name=p.name, value=v, context=p.context)
+            for p, v in zip(parameters, values)
+        ]
+        return o.CalculationSetup(
+            target=self._target,
+            amount=amount,
+            unit=self.unit,
+            impact_method=self._method,
+            parameters=redefs,
+        )
+
+
+class ModelMetadataCache:
+    """以模型名稱為鍵的中繼資料快取。
+
+    client 只需提供 get / get_parameters / find（與 olca_ipc.Client 相同的介面）。
+    """
+
+    def __init__(self, client, method_name="IPCC 2021 AR6",
+                 unit_group="Units of mass", unit_name="t", revalidate_after=300):
+        self.client = client
+        self.method_name = method_name
+        self.unit_group = unit_group
+        self.unit_name = unit_name
+        self.revalidate_after = revalidate_after
+        self._models = {}
+        self._method = None
+        self._unit = None
+        # _lock 只保護字典本身（不在持有時呼叫 openLCA）；
+        # _key_locks 讓同一個模型的檢查 / 解析只做一次；_setup_lock 保護方法與單位的查詢
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self._setup_lock = threading.Lock()
+        # invalidate() 時遞增：解析期間若被清除，解析結果不寫回快取
+        self._generation = 0
+
+    @property
+    def method(self):
+        """衝擊評估方法（第一次使用時才向 openLCA 查詢）。"""
+        with self._setup_lock:
+            if self._method is None:
+                with stage("method_lookup"):
+                    method = self.client.get(o.ImpactMethod, name=self.method_name)
+                if method is None:
+                    raise ValueError(f"找不到衝擊評估方法: {self.method_name}")
+                self._method = method
+            return self._method
+
+    @property
+    def unit(self):
+        """計算所用的單位（例如 t），找不到時為 None，由 openLCA 使用參考單位。"""
+        with self._setup_lock:
+            if self._unit is None:
+                with stage("unit_group"):
+                    descriptor = self.client.find(o.UnitGroup, self.unit_group)
+                    group = self.client.get(o.UnitGroup, descriptor.id) if descriptor else None
+                units = group.units if group and group.units else []
+                self._unit = next((u for u in units if u.name == self.unit_name), None)
+            return self._unit
+
+    def get(self, name):
+        """取得模型的中繼資料；尚未解析或已過期時才會呼叫 openLCA。"""
+        with self._lock:
+            meta = self._models.get(name)
+            if meta is not None and not self._needs_check(meta):
+                return meta
+            key_lock = self._key_locks.setdefault(name, threading.Lock())
+        with key_lock:
+            # 等待期間其他執行緒可能已經檢查 / 解析完成
+            with self._lock:
+                meta = self._models.get(name)
+                generation = self._generation
+            if meta is not None and not self._needs_check(meta):
+                return meta
+            if meta is not None and not self._is_stale(meta):
+                meta.checked_at = time.monotonic()
+                return meta
+            fresh = self._resolve(name)
+            with self._lock:
+                # compare-and-swap：期間被 invalidate() 或替換時不覆蓋
+                if self._generation == generation and self._models.get(name) is meta:
+                    self._models[name] = fresh
+            return fresh
+
+    def invalidate(self, name=None):
+        """清除快取；name 為 None 時清除全部（包含方法與單位）。"""
+        with self._setup_lock, self._lock:
+            self._generation += 1
+            if name is None:
+                self._models.clear()
+                self._method = None
+                self._unit = None
+            else:
+                self._models.pop(name, None)
+
+    def models(self):
+        """目前已快取的模型名稱與版本資訊。"""
+        with self._lock:
+            return [
+                {"name": m.name, "id": m.model.id, "version": m.version, "lastChange": m.last_change}
+                for m in self._models.values()
+            ]
+
+    def _needs_check(self, meta):
+        if self.revalidate_after is None:
+            return False
+        return time.monotonic() - meta.checked_at >= self.revalidate_after
+
+    def _is_stale(self, meta):
+        """比對 openLCA 端目前的 version / lastChange 是否與快取相同。"""
+        with stage("model_revalidate"):
+            current = self.client.get(o.ProductSystem, meta.model.id)
+        if current is None:
+            return True
+        return (current.version, current.last_change) != (meta.version, meta.last_change)
+
+    def _resolve(self, name):
+        with stage("model_lookup"):
+            model = self.client.get(o.ProductSystem, name=name)
+        if model is None:
+            raise ValueError(f"找不到模型: {name}")
+        with stage("get_parameters"):
+            parameters = self.client.get_parameters(o.ProductSystem, model.id)
+        return ModelMetadata(
+            name=name,
+            model=model,
+            parameters=parameters,
+            unit=self.unit,
+            method=self.method,
+            version=model.version,
+            last_change=model.last_change,
+        )
@@ -0,0 +1,291 @@
+"""model_registry.py
+
+簡介：
+- 以宣告式的 ModelSpec 描述每個計算 endpoint：endpoint 名稱（route）、openLCA 產品系統名稱，
+  以及請求欄位對應到哪一個 openLCA 參數（名稱，必要時加上所屬 process 的 context）。
+- 每個模型第一次使用時「編譯」一次綁定計畫 (CompiledModel)：依名稱在模型的參數列表中找到對應的參數並固定下來，
+  之後每個請求只需依欄位順序填入數值；模型版本變更（model_cache 重新解析）時才重新編譯。
+  參數順序改變不會讓數值套到錯誤的參數上；找不到或有歧義的參數會直接丟出 BindingError（endpoint 回 503），
+  不會退回依位置綁定。
+- 參數名稱尚未確認的模型可以明確宣告 ModelSpec(binding="position")：依 openLCA 回傳的參數順序綁定，
+  第一次編譯時把位置固定成參數名稱並記錄警告，之後模型重新解析時仍依名稱綁定。
+- discover()：從 openLCA（IPC）或本機匯出的 product_systems/ 找出尚未宣告的產品系統，
+  以產品系統名稱作為 route、輸入參數名稱作為欄位自動註冊。只在暖機與 /cache/invalidate 時執行（同時只有一個），
+  請求不會觸發探索。
+- ModelRegistry 是唯讀的 Mapping（route → ModelSpec），查詢欄位不需要額外的 IPC 呼叫；未知的 route 直接 KeyError。
+
+可客製化項目：
+- ModelSpec / Param：在 my_flask1.MODEL_SPECS 中宣告 endpoint 與欄位對應
+- discover：是否自動註冊未宣告的產品系統（my_flask1 的 MODEL_DISCOVERY）
+"""
+
+import logging
+import math
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+
+import olca_schema as o
+
+logger = logging.getLogger(__name__)
+
+
+class BindingError(ValueError):
+    """請求欄位無法對應到模型的參數（參數不存在、有歧義或重複綁定）。"""
+
+
+@dataclass(frozen=True)
+class Param:
+    """一個請求欄位與 openLCA 參數（名稱不分大小寫；context 為所屬 process 的名稱或 @id）的對應。
+
+    parameter 只有在 ModelSpec(binding="position") 中可以省略。
+    """
+
+    name: str
+    parameter: str | None = None
+    context: str | None = None
+    description: str = ""
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """一個計算 endpoint 的宣告。"""
+
+    route: str
+    model: str
+    params: tuple
+    discovered: bool = False
+    binding: str = "name"
+    fields: tuple = field(init=False)
+    required: tuple = field(init=False)
+
+    def __post_init__(self):
+        names = tuple(p.name for p in self.params)
+        if len(set(names)) != len(names):
+            raise ValueError(f"{self.route}: 欄位名稱重複")
+        unnamed = [p.name for p in self.params if not p.parameter]
+        if self.binding == "name" and unnamed:
+            raise ValueError(f"{self.route}: 欄位沒有指定 openLCA 參數名稱: {', '.join(unnamed)}")
+        if self.binding == "position" and len(unnamed) != len(self.params):
+            raise ValueError(f"{self.route}: 依位置綁定的欄位不能指定參數名稱")
+        if self.binding not in ("name", "position"):
+            raise ValueError(f"{self.route}: 未知的綁定方式 {self.binding}")
+        object.__setattr__(self, "fields", names)
+        object.__setattr__(self, "required", names + ("amount",))
+
+    def validate(self, data):
+        """檢查請求內容並轉為 {欄位: float}（包含 amount）；缺少或不是有限數值時丟出 ValueError。"""
+        if not isinstance(data, dict):
+            raise ValueError("請求內容必須是 JSON 物件")
+        missing = [f for f in self.required if data.get(f) is None]
+        if missing:
+            raise ValueError(f"缺少參數: {', '.join(missing)}")
+        values = {}
+        invalid = []
+        for f in self.required:
+            value = data[f]
+            try:
+                if isinstance(value, bool):
+                    raise TypeError
+                value = float(value)
+            except (TypeError, ValueError):
+                invalid.append(f)
+                continue
+            if not math.isfinite(value):
+                invalid.append(f)
+                continue
+            values[f] = value
+        if invalid:
+            raise ValueError(f"參數不是數值: {', '.join(invalid)}")
+        return values
+
+    def schema(self):
+        return {
+            "route": self.route,
+            "model": self.model,
+            "discovered": self.discovered,
+            "binding": self.binding,
+            "fields": [
+                {"name": p.name, "parameter": p.parameter, "context": p.context, "description": p.description}
+                for p in self.params
+            ],
+            "required": list(self.required),
+        }
+
+
+@dataclass(frozen=True)
+class CompiledModel:
+    """已綁定到模型參數的計算計畫；parameters 與 spec.fields 順序相同。"""
+
+    spec: ModelSpec
+    meta: object
+    parameters: tuple
+
+    @property
+    def version(self):
+        return (self.meta.version, self.meta.last_change)
+
+    def build_setup(self, amount, values):
+        """values 依 spec.fields 的順序排列（可以是純量或 NumPy 陣列）。"""
+        return self.meta.build_setup(amount, values, parameters=self.parameters)
+
+    def setup(self, inputs):
+        """由 {欄位: 數值} 建立 CalculationSetup。"""
+        return self.build_setup(inputs["amount"], [inputs[f] for f in self.spec.fields])
+
+    def bindings(self):
+        return {f: _describe(p) for f, p in zip(self.spec.fields, self.parameters)}
+
+
+def _context_name(parameter):
+    context = parameter.context
+    return context.name if context is not None else None
+
+
+def _context_id(parameter):
+    context = parameter.context
+    return context.id if context is not None else None
+
+
+def _matches(parameter, target):
+    """參數名稱不分大小寫（與 openLCA 相同）；target.context 可以是 process 的名稱或 @id。"""
+    if parameter.name.lower() != target.parameter.lower():
+        return False
+    return target.context is None or target.context in (_context_name(parameter), _context_id(parameter))
+
+
+def _describe(parameter):
+    context = _context_name(parameter)
+    return f"{context}/{parameter.name}" if context else parameter.name
+
+
+class ModelRegistry(Mapping):
+    """route → ModelSpec 的註冊表，並快取各模型編譯後的綁定計畫。"""
+
+    def __init__(self, model_cache, specs=(), discover=True):
+        self.model_cache = model_cache
+        self.discover_enabled = discover
+        self._specs = {}
+        self._compiled = {}
+        # 依位置綁定的 route → 第一次編譯時固定下來的 Param（含參數名稱）
+        self._pinned = {}
+        self._lock = threading.Lock()
+        self._discover_lock = threading.Lock()
+        for spec in specs:
+            self.register(spec)
+
+    def register(self, spec):
+        with self._lock:
+            if spec.route in self._specs:
+                raise ValueError(f"route 重複: {spec.route}")
+            self._specs[spec.route] = spec
+
+    # region: Mapping
+
+    def __getitem__(self, route):
+        return self._specs[route]
+
+    def __iter__(self):
+        return iter(list(self._specs))
+
+    def __len__(self):
+        return len(self._specs)
+
+    # endregion
+
+    def compile(self, route):
+        """取得 route 的綁定計畫；只有第一次或模型重新解析（版本變更）後才重新綁定。"""
+        spec = self[route]
+        meta = self.model_cache.get(spec.model)
+        compiled = self._compiled.get(route)
+        if compiled is not None and compiled.meta is meta:
+            return compiled
+        with self._lock:
+            compiled = self._compiled.get(route)
+            if compiled is None or compiled.meta is not meta:
+                compiled = CompiledModel(spec, meta, self._bind(spec, meta))
+                self._compiled[route] = compiled
+                logger.info("model %s compiled: %s", route, compiled.bindings())
+        return compiled
+
+    def _bind(self, spec, meta):
+        parameters = list(meta.parameters)
+        targets = spec.params
+        if spec.binding == "position":
+            targets = self._pinned.get(spec.route)
+            if targets is None:
+                if len(parameters) < len(spec.params):
+                    raise BindingError(
+                        f"{spec.route}: 模型 {spec.model} 只有 {len(parameters)} 個參數，少於 {len(spec.params)} 個欄位")
+                targets = tuple(Param(f, p.name, _context_id(p)) for f, p in zip(spec.fields, parameters))
+                self._pinned[spec.route] = targets
+                logger.warning("model %s binds fields by position: %s; declare parameter names (MODEL_PARAMETERS)",
+                               spec.route, {f: _describe(p) for f, p in zip(spec.fields, parameters)})
+        bound = []
+        for target in targets:
+            matches = [p for p in parameters if _matches(p, target)]
+            if not matches:
+                raise BindingError(f"{spec.route}: 模型 {spec.model} 沒有參數 {target.parameter}（欄位 {target.name}）")
+            if len(matches) > 1:
+                raise BindingError(
+                    f"{spec.route}: 參數 {target.parameter} 有多個 context（{', '.join(_describe(p) for p in matches)}），"
+                    f"請在欄位 {target.name} 指定 context")
+            if any(p is matches[0] for p in bound):
+                raise BindingError(f"{spec.route}: 參數 {target.parameter} 被多個欄位綁定")
+            bound.append(matches[0])
+        return tuple(bound)
+
+    def discover(self):
+        """把尚未宣告的產品系統註冊為 route = 產品系統名稱、欄位 = 輸入參數名稱，回傳新增的 route。"""
+        with self._discover_lock:
+            return self._discover()
+
+    def _discover(self):
+        declared = {spec.model for spec in self._specs.values()}
+        added = []
+        for descriptor in self.model_cache.client.get_descriptors(o.ProductSystem):
+            name = descriptor.name
+            if not name or name in declared or name in self._specs:
+                continue
+            try:
+                meta = self.model_cache.get(name)
+            except ValueError as e:
+                logger.warning("model discovery: %s", e)
+                continue
+            counts = {}
+            for p in meta.parameters:
+                counts[p.name.lower()] = counts.get(p.name.lower(), 0) + 1
+            params = tuple(
+                Param(p.name if counts[p.name.lower()] == 1 else _describe(p), p.name,
+                      _context_name(p) if counts[p.name.lower()] > 1 else None)
+                for p in meta.parameters
+            )
+            try:
+                self.register(ModelSpec(name, name, params, discovered=True))
+            except ValueError as e:
+                logger.warning("model discovery: %s", e)
+                continue
+            added.append(name)
+        if added:
+            logger.info("discovered models: %s", ", ".join(added))
+        return added
+
+    def invalidate(self, route=None):
+        """丟棄編譯後的綁定計畫（位置綁定固定下來的參數名稱保留）；route 為 None 時全部丟棄。
+
+        重新探索由呼叫端另外執行 discover()。
+        """
+        with self._lock:
+            if route is None:
+                self._compiled.clear()
+            else:
+                self._compiled.pop(route, None)
+
+    def schemas(self):
+        result = []
+        for route, spec in list(self._specs.items()):
+            schema = spec.schema()
+            compiled = self._compiled.get(route)
+            schema["compiled"] = compiled.bindings() if compiled is not None else None
+            result.append(schema)
+        return result
@@ -1,27 +1,65 @@
 """my_flask1.py
 
 簡介：
-- 提供兩個 Flask API endpoint，分別用來計算兩種 CO2 排放模型（廚餘處理量與燃料消耗碳排）。
+- 以 /calculate/<model> 計算 CO2 排放模型（廚餘處理量、燃料消耗碳排，以及自動註冊的其他產品系統），
+  各模型的欄位與 openLCA 參數的對應宣告在 MODEL_SPECS（見 model_registry.py），/models 列出所有模型與欄位。
 - 使用 openLCA 的 IPC client 執行 LCA 計算，然後回傳篩選後的 GWP 結果。
-- 可選：把輸入與計算結果儲存到 Supabase（若已設定 SUPABASE_URL/KEY/TABLE 與安裝 supabase 套件）。
+- 也可以設定 LCA_BACKEND=local，改用 local_engine 直接以專案中的 JSON-LD 匯出在本機計算。
+- 可選：把輸入與計算結果儲存到 Supabase（若已設定 SUPABASE_URL/KEY/TABLE 與安裝 supabase 套件），在背景批次寫入。
 
 可客製化項目：
 - SUPABASE_URL / SUPABASE_KEY / SUPABASE_TABLE（環境變數或在檔案中設定）
-- 儲存欄位或欄位名稱（在 save_to_supabase 中修改 payload）
+- LCA_BACKEND / LCA_DATA_DIR / LCA_METHOD_NAME（計算後端、JSON-LD 匯出目錄與衝擊評估方法）
+- LOG_LEVEL / SERVER_TIMING / SLOW_REQUEST_SECONDS / SLOW_REQUEST_SAMPLE（log 等級、Server-Timing 標頭與慢請求 log）
+- 各計算階段的耗時直方圖可由 /metrics（Prometheus 格式）取得
+- WARMUP / WARMUP_MODELS / WARMUP_RETRY_SECONDS（背景暖機步驟；/healthz 與 /readyz 回報存活與就緒狀態）
+- import 時不連線到 openLCA 或 Supabase：連線池與 Supabase client 在第一次使用（或背景暖機）時才建立
+- HISTORY_PATH / HISTORY_FLUSH_INTERVAL / HISTORY_HOUR_RETENTION_DAYS（本機歷史彙總，/history 依時間 / 模型查詢 sum、count 與百分位數）
+- OPENLCA_MAX_QUEUE / OPENLCA_RETRY_AFTER / SINGLEFLIGHT_TIMEOUT（計算佇列上限與 503 backpressure、相同參數並行請求的合併）
+- 計算 endpoint 依 Accept（或 ?format=json|columnar|msgpack|arrow）回傳精簡的欄式 / 二進位格式，見 response_formats.py；
+  RESPONSE_COMPRESSION 依 Accept-Encoding 以 zstd / gzip 壓縮回應
+- IMPORT_CHUNK_SIZE / IMPORT_MAX_ROWS（/import 大量匯入 CSV / NDJSON 的驗證批次大小與筆數上限，CLI 見 bulk_import.py）
+- STREAM_MAX_CONCURRENT（每個 worker 同時進行的串流回應上限：/sweep、/import、/jobs/<id>/events，超過時回 503）
+- 正式環境請以 serve.py 啟動（多個 worker 行程 × 執行緒，各 worker 有自己的連線池）；python my_flask1.py 僅供開發
+- MODEL_SPECS / MODEL_PARAMETERS / MODEL_DISCOVERY（endpoint 欄位與參數名稱的對應、覆寫參數名稱、是否自動註冊未宣告的產品系統）
+- 儲存欄位或欄位名稱（在 _co2_payload 中修改 payload）
 
 注意：不要在公開的程式庫中直接放置金鑰，請使用環境變數或 Secret 管理機制。
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context, Response, stream_with_context
 try:
     from flask_cors import CORS
 except Exception:
     CORS = None
-import olca_schema as o
-import olca_ipc as ipc
+import io
 import os
 import json
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+import dataclasses
+import numpy as np
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from model_cache import ModelMetadataCache
+from model_registry import BindingError, ModelRegistry, ModelSpec, Param
+from local_engine import LocalClient, LocalEngine
+from result_cache import ResultCache
+from ipc_pool import IpcClientPool, PoolOverloaded, PoolUnavailable
+from supabase_writer import SupabaseWriter
+from history_store import HistoryStore
+from jobs import JobCancelled, JobManager, JobQueueFull, run_calculation
+from singleflight import SingleFlight, SingleFlightTimeout
+import jobs
+from warmup import Lazy, SkipStep, WarmUp
+import metrics
+import sweep
+import bulk_import
+import response_formats
+from response_formats import ResultTable
 # 讀取 .env（若你在專案根目錄放置 .env，會自動載入）
 try:
     from dotenv import load_dotenv
@@ -29,6 +67,12 @@ try:
 except Exception:
     # dotenv 尚未安裝，環境變數仍可從系統取得
     pass
+# LOG_LEVEL：log 等級（DEBUG / INFO / WARNING …，預設 INFO）；診斷訊息改用 logging，不再 print 到 stdout
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
 # Supabase client (optional):
 # - 如果您想要啟用儲存功能，請安裝 supabase 套件並設定 SUPABASE_URL / SUPABASE_KEY / SUPABASE_TABLE。
 # - 程式會嘗試載入 supabase，若載入失敗則不會中斷主流程（僅會停用儲存功能）。
@@ -37,209 +81,551 @@ try:
 except Exception:
     create_client = None
     SupabaseClient = None
-    print('Warning: supabase not installed; Supabase integration disabled. Install with: pip install supabase')
+    logger.warning('supabase not installed; Supabase integration disabled. Install with: pip install supabase')
 
 app = Flask(__name__) 
 if CORS:
     CORS(app)
 else:
-    print('Warning: flask_cors not installed; CORS not enabled. Install with: pip install flask-cors')
-client = ipc.Client(3001)  # 連線到 openLCA IPC Server
-method = client.get(o.ImpactMethod, name="IPCC 2021 AR6")
+    logger.warning('flask_cors not installed; CORS not enabled. Install with: pip install flask-cors')
+# LCA_BACKEND：ipc（預設，連線到 openLCA IPC Server）或 local（直接用專案中的 JSON-LD 匯出在本機計算）
+# LCA_DATA_DIR：local 模式使用的 JSON-LD 匯出目錄（預設為本檔案所在目錄）
+# LCA_INDEX_DIR：local 模式的特徵化係數索引目錄（預設為 <LCA_DATA_DIR>/.lca_index，可用 python cf_index.py 預先建立）
+# LCA_METHOD_NAME：衝擊評估方法名稱；local 模式需使用匯出中存在的方法，例如 "IPCC 2013 GWP 100a (incl. CO2 uptake)"
+# OPENLCA_IPC_ENDPOINTS：openLCA IPC Server 的 port 或 URL（以逗號分隔，可設定多台，例如 "3001,3000"）
+# OPENLCA_IPC_CONCURRENCY：每個 IPC client 同時處理的請求數（olca_ipc.Client 不是 thread-safe，預設 1）
+# OPENLCA_MAX_QUEUE：等待連線的計算超過此數量時，同步計算請求直接回 503 + Retry-After（0 表示不限制）
+# OPENLCA_RETRY_AFTER：因計算佇列已滿而回 503 時，建議 client 幾秒後重試
+# OPENLCA_IPC_TIMEOUT / OPENLCA_PROBE_TIMEOUT：每個 IPC 請求 / 健康檢查等待 openLCA 回應的秒數（逾時視為連線失敗）
+LCA_BACKEND = os.environ.get("LCA_BACKEND", "ipc").lower()
+local_client = None
+if LCA_BACKEND == "local":
+    # LocalEngine 建立時不讀取任何檔案，索引與模型在第一次計算（或暖機）時才載入
+    local_client = LocalClient(engine=LocalEngine(
+        os.environ.get("LCA_DATA_DIR") or None, index_dir=os.environ.get("LCA_INDEX_DIR") or None))
+
+MAX_QUEUE = int(os.environ.get("OPENLCA_MAX_QUEUE", "32")) or None
+RETRY_AFTER = int(os.environ.get("OPENLCA_RETRY_AFTER", "2"))
+
+def _create_client_pool():
+    if local_client is not None:
+        return IpcClientPool(
+            clients=[local_client],
+            max_concurrency=int(os.environ.get("LOCAL_CONCURRENCY", "4")),
+            max_waiting=MAX_QUEUE,
+        )
+    # 連線到 openLCA IPC Server（可多台，依進行中請求數做負載平衡，失效的 server 會自動剔除並重試）
+    pool = IpcClientPool.from_env(
+        os.environ.get("OPENLCA_IPC_ENDPOINTS", "3001"),
+        max_concurrency=int(os.environ.get("OPENLCA_IPC_CONCURRENCY", "1")),
+        health_interval=float(os.environ.get("OPENLCA_HEALTH_INTERVAL", "10")),
+        max_waiting=MAX_QUEUE,
+        request_timeout=float(os.environ.get("OPENLCA_IPC_TIMEOUT", "60")),
+        probe_timeout=float(os.environ.get("OPENLCA_PROBE_TIMEOUT", "5")),
+    )
+    pool.start_health_checks()
+    return pool
+
+# 連線池在第一次使用時才建立，import 時不會連線到 openLCA
+client_pool = Lazy(_create_client_pool, "client_pool")
+# 模型中繼資料快取：ProductSystem、參數、單位 (t) 與衝擊評估方法只會向 openLCA 查詢一次
+# MODEL_REVALIDATE_SECONDS：每隔多少秒比對一次模型的 version/lastChange（預設 300 秒）
+model_cache = ModelMetadataCache(
+    client_pool,
+    method_name=os.environ.get("LCA_METHOD_NAME", "IPCC 2021 AR6"),
+    revalidate_after=float(os.environ.get("MODEL_REVALIDATE_SECONDS", "300")),
+)
+# 相同參數的並行計算只送一次 openLCA，其他請求等待並共用結果
+# SINGLEFLIGHT_TIMEOUT：等待共用計算的秒數上限（超過時該請求回 503，之後的請求會重新計算）
+inflight = SingleFlight(timeout=float(os.environ.get("SINGLEFLIGHT_TIMEOUT", "120")))
+# 計算結果快取：相同的 (模型, 方法, 參數, amount) 直接回傳快取結果，不再呼叫 calculate()
+# RESULT_CACHE_SIZE：記憶體中最多保留幾筆（0 表示停用）
+# RESULT_CACHE_TTL：結果有效秒數
+# RESULT_CACHE_PATH：SQLite 檔案路徑（設定後重新啟動仍可命中）
+result_cache = ResultCache(
+    maxsize=int(os.environ.get("RESULT_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("RESULT_CACHE_TTL", "3600")),
+    path=os.environ.get("RESULT_CACHE_PATH") or None,
+)
+# 非同步計算工作：JOB_WORKERS 為同時執行的工作數，JOB_MAX_PENDING 為等待中的工作上限，
+# JOB_MAX_ITEMS 為單一工作的筆數上限（超過時回 413），JOB_MAX_EVENTS 為每個工作保留的 SSE 事件數
+job_manager = JobManager(
+    max_workers=int(os.environ.get("JOB_WORKERS", "4")),
+    max_pending=int(os.environ.get("JOB_MAX_PENDING", "100")),
+    max_events=int(os.environ.get("JOB_MAX_EVENTS", "1000")),
+)
+JOB_MAX_ITEMS = int(os.environ.get("JOB_MAX_ITEMS", "1000"))
+# 情境比較的並行執行緒數（實際同時送往 openLCA 的數量仍受 client_pool 限制）與情境數上限
+compare_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("COMPARE_WORKERS", "8")), thread_name_prefix="compare")
+COMPARE_MAX_SCENARIOS = int(os.environ.get("COMPARE_MAX_SCENARIOS", "100"))
+# 參數掃描 / 蒙地卡羅單次請求的樣本數上限
+SWEEP_MAX_SAMPLES = int(os.environ.get("SWEEP_MAX_SAMPLES", "1000000"))
+# 大量匯入：IMPORT_CHUNK_SIZE 為每次驗證 / 向量化計算的筆數，IMPORT_MAX_ROWS 為單次匯入的筆數上限（0 表示不限）
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", "0"))
+# STREAM_MAX_CONCURRENT：每個 worker 同時進行的串流回應（/sweep、/import、/jobs/<id>/events）上限，超過時回 503；
+# 串流會在整個傳輸期間佔住一個請求執行緒，預設為 SERVE_THREADS 的一半，保留其餘執行緒給一般請求（0 表示不限）
+STREAM_MAX_CONCURRENT = int(os.environ.get("STREAM_MAX_CONCURRENT") or max(1, int(os.environ.get("SERVE_THREADS", "8")) // 2))
+_stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONCURRENT) if STREAM_MAX_CONCURRENT else None
 
 # Supabase configuration - customize: set SUPABASE_URL, SUPABASE_KEY, SUPABASE_TABLE_*
 # 安全性建議：在本機/伺服器上透過環境變數管理憑證，不要直接把金鑰寫在原始碼中。
 # 支援讀取前端 .env 樣式的變數（REACT_APP_*），方便開發環境復用設定
 SUPABASE_URL = os.environ.get("SUPABASE_URL") or os.environ.get("REACT_APP_SUPABASE_URL", "")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY") or os.environ.get("REACT_APP_SUPABASE_ANON_KEY", "")
-print(f"Supabase URL: {SUPABASE_URL[:20]}... Key: {'set' if SUPABASE_KEY else 'not set'}")
+logger.info("Supabase URL: %s... Key: %s", SUPABASE_URL[:20], 'set' if SUPABASE_KEY else 'not set')
 # 預設的 table 名稱（可由環境變數覆寫）
 SUPABASE_TABLE_IPCC = os.environ.get("SUPABASE_TABLE_IPCC", "IPCC 2021 AR6")
 SUPABASE_TABLE_CO2DISTANCE = os.environ.get("SUPABASE_TABLE_CO2DISTANCE", "Co2ByDistance")
 SUPABASE_TABLE_CO2OILUSE = os.environ.get("SUPABASE_TABLE_CO2OILUSE", "Co2ByOiluse")
 SUPABASE_TABLE = os.environ.get("SUPABASE_TABLE", "")  # 舊的兼容變數
 
-# 如果 supabase client 已載入且 URL/KEY 有設定，則建立連線物件；否則將 supabase 設為 None（停用儲存功能）。
-if create_client and SUPABASE_URL and SUPABASE_KEY:
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-else:
-    supabase = None
-    if create_client:
-        print("Supabase not configured (missing URL/KEY). Set environment variables SUPABASE_URL/REACT_APP_SUPABASE_URL and SUPABASE_KEY/REACT_APP_SUPABASE_ANON_KEY.")
-    else:
-        print("Supabase client unavailable (package missing).")
+# Supabase 寫入改為背景批次寫入 (write-behind)，請求不再等待資料庫
+# SUPABASE_BATCH_SIZE / SUPABASE_FLUSH_INTERVAL：每批最多幾筆、最多等待幾秒
+# SUPABASE_QUEUE_SIZE：佇列上限，超過時直接寫入 journal
+# SUPABASE_JOURNAL：資料庫無法連線時暫存資料的本機檔案（NDJSON，之後自動重送；serve.py 的各 worker 共用同一個檔案，
+# 以 flock 互斥，見 supabase_writer.py）
+def _create_supabase_writer():
+    """如果 supabase client 已載入且 URL/KEY 有設定，則建立連線與寫入佇列；否則回傳 None（停用儲存功能）。"""
+    if not (create_client and SUPABASE_URL and SUPABASE_KEY):
+        if create_client:
+            logger.warning("Supabase not configured (missing URL/KEY). Set environment variables SUPABASE_URL/REACT_APP_SUPABASE_URL and SUPABASE_KEY/REACT_APP_SUPABASE_ANON_KEY.")
+        else:
+            logger.warning("Supabase client unavailable (package missing).")
+        return None
+    writer = SupabaseWriter(
+        create_client(SUPABASE_URL, SUPABASE_KEY),
+        SUPABASE_TABLE_IPCC,
+        batch_size=int(os.environ.get("SUPABASE_BATCH_SIZE", "100")),
+        flush_interval=float(os.environ.get("SUPABASE_FLUSH_INTERVAL", "1.0")),
+        max_queue=int(os.environ.get("SUPABASE_QUEUE_SIZE", "10000")),
+        journal_path=os.environ.get("SUPABASE_JOURNAL", "supabase_journal.ndjson") or None,
+    )
+    writer.start()
+    atexit.register(writer.stop)
+    return writer
+
+# Supabase client 在第一次儲存（或背景暖機）時才建立，import 時不會連線
+supabase_writer = Lazy(_create_supabase_writer, "supabase_writer")
+
+# 本機歷史彙總（/history）：每次儲存結果時依時間區間 / 模型 / 衝擊類別累加 sum、count 與百分位數直方圖
+# HISTORY_PATH：SQLite 檔案路徑（預設 lca_history.sqlite3，設為空字串停用；多個 worker 共用同一個檔案）
+# HISTORY_FLUSH_INTERVAL：記憶體中的彙總每隔幾秒合併寫入 SQLite
+# HISTORY_HOUR_RETENTION_DAYS：小時彙總保留天數（日彙總一律保留）
+def _create_history_store():
+    path = os.environ.get("HISTORY_PATH", "lca_history.sqlite3")
+    if not path:
+        return None
+    store = HistoryStore(
+        path,
+        flush_interval=float(os.environ.get("HISTORY_FLUSH_INTERVAL", "1.0")),
+        hour_retention=float(os.environ.get("HISTORY_HOUR_RETENTION_DAYS", "90")) * 86400,
+    )
+    store.start()
+    atexit.register(store.stop)
+    return store
+
+history_store = Lazy(_create_history_store, "history_store")
 
-def save_to_supabase(inputs, impacts, extra=None):
+def save_to_supabase(inputs, impacts, extra=None, block=False):
     """
-    先將 impacts 儲存到 IPCC 的 table（回傳其 id），再將一筆 Co2 表的資料插入並把 IPCC 的 id 放到 `CarbonEmissionID` 欄位。
+    把 impacts 與 inputs 交給 supabase_writer 在背景批次寫入，立即回傳（不等待資料庫）。
 
     流程：
-    1. 檢查 supabase 是否可用
-    2. 將 impacts 等資訊序列化後插入到 IPCC table（SUPABASE_TABLE_IPCC）並抓取回傳的 id
-    3. 根據 extra['model'] 選擇 Co2 表（Co2ByDistance 或 Co2ByOiluse）並插入一筆資料，欄位包含 inputs 的相對欄位與 CarbonEmissionID
+    1. 記錄到本機歷史彙總 (history_store)，不論 Supabase 是否可用
+    2. 檢查 supabase 是否可用
+    3. 依 extra['model'] 選擇 Co2 表（Co2ByDistance 或 Co2ByOiluse）並準備欄位
+    4. 放入寫入佇列：IPCC 的 id 在本機產生，Co2 資料的 CarbonEmissionID 直接引用該 id
+
+    block=True 時寫入佇列已滿會等待（大量匯入時限制速度，避免資料都落到 journal）。
 
     回傳值：
-    - dict，包含 status、ipcc_id、co2_id（若已插入）、以及原始回應（供除錯）
+    - dict，包含 status（queued / disabled / error）與 ipcc_id
     """
+    model_name = extra.get("model") if extra else None
+    if model_name and history_store:
+        history_store.record(model_name, impacts)
+
     # 檢查 supabase 是否可用（未設定或未安裝會返回 disabled）
-    if not supabase:
+    if not supabase_writer:
         return {"status": "disabled", "message": "Supabase not configured"}
-    
-
-    # 1) Insert into IPCC table
-    ipcc_payload = impacts.copy()
 
-    print("Inserting IPCC payload:", ipcc_payload)
+    table, payload = _co2_payload(inputs, extra.get("model") if extra else None)
+    if table is None:
+        return {"status": "error", "message": f"Unknown model: {extra.get('model') if extra else None}"}
 
-    try:
-        # ipcc_res = supabase.table(SUPABASE_TABLE_IPCC).insert(ipcc_payload).execute()
-        ipcc_res = supabase.table(SUPABASE_TABLE_IPCC).insert(ipcc_payload).execute()
-        print("IPCC insert response:", ipcc_res)
-        if isinstance(ipcc_res, dict) and ipcc_res.get('error'):
-            print("IPCC insert error:", ipcc_res.get('error'))
-            return {"status": "error", "message": str(ipcc_res.get('error'))}
-
-        # 取出回傳 id（Supabase 通常回傳 data: [{"id": ...}]）
-        ipcc_json = json.loads(ipcc_res.model_dump_json())
-        ipcc_data = ipcc_json['data']
-        ipcc_id = ipcc_data[0]['id']
-        print("Inserted IPCC ID:", ipcc_id)
-
-    except Exception as e:
-        print("IPCC insert exception:", e)
-        return {"status": "error", "message": f"IPCC insert failed: {e}"}
+    ipcc_id = supabase_writer.submit(impacts.copy(), table, payload, block=block)
+    return {"status": "queued", "ipcc_id": ipcc_id}
 
-    # 2) Insert into the corresponding Co2 table
-    model_name = extra.get("model") if extra else None
-
-    # Prepare payloads for the two known models
+def _co2_payload(inputs, model_name):
+    """依模型名稱回傳 (Co2 table 名稱, 欄位 dict)；未知模型回傳 (None, None)。"""
     if model_name == "廚餘處理量":
-        table = SUPABASE_TABLE_CO2DISTANCE
-        payload = {
+        return SUPABASE_TABLE_CO2DISTANCE, {
             "Distance": inputs.get("distance"),
             "Coefficient": inputs.get("factor"),
             "Load": inputs.get("load"),
             "Amount": inputs.get("amount"),
-            "CarbonEmissionID": ipcc_id
         }
-    elif model_name == "燃料消耗碳排":
-        table = SUPABASE_TABLE_CO2OILUSE
-        payload = {
+    if model_name == "燃料消耗碳排":
+        return SUPABASE_TABLE_CO2OILUSE, {
             "Distance": inputs.get("distance"),
             "Coefficient": inputs.get("factor"),
             "Load": inputs.get("load"),
             "Amount": inputs.get("amount"),
             "Oiluse": inputs.get("oilUse"),
-            "CarbonEmissionID": ipcc_id
         }
+    return None, None
+
 
-    try:
-        co2_res = supabase.table(table).insert(payload).execute()
-    except Exception as e:
-        print("Co2 insert exception:", e)
-        return {"status": "error", "message": f"Co2 insert failed: {e}", "ipcc_id": ipcc_id}
 
 
+# 各計算 endpoint（/calculate/<route>）的宣告：route、openLCA 產品系統名稱，以及請求欄位對應的參數名稱
+# 每個模型只在第一次使用（或模型版本變更）時依名稱綁定一次參數，請求時不再查詢參數列表
+# 燃料消耗碳排的匯出不在專案中、參數名稱尚未確認：沿用原本的做法依 openLCA 回傳的參數順序綁定
+# （factor, oilUse, distance, load），第一次編譯時固定成參數名稱並記錄警告；
+# 以 MODEL_PARAMETERS 設定全部欄位的參數名稱後改為依名稱綁定
+MODEL_SPECS = (
+    ModelSpec("Co2BYTKM", "廚餘處理量", (
+        Param("factor", "cofficient", description="係數"),
+        Param("distance", "KM", description="距離 (km)"),
+        Param("load", "ton", description="載重 (t)"),
+    )),
+    ModelSpec("Co2BYOilKM", "燃料消耗碳排", (
+        Param("factor", description="係數"),
+        Param("oilUse", description="燃料使用量"),
+        Param("distance", description="距離 (km)"),
+        Param("load", description="載重 (t)"),
+    ), binding="position"),
+)
+# MODEL_PARAMETERS：覆寫欄位對應的 openLCA 參數名稱（JSON，例如 '{"Co2BYTKM": {"distance": "km"}}'）；
+# 依位置綁定的模型必須一次指定全部欄位，指定後改為依名稱綁定
+def _override_parameters(specs, overrides):
+    result = []
+    for spec in specs:
+        names = overrides.get(spec.route) or {}
+        unknown = set(names) - set(spec.fields)
+        if unknown:
+            logger.warning("MODEL_PARAMETERS: %s has no fields %s", spec.route, ", ".join(sorted(unknown)))
+        binding = spec.binding
+        if binding == "position" and names:
+            missing = [f for f in spec.fields if f not in names]
+            if missing:
+                raise ValueError(f"MODEL_PARAMETERS: {spec.route} 依位置綁定，必須指定全部欄位（缺少 {', '.join(missing)}）")
+            binding = "name"
+        params = tuple(dataclasses.replace(p, parameter=names.get(p.name, p.parameter)) for p in spec.params)
+        result.append(dataclasses.replace(spec, params=params, binding=binding))
+    return tuple(result)
 
+MODEL_SPECS = _override_parameters(MODEL_SPECS, json.loads(os.environ.get("MODEL_PARAMETERS") or "{}"))
+# MODEL_DISCOVERY：是否把 openLCA（或 local 模式的 product_systems/）中未宣告的產品系統自動註冊為 endpoint
+# （route 為產品系統名稱、欄位為輸入參數名稱，預設開啟）
+model_registry = ModelRegistry(
+    model_cache, MODEL_SPECS,
+    discover=os.environ.get("MODEL_DISCOVERY", "1") not in ("0", "false", "no"),
+)
 
-# 將原本的計算流程封裝成函式
 def get_co2_by_tkm(distance, factor, load, amount):
-    """執行廚餘處理量模型的 LCA 計算並回傳 GWP 類別的影響值列表。
+    """執行廚餘處理量模型的 LCA 計算，回傳 list of dict（category、value、unit）。"""
+    return calculate_route("Co2BYTKM", {"distance": distance, "factor": factor, "load": load, "amount": amount},
+                           shed=True)
 
-    流程：
-    1. 從 openLCA client 取得指定的 ProductSystem 模型（名稱為 "廚餘處理量"）
-    2. 取得模型參數與單位（t 為噸）
-    3. 使用傳入的 distance/factor/load/amount 設定 CalculationSetup
-    4. 呼叫 client.calculate() 執行計算並等待完成
-    5. 篩選 impact category 名稱包含 "GWP" 的項目並回傳
+def get_co2_by_oil_km(distance, factor, load, amount, oilUse):
+    """執行燃料消耗碳排模型的 LCA 計算，回傳 list of dict（category、value、unit）。"""
+    return calculate_route("Co2BYOilKM", {"distance": distance, "factor": factor, "load": load,
+                                          "oilUse": oilUse, "amount": amount}, shed=True)
+
+def calculate_route(route, inputs, cancelled=None, shed=False, cache=True):
+    """依 model_registry 中 route 的綁定計畫計算單筆輸入。
 
-    回傳：list of dict，每個 dict 包含 category、value、unit
+    inputs 缺少參數或不是數值時丟出 ValueError；未知的 route 丟出 KeyError。
+    cache=False 時不讀寫結果快取（/sweep、/import 的一次性樣本，避免把常用的結果擠出快取）。
     """
-    # 取得模型
-    model = client.get(o.ProductSystem, name="廚餘處理量")
-    
-
-    print("Model ID:", model.id)
-    print("Method ID:", method.id) 
-
-    # 取得參數
-    parameters = client.get_parameters(o.ProductSystem, model.id)
-    
-    mass_group_descriptor = client.find(o.UnitGroup, "Units of mass")
-    mass_group = client.get(o.UnitGroup, mass_group_descriptor.id)
-    ton_unit = next((unit for unit in mass_group.units if unit.name == 't'), None)
-
-    # 建立計算設定
-    setup = o.CalculationSetup(
-        target=model,
-        amount=amount,
-        unit=ton_unit,
-        impact_method=method,
-        parameters=[
-            o.ParameterRedef(name=parameters[0].name, value=factor, context=parameters[0].context),
-            o.ParameterRedef(name=parameters[1].name, value=distance, context=parameters[1].context),
-            o.ParameterRedef(name=parameters[2].name, value=load, context=parameters[2].context),
-        ],
-    )
+    spec = model_registry[route]
+    values = spec.validate(inputs)
+    compiled = model_registry.compile(route)
+    if not cache:
+        return _run_calculation(compiled.setup(values), cancelled)
+    return _calculate_impacts(compiled.setup(values), version=compiled.version, cancelled=cancelled, shed=shed)
 
-    # 計算
-    result = client.calculate(setup)
-    result.wait_until_ready()
-    impacts = result.get_total_impacts()
-    result.dispose()
+def calculate_many(route, items):
+    """計算多筆輸入，回傳與 items 順序相同的 impacts 列表。
 
-    # 篩選 GWP
-    gwp_impacts = []
-    for i in impacts:
-        gwp_impacts.append({
-            "category": i.impact_category.name,
-            "value": i.amount,
-            "unit": i.impact_category.ref_unit
-        })
-    return gwp_impacts
+    - local 模式：整批以 LocalEngine.calculate_batch 一次向量化計算
+    - ipc 模式：以 compare_executor 並行送出，實際並行數由 client_pool 控制
+    模型中繼資料在分派前只解析一次，所有計算共用。
+    """
+    if local_client is not None:
+        categories, values = calculate_matrix(route, items)
+        return [
+            [{**c, "value": float(v)} for c, v in zip(categories, row)]
+            for row in values
+        ]
 
-# 將原本的計算流程封裝成函式
-def get_co2_by_oil_km(distance, factor, load, amount, oilUse):
-    """執行燃料消耗碳排模型的 LCA 計算並回傳 GWP 類別的影響值列表。
+    compiled = model_registry.compile(route)
+
+    def one(inputs):
+        return _calculate_impacts(compiled.setup(inputs), version=compiled.version, shed=True)
+
+    return list(compare_executor.map(one, items))
+
+def calculate_matrix(route, items):
+    """計算多筆輸入，回傳 (categories, values)：values 為 筆數 × 衝擊類別數 的 NumPy 陣列（精簡回應格式使用）。
+
+    local 模式直接使用 calculate_batch 的矩陣，不建立每筆的 dict。
+    """
+    if local_client is not None:
+        columns = {f: np.array([float(i[f]) for i in items]) for f in model_registry[route].required}
+        categories, values, _ = calculate_batch(route, columns)
+        return categories, values
+    table = ResultTable.from_impacts(calculate_many(route, items))
+    return [{"category": c, "unit": u} for c, u in zip(table.categories, table.units)], table.values
+
+def _scenario_items(baseline, scenarios):
+    """[基準情境, 各替代情境]；替代情境未提供的欄位沿用基準情境的值。"""
+    return [baseline] + [{**baseline, **s.get("inputs", s)} for s in scenarios]
+
+def _scenario_name(scenario, index):
+    return scenario.get("name") or f"scenario_{index + 1}"
 
-    與 get_co2_by_tkm 類似，但此模型需要額外的 oilUse 參數。
+def compare_scenarios(route, baseline, scenarios):
+    """比較基準情境與多個替代情境，回傳各類別的差值與百分比變化。
 
-    回傳：list of dict，每個 dict 包含 category、value、unit
+    替代情境未提供的欄位沿用基準情境的值。
     """
-    # 取得模型
-    model = client.get(o.ProductSystem, name="燃料消耗碳排")
-    
-
-    print("Model ID:", model.id)
-    print("Method ID:", method.id) 
-
-    # 取得參數
-    parameters = client.get_parameters(o.ProductSystem, model.id)
-    print("Parameters:", [p.name for p in parameters])
-    
-    mass_group_descriptor = client.find(o.UnitGroup, "Units of mass")
-    mass_group = client.get(o.UnitGroup, mass_group_descriptor.id)
-    ton_unit = next((unit for unit in mass_group.units if unit.name == 't'), None)
-
-    # 建立計算設定
-    setup = o.CalculationSetup(
-        target=model,
-        amount=amount,
-        unit=ton_unit,
-        impact_method=method,
-        parameters=[
-            o.ParameterRedef(name=parameters[0].name, value=factor, context=parameters[0].context),
-            o.ParameterRedef(name=parameters[1].name, value=oilUse, context=parameters[1].context),
-            o.ParameterRedef(name=parameters[2].name, value=distance, context=parameters[2].context),
-            o.ParameterRedef(name=parameters[3].name, value=load, context=parameters[3].context),
-        ],
+    items = _scenario_items(baseline, scenarios)
+    results = calculate_many(route, items)
+    base_impacts = results[0]
+    compared = []
+    for index, (scenario, inputs, impacts) in enumerate(zip(scenarios, items[1:], results[1:])):
+        deltas = []
+        for base, alt in zip(base_impacts, impacts):
+            delta = alt["value"] - base["value"]
+            deltas.append({
+                "category": alt["category"],
+                "unit": alt["unit"],
+                "baseline": base["value"],
+                "value": alt["value"],
+                "delta": delta,
+                "pct_change": delta / base["value"] * 100 if base["value"] else None,
+            })
+        compared.append({
+            "name": _scenario_name(scenario, index),
+            "inputs": {k: v for k, v in inputs.items() if k != "name"},
+            "deltas": deltas,
+        })
+    return base_impacts, compared
+
+def compare_table(route, baseline, scenarios):
+    """與 compare_scenarios 相同的計算，以 ResultTable 回傳（第一列為基準情境，差值由 client 以第一列相減）。"""
+    items = _scenario_items(baseline, scenarios)
+    categories, values = calculate_matrix(route, items)
+    spec = model_registry[route]
+    return ResultTable.from_matrix(
+        categories, values,
+        labels=["baseline"] + [_scenario_name(s, i) for i, s in enumerate(scenarios)],
+        inputs={f: np.array([float(i[f]) for i in items]) for f in spec.required},
+        meta={"status": "ok", "model": spec.model},
     )
 
+def _sweep_results(route, points):
+    """依完成順序產生 (index, inputs, impacts, error)。
+
+    local 模式每 1024 筆向量化計算一次；ipc 模式以固定數量的進行中工作送往連線池（不讀寫結果快取）。
+    """
+    indexed = enumerate(points)
+    if local_client is not None:
+        for chunk in sweep.chunked(indexed, 1024):
+            try:
+                results = calculate_many(route, [inputs for _, inputs in chunk])
+            except Exception as e:
+                for index, inputs in chunk:
+                    yield index, inputs, None, e
+                continue
+            for (index, inputs), impacts in zip(chunk, results):
+                yield index, inputs, impacts, None
+        return
+
+    in_flight = max(1, client_pool.capacity * 2)
+    for (index, inputs), impacts, error in sweep.bounded_imap(
+            compare_executor, lambda item: calculate_route(route, item[1], cache=False), indexed, in_flight):
+        yield index, inputs, impacts, error
+
+def import_results(records, persist=True):
+    """計算匯入的每筆資料並（可選）寫入 Supabase，依完成順序產生 (ImportRecord, impacts, db_status)。
+
+    - local 模式：每 IMPORT_CHUNK_SIZE 筆依模型分組，以 calculate_many 向量化計算
+    - ipc 模式：以固定數量的進行中計算送往連線池，不讀寫結果快取（與 /sweep 相同）
+    - 寫入佇列已滿時會等待背景寫入，匯入速度不會超過資料庫的寫入速度
+    驗證失敗的資料直接產生，record.error 為錯誤訊息；計算失敗時同樣記錄在 record.error。
+    """
+    def results():
+        if local_client is not None:
+            for chunk in sweep.chunked(records, IMPORT_CHUNK_SIZE):
+                groups = {}
+                for record in chunk:
+                    if record.error is None:
+                        groups.setdefault(record.route, []).append(record)
+                impacts = {}
+                for route, group in groups.items():
+                    try:
+                        for record, values in zip(group, calculate_many(route, [r.inputs for r in group])):
+                            impacts[record.index] = values
+                    except Exception as e:
+                        for record in group:
+                            record.error = str(e)
+                for record in chunk:
+                    yield record, impacts.get(record.index), None
+            return
+
+        def one(record):
+            if record.error is not None:
+                return None
+            return calculate_route(record.route, record.inputs, cache=False)
+
+        in_flight = max(1, client_pool.capacity * 2)
+        for record, values, error in sweep.bounded_imap(compare_executor, one, records, in_flight):
+            if error is not None:
+                record.error = str(error)
+            yield record, values, None
+
+    for record, impacts, _ in results():
+        db_status = None
+        if persist and record.error is None:
+            db_status = save_to_supabase(
+                record.inputs, {i["category"]: i["value"] for i in impacts},
+                extra={"model": model_registry[record.route].model, "method": model_cache.method_name}, block=True)
+        yield record, impacts, db_status
+
+# 批次計算單次請求允許的最大筆數（可由環境變數覆寫）
+BATCH_MAX_ROWS = int(os.environ.get("BATCH_MAX_ROWS", "100000"))
+
+def calculate_batch(route, columns):
+    """對多組參數一次計算，回傳 (categories, values, vectorized)。
+
+    - local 模式：整批交給 LocalEngine.calculate_batch 以 NumPy 向量化計算
+    - ipc 模式：參數相同的列只計算一次（以 amount = 1 計算後依各列的 amount 縮放），
+      不重複的參數組以 calculate_many 並行送出，結果依原本的列順序排列
+    - values 為 NumPy 陣列，形狀為 筆數 × 衝擊類別數
+    """
+    compiled = model_registry.compile(route)
+    amounts = columns["amount"]
+    values = [columns[f] for f in compiled.spec.fields]
+
+    if local_client is not None:
+        refs, matrix = local_client.engine.calculate_batch(compiled.build_setup(amounts, values))
+        categories = [{"category": r.name, "unit": r.ref_unit} for r in refs]
+        return categories, matrix, True
+
+    fields = compiled.spec.fields
+    amounts = np.asarray(amounts, dtype=float)
+    if not len(amounts):
+        return [], np.empty((0, 0)), False
+    matrix = np.column_stack(values) if values else np.empty((len(amounts), 0))
+    unique, inverse = np.unique(matrix, axis=0, return_inverse=True)
+    items = [{**dict(zip(fields, map(float, row))), "amount": 1.0} for row in unique]
+    categories, per_unit = calculate_matrix(route, items)
+    return categories, per_unit[inverse.reshape(-1)] * amounts[:, None], False
+
+def _parse_batch(data, fields):
+    """把批次請求轉為各欄位的 float64 陣列。
+
+    支援三種格式：
+    - [ {distance, factor, ...}, ... ]（JSON 陣列）
+    - { "rows": [ {...}, ... ] }
+    - { "columns": { "distance": [...], "factor": [...], ... } }（欄式）
+
+    與單筆請求（ModelSpec.validate）相同，NaN / Infinity 等非有限數值會丟出 ValueError。
+    """
+    if isinstance(data, dict) and "columns" in data:
+        raw = data["columns"] or {}
+        missing = [f for f in fields if f not in raw]
+        if missing:
+            raise ValueError(f"缺少欄位: {', '.join(missing)}")
+        try:
+            columns = {f: np.asarray(raw[f], dtype=float).reshape(-1) for f in fields}
+        except (TypeError, ValueError):
+            raise ValueError("欄位必須是數值陣列")
+        lengths = {len(c) for c in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("各欄位長度不一致")
+        return _check_finite(columns)
+
+    rows = data.get("rows") if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        raise ValueError("請提供 JSON 陣列、rows 或 columns")
+    columns = {f: np.empty(len(rows)) for f in fields}
+    for i, row in enumerate(rows):
+        for f in fields:
+            value = row.get(f) if isinstance(row, dict) else None
+            if value is None:
+                raise ValueError(f"第 {i} 筆缺少參數: {f}")
+            try:
+                columns[f][i] = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"第 {i} 筆參數不是數值: {f}")
+    return _check_finite(columns)
+
+def _check_finite(columns):
+    for f, column in columns.items():
+        invalid = np.flatnonzero(~np.isfinite(column))
+        if invalid.size:
+            raise ValueError(f"第 {invalid[0]} 筆參數不是有限數值: {f}")
+    return columns
+
+def _calculate_impacts(setup, version=None, cancelled=None, shed=False):
+    """執行 openLCA 計算並把結果整理成 list of dict（category、value、unit）。
+
+    LCA 結果與參考量 (amount) 成正比，因此每組參數只以 amount = 1（一個功能單位）計算並快取，
+    其他 amount 直接把快取的每單位結果乘上 amount：
+    - 命中快取時完全不呼叫 calculate()/wait_until_ready()/dispose()，結果來源為 "scaled"
+    - 未命中時以 amount = 1 計算一次後快取，結果來源為 "computed"
+    快取未命中時經過 inflight（single-flight）：相同鍵值的並行請求共用同一次計算，結果來源為 "coalesced"。
+    是否命中與結果來源會記錄在 flask.g，供 endpoint 回報。
+    cancelled 為可選的函式，回傳 True 時中止計算（非同步工作取消時使用）。
+    shed=True 時計算佇列已滿會丟出 PoolOverloaded（同步請求使用；非同步工作與大量匯入照常排隊）。
+    """
+    amount = float(setup.amount) if setup.amount is not None else None
+    if amount is not None:
+        setup = dataclasses.replace(setup, amount=1.0)
+    with metrics.stage("result_cache"):
+        key = result_cache.key(setup, version=version)
+        per_unit = result_cache.get(key)
+    if has_request_context():
+        g.cache_hit = per_unit is not None
+        g.result_source = "scaled" if per_unit is not None else "computed"
+    if per_unit is None:
+        def compute():
+            result = _run_calculation(setup, cancelled, shed=shed)
+            result_cache.put(key, result)
+            return result
+
+        while True:
+            try:
+                per_unit, shared = inflight.do(key, compute)
+                break
+            except JobCancelled:
+                if cancelled is not None and cancelled():
+                    raise
+                # 共用的計算是被其他呼叫者（非同步工作）取消的：改由自己重新計算
+            except PoolOverloaded:
+                if shed:
+                    raise
+                # 共用的計算是由 shed=True 的呼叫者發起、因佇列已滿被拒絕：不排隊的呼叫者（非同步工作、大量匯入）改由自己排隊計算
+        if shared and has_request_context():
+            g.result_source = "coalesced"
+    if amount is None:
+        return per_unit
+    return [{**impact, "value": impact["value"] * amount} for impact in per_unit]
+
+def _run_calculation(setup, cancelled=None, shed=False):
+    """從連線池取得一個 client 計算；同一次計算的 calculate/wait/get/dispose 都在同一個 client 上完成。"""
+    return client_pool.run(lambda client: _run_on_client(client, setup, cancelled), shed=shed)
+
+def _run_on_client(client, setup, cancelled=None):
+    """呼叫 openLCA（或本機引擎）計算並整理結果（dispose 一定會執行）。"""
     # 計算
-    result = client.calculate(setup)
-    result.wait_until_ready()
-    impacts = result.get_total_impacts()
-    result.dispose()
+    impacts = run_calculation(client, setup, cancelled=cancelled)
 
     # 篩選 GWP
     gwp_impacts = []
@@ -251,74 +637,777 @@ def get_co2_by_oil_km(distance, factor, load, amount, oilUse):
         })
     return gwp_impacts
 
+# region: 指標與請求計時
+# SERVER_TIMING：是否在回應加上 Server-Timing 標頭（各階段耗時，預設開啟）
+# SLOW_REQUEST_SECONDS / SLOW_REQUEST_SAMPLE：超過幾秒算慢請求、慢請求寫入 log 的抽樣比例
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") not in ("0", "false", "no")
+slow_requests = metrics.SlowRequestLog(
+    threshold=float(os.environ.get("SLOW_REQUEST_SECONDS", "1.0")),
+    sample_rate=float(os.environ.get("SLOW_REQUEST_SAMPLE", "0.1")),
+)
+metrics.REGISTRY.gauge("lca_pool_capacity", "Concurrent calculations the IPC pool can run.",
+                       lambda: client_pool.capacity if client_pool.initialized else None)
+metrics.REGISTRY.gauge("lca_pool_outstanding", "Calculations currently running in the IPC pool.",
+                       lambda: client_pool.stats()["outstanding"] if client_pool.initialized else None)
+metrics.REGISTRY.gauge("lca_pool_waiting", "Calculations waiting for an IPC client.",
+                       lambda: client_pool.stats()["waiting"] if client_pool.initialized else None)
+metrics.REGISTRY.gauge("lca_singleflight_in_flight", "Distinct calculations currently shared by the single-flight layer.",
+                       lambda: inflight.stats()["in_flight"])
+REJECTED = metrics.REGISTRY.counter(
+    "lca_backpressure_rejections_total", "Requests rejected with 503 because the IPC queue was full.")
+STREAMS_REJECTED = metrics.REGISTRY.counter(
+    "lca_stream_rejections_total", "Streaming requests rejected with 503 because the per-worker stream limit was reached.")
+metrics.REGISTRY.gauge("lca_result_cache_entries", "Entries in the in-memory result cache.",
+                       lambda: result_cache.stats()["size"])
+metrics.REGISTRY.gauge("lca_result_cache_hit_ratio", "Result cache hit ratio since start.",
+                       lambda: result_cache.stats()["hit_rate"])
+metrics.REGISTRY.gauge("lca_jobs", "Asynchronous jobs by status.",
+                       lambda: {(status,): n for status, n in job_manager.stats()["jobs"].items()}, ("status",))
+metrics.REGISTRY.gauge("lca_supabase_queue_depth", "Records waiting in the Supabase write-behind queue.",
+                       lambda: supabase_writer.stats()["queued"] if supabase_writer.initialized and supabase_writer else None)
+
+@app.before_request
+def _begin_request_timing():
+    g.request_started = time.perf_counter()
+    g.metrics_token = metrics.begin_request()
+
+@app.after_request
+def _record_request_timing(response):
+    """記錄請求耗時直方圖，並加上 Server-Timing 標頭（串流回應只計到開始傳送為止）。"""
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    stages = metrics.end_request(g.pop("metrics_token", None))
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing(stages, elapsed)
+    slow_requests.record(request.method, request.path, response.status_code, elapsed, stages)
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    """API endpoint: /metrics，Prometheus text 格式的指標（各階段耗時直方圖、請求耗時、連線池與佇列狀態）。"""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+# endregion
+
+# RESPONSE_COMPRESSION：依 Accept-Encoding 以 zstd（需要 zstandard 套件）或 gzip 壓縮大於 1 KiB 的回應
+# （預設開啟；前端的反向代理已經壓縮時可設為 0）
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "1") not in ("0", "false", "no")
+
+# 在 _record_request_timing 之後註冊：after_request 依註冊的相反順序執行，壓縮的耗時會計入請求耗時
+@app.after_request
+def _compress_response(response):
+    """依 Accept-Encoding 壓縮回應（串流回應與已壓縮的回應不處理）；依 Accept 選擇格式的回應標示 Vary: Accept。"""
+    if g.get("negotiated"):
+        response.vary.add("Accept")
+    if (not RESPONSE_COMPRESSION or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or not 200 <= response.status_code < 300):
+        return response
+    # 快取（瀏覽器、反向代理）依 Accept-Encoding 區分回應：小回應雖然不壓縮也要標示，否則可能把未壓縮的版本給接受壓縮的 client
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < response_formats.COMPRESS_MIN_BYTES:
+        return response
+    encoding = response_formats.choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    with metrics.stage("compress"):
+        response.set_data(response_formats.compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
 # Flask API
-@app.route("/calculate/Co2BYTKM", methods=["POST"])
-def calculate():
-    """API endpoint: /calculate/Co2BYTKM
+def _negotiate():
+    """計算 endpoint 的回應格式（?format= 優先於 Accept）；沒有可提供的格式時回傳 None。"""
+    g.negotiated = True
+    return response_formats.negotiate(request.accept_mimetypes, request.args.get("format"))
+
+def _not_acceptable():
+    return jsonify({
+        "status": "error",
+        "message": "不支援要求的回應格式",
+        "available": response_formats.available(),
+    }), 406
+
+def _table_response(table, media_type):
+    """以精簡格式（欄式 JSON / MessagePack / Arrow）回傳 ResultTable；序列化失敗時回傳 JSON 的 500。"""
+    try:
+        with metrics.stage("serialize"):
+            body = response_formats.encode(table, media_type)
+    except Exception as e:
+        logger.exception("serialize %s failed", media_type)
+        return jsonify({"status": "error", "message": f"無法輸出 {media_type}: {e}"}), 500
+    response = Response(body, mimetype=media_type)
+    response.vary.add("Accept")
+    return response
+
+def _unavailable(e):
+    """openLCA 暫時無法處理（或模型參數無法依名稱綁定）時的 503 回應；計算佇列已滿或等待共用計算逾時時附上 Retry-After。"""
+    response = jsonify({"status": "error", "message": str(e)})
+    response.status_code = 503
+    if isinstance(e, PoolOverloaded):
+        REJECTED.inc()
+    if isinstance(e, (PoolOverloaded, SingleFlightTimeout)):
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+    return response
+
+def _acquire_stream_slot():
+    """取得一個串流名額，成功時回傳釋放用的函式；名額已滿時回傳 None。"""
+    if _stream_slots is None:
+        return lambda: None
+    if not _stream_slots.acquire(blocking=False):
+        return None
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            _stream_slots.release()
+    return release
+
+def _stream_response(generator, release, **kwargs):
+    """以 generator 建立串流回應；傳輸完成、client 中斷或回應關閉（尚未開始傳輸）時釋放串流名額。"""
+    def guarded():
+        try:
+            yield from generator
+        finally:
+            release()
+
+    response = Response(stream_with_context(guarded()), **kwargs)
+    response.call_on_close(release)
+    return response
 
-    - 請求內容 (JSON): { distance, factor, load, amount }
-    - 驗證必要參數，呼叫 get_co2_by_tkm 執行計算
+def _streams_busy():
+    STREAMS_REJECTED.inc()
+    response = jsonify({"status": "error", "message": f"同時進行的串流已達上限 {STREAM_MAX_CONCURRENT}，請稍後再試"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(RETRY_AFTER)
+    return response
+
+def _cache_status():
+    """回應中附帶的結果快取資訊（本次是否命中、結果是縮放或重新計算，以及累計統計）。"""
+    return {"hit": bool(g.get("cache_hit")), "source": g.get("result_source"), **result_cache.stats()}
+
+@app.route("/calculate/<model>", methods=["POST"])
+def calculate(model):
+    """API endpoint: /calculate/<model>（model 為 Co2BYTKM、Co2BYOilKM 或自動註冊的產品系統名稱，見 /models）
+
+    - 請求內容 (JSON): 模型的各欄位與 amount，例如 Co2BYTKM 為 { distance, factor, load, amount }
+    - 依預先編譯的欄位定義驗證參數（缺少或不是數值時回 400），再依名稱綁定到 openLCA 參數計算
     - 嘗試把輸入與結果儲存到 Supabase（若已配置），回傳 db_status 用於檢查儲存狀態
+    - 精簡格式（Accept 或 ?format=，見 response_formats.py）只回傳衝擊類別、單位與數值，不回傳 inputs
     """
-    data = request.json
-    distance = data.get("distance")
-    factor = data.get("factor")
-    load = data.get("load")
-    amount = data.get("amount")
-
-    if None in (distance, factor, load, amount):
-        return jsonify({"status": "error", "message": "缺少參數"}), 400
+    if model not in model_registry:
+        return jsonify({"status": "error", "message": f"未知的模型: {model}"}), 404
+    spec = model_registry[model]
+    media_type = _negotiate()
+    if media_type is None:
+        return _not_acceptable()
+    try:
+        inputs = spec.validate(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
     try:
-        impacts = get_co2_by_tkm(distance, factor, load, amount)
+        impacts = calculate_route(model, inputs, shed=True)
+    except (PoolUnavailable, SingleFlightTimeout, BindingError) as e:
+        return _unavailable(e)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-    inputs = {"distance": distance, "factor": factor, "load": load, "amount": amount}
     supabase_impact = {impact["category"]: impact["value"] for impact in impacts}
-    db_result = save_to_supabase(inputs, supabase_impact, extra={"model": "廚餘處理量", "method": method.name if method else None})
+    db_result = save_to_supabase(inputs, supabase_impact, extra={"model": spec.model, "method": model_cache.method_name})
+    if media_type != response_formats.JSON:
+        return _table_response(ResultTable.from_impacts([impacts], meta={
+            "status": "ok", "model": spec.model, "cache": g.get("result_source"), "db_status": db_result.get("status"),
+        }), media_type)
 
     return jsonify({
         "status": "ok",
         "inputs": inputs,
         "impacts": impacts,
+        "cache": _cache_status(),
         "db_status": db_result
     })
 
-@app.route("/calculate/Co2BYOilKM", methods=["POST"])
-def calculate_oil():
-    """API endpoint: /calculate/Co2BYOilKM
+@app.route("/calculate/<model>/batch", methods=["POST"])
+def calculate_batch_route(model):
+    """API endpoint: /calculate/<model>/batch（model 見 /models）
 
-    - 請求內容 (JSON): { distance, factor, load, oilUse, amount }
-    - 驗證必要參數，呼叫 get_co2_by_oil_km 執行計算
-    - 嘗試把輸入與結果儲存到 Supabase（若已配置），回傳 db_status 用於檢查儲存狀態
+    - 請求內容 (JSON): 多筆參數，格式見 _parse_batch
+    - 回傳 categories（只列一次）與 values（每筆一列，順序與 categories 相同）
+    - 精簡格式（Accept 或 ?format=，見 response_formats.py）直接由結果矩陣序列化
+    - 批次結果不寫入 Supabase
     """
-    data = request.json
-    distance = data.get("distance")
-    factor = data.get("factor")
-    load = data.get("load")
-    oilUse = data.get("oilUse")
-    amount = data.get("amount")
+    if model not in model_registry:
+        return jsonify({"status": "error", "message": f"未知的模型: {model}"}), 404
+    spec = model_registry[model]
+    media_type = _negotiate()
+    if media_type is None:
+        return _not_acceptable()
 
-    if None in (distance, factor, load, oilUse, amount):
-        return jsonify({"status": "error", "message": "缺少參數"}), 400
+    try:
+        columns = _parse_batch(request.get_json(silent=True), spec.required)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    count = len(columns["amount"])
+    if count > BATCH_MAX_ROWS:
+        return jsonify({"status": "error", "message": f"筆數超過上限 {BATCH_MAX_ROWS}"}), 413
 
     try:
-        impacts = get_co2_by_oil_km(distance, factor, load, amount, oilUse)
+        categories, values, vectorized = calculate_batch(model, columns)
+    except (PoolUnavailable, SingleFlightTimeout, BindingError) as e:
+        return _unavailable(e)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-    inputs = {"distance": distance, "factor": factor, "load": load, "oilUse": oilUse, "amount": amount}
-    supabase_impact = {impact["category"]: impact["value"] for impact in impacts}
-    db_result = save_to_supabase(inputs, supabase_impact, extra={"model": "燃料消耗碳排", "method": method.name if method else None})
+    if media_type != response_formats.JSON:
+        return _table_response(ResultTable.from_matrix(categories, values, meta={
+            "status": "ok", "model": spec.model, "vectorized": vectorized,
+        }), media_type)
+    return jsonify({
+        "status": "ok",
+        "model": spec.model,
+        "count": count,
+        "vectorized": vectorized,
+        "categories": categories,
+        "values": values.tolist(),
+    })
+
+@app.route("/cache/invalidate", methods=["POST"])
+def invalidate_cache():
+    """API endpoint: /cache/invalidate
+
+    - 請求內容 (JSON，可省略): { model, results }，省略 model 時清除全部模型中繼資料
+    - results 預設為 true，同時清除計算結果快取
+    - 用於 openLCA 端修改模型後，強制下次請求重新解析；MODEL_DISCOVERY 啟用時重新探索新增的產品系統
+    """
+    data = request.get_json(silent=True) or {}
+    model_cache.invalidate(data.get("model"))
+    model_registry.invalidate()
+    if data.get("results", True):
+        result_cache.clear()
+    discovered = []
+    if model_registry.discover_enabled:
+        try:
+            discovered = model_registry.discover()
+        except Exception as e:
+            logger.warning("model discovery failed: %s", e)
+    return jsonify({
+        "status": "ok", "models": model_cache.models(), "discovered": discovered, "cache": result_cache.stats(),
+    })
+
+@app.route("/models", methods=["GET"])
+def list_models():
+    """API endpoint: /models，列出可計算的模型、各欄位對應的 openLCA 參數與已編譯的綁定。"""
+    return jsonify({"status": "ok", "models": model_registry.schemas()})
+
+def _calculation_job(job, route, items):
+    """非同步工作：依序計算 items 中的每一筆輸入，完成一筆就推送一筆結果並寫入 Supabase。"""
+    model_name = model_registry[route].model
+    for inputs in items:
+        if job.is_cancelled():
+            break
+        impacts = calculate_route(route, inputs, cancelled=job.is_cancelled)
+        supabase_impact = {impact["category"]: impact["value"] for impact in impacts}
+        db_result = save_to_supabase(inputs, supabase_impact, extra={"model": model_name, "method": model_cache.method_name})
+        job.add_result({"inputs": inputs, "impacts": impacts, "db_status": db_result})
+
+@app.route("/compare", methods=["POST"])
+def compare():
+    """API endpoint: /compare，在伺服器端並行計算並比較多個情境。
+
+    - 請求內容 (JSON): { model: "Co2BYTKM" | "Co2BYOilKM" | …（見 /models）, baseline: {...}, scenarios: [{ name, ...欄位 }, ...] }
+    - 替代情境只需提供與基準不同的欄位
+    - 回傳基準結果，以及每個情境各衝擊類別的數值、差值 (delta) 與百分比變化 (pct_change)
+    - 精簡格式（Accept 或 ?format=，見 response_formats.py）回傳 labels、各情境的輸入欄位與數值矩陣（第一列為基準）
+    """
+    data = request.get_json(silent=True) or {}
+    route = data.get("model")
+    if route not in model_registry:
+        return jsonify({"status": "error", "message": f"未知的模型: {route}"}), 400
+    media_type = _negotiate()
+    if media_type is None:
+        return _not_acceptable()
+    baseline = data.get("baseline")
+    scenarios = data.get("scenarios")
+    if not isinstance(baseline, dict) or not isinstance(scenarios, list) or not scenarios:
+        return jsonify({"status": "error", "message": "需要 baseline 物件與非空的 scenarios 陣列"}), 400
+    if len(scenarios) > COMPARE_MAX_SCENARIOS:
+        return jsonify({"status": "error", "message": f"情境數超過上限 {COMPARE_MAX_SCENARIOS}"}), 413
+    if not all(isinstance(s, dict) for s in scenarios):
+        return jsonify({"status": "error", "message": "scenarios 必須是物件陣列"}), 400
+    # 與 /calculate 相同的驗證：基準與每個合併後的情境都必須是完整的有限數值，計算時使用轉換後的數值
+    spec = model_registry[route]
+    try:
+        baseline = spec.validate(baseline)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"baseline: {e}"}), 400
+    validated = []
+    for index, scenario in enumerate(scenarios):
+        try:
+            inputs = spec.validate({**baseline, **scenario.get("inputs", scenario)})
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"{_scenario_name(scenario, index)}: {e}"}), 400
+        validated.append({"name": _scenario_name(scenario, index), "inputs": inputs})
+    scenarios = validated
+
+    try:
+        if media_type != response_formats.JSON:
+            return _table_response(compare_table(route, baseline, scenarios), media_type)
+        base_impacts, compared = compare_scenarios(route, baseline, scenarios)
+    except (PoolUnavailable, SingleFlightTimeout, BindingError) as e:
+        return _unavailable(e)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
 
     return jsonify({
         "status": "ok",
-        "inputs": inputs,
-        "impacts": impacts,
-        "db_status": db_result
+        "model": model_registry[route].model,
+        "baseline": {"inputs": baseline, "impacts": base_impacts},
+        "scenarios": compared,
+    })
+
+@app.route("/sweep", methods=["POST"])
+def sweep_route():
+    """API endpoint: /sweep，參數掃描或蒙地卡羅敏感度分析，以 NDJSON 串流回傳。
+
+    - 請求內容 (JSON):
+      - { model, base: {...}, grid: { distance: [..] 或 {start, stop, num|step}, ... } }
+      - { model, base: {...}, distributions: { factor: {type: uniform|normal|lognormal|triangular|fixed, ...} }, samples, seed }
+      - 可選 results（預設 true，false 時只回傳統計）與 summary_every（每 n 筆輸出一次中間統計）
+    - 每行一個 JSON：start、result（完成一筆就輸出一筆，順序不保證）、error、summary（最後一行為最終統計）
+    - 樣本逐一產生、統計以增量計算，記憶體用量與樣本數無關
+    """
+    data = request.get_json(silent=True) or {}
+    route = data.get("model")
+    if route not in model_registry:
+        return jsonify({"status": "error", "message": f"未知的模型: {route}"}), 400
+    base = data.get("base") or {}
+    grid = data.get("grid")
+    distributions = data.get("distributions")
+    if bool(grid) == bool(distributions):
+        return jsonify({"status": "error", "message": "請提供 grid 或 distributions 其中之一"}), 400
+    if not isinstance(grid or distributions, dict) or not isinstance(base, dict):
+        return jsonify({"status": "error", "message": "base、grid 與 distributions 必須是物件"}), 400
+
+    spec = model_registry[route]
+    varied = list(grid or distributions)
+    unknown = [n for n in varied if n not in spec.required]
+    if unknown:
+        return jsonify({"status": "error", "message": f"未知欄位: {unknown}"}), 400
+    # 所有驗證都在開始串流前完成（串流開始後只能以 200 回傳錯誤）：
+    # 固定欄位以模型的 ModelSpec 驗證，變動欄位先以佔位值代入
+    try:
+        base = spec.validate({**base, **{n: 0.0 for n in varied}})
+        # 先以算術計算樣本數並檢查上限，再驗證設定與產生樣本（避免 {num: 10**10} 之類的設定在驗證時就耗盡記憶體）
+        total = sweep.grid_size(grid) if grid else sweep.integer(data.get("samples", 1000), "samples")
+        summary_every = sweep.integer(data.get("summary_every") or 0, "summary_every", 0)
+        seed = None if data.get("seed") is None else sweep.integer(data["seed"], "seed", 0)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if total > SWEEP_MAX_SAMPLES:
+        return jsonify({"status": "error", "message": f"樣本數超過上限 {SWEEP_MAX_SAMPLES}"}), 413
+    try:
+        sweep.validate(grid, distributions)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    release = _acquire_stream_slot()
+    if release is None:
+        return _streams_busy()
+
+    if grid:
+        points = sweep.grid_points(base, grid)
+    else:
+        points = sweep.monte_carlo_points(base, distributions, total, seed=seed)
+    with_results = data.get("results", True)
+
+    def line(obj):
+        return json.dumps(obj, ensure_ascii=False) + "\n"
+
+    def stream():
+        summary = sweep.SweepSummary(varied)
+        yield line({"type": "start", "model": model_registry[route].model, "total": total, "parameters": varied})
+        for index, inputs, impacts, error in _sweep_results(route, points):
+            if error is not None:
+                summary.errors += 1
+                yield line({"type": "error", "index": index, "inputs": {n: inputs[n] for n in varied}, "message": str(error)})
+                continue
+            summary.add(inputs, impacts)
+            if with_results:
+                yield line({
+                    "type": "result",
+                    "index": index,
+                    "inputs": {n: inputs[n] for n in varied},
+                    "impacts": {i["category"]: i["value"] for i in impacts},
+                })
+            if summary_every and summary.count % summary_every == 0:
+                yield line({"type": "progress", **summary.result()})
+        yield line({"type": "summary", **summary.result()})
+
+    return _stream_response(stream(), release, mimetype="application/x-ndjson")
+
+@app.route("/import", methods=["POST"])
+def import_route():
+    """API endpoint: /import，上傳 CSV / NDJSON 行程資料，計算後以串流回傳結果檔並批次寫入 Supabase。
+
+    - 請求內容：檔案本身（Content-Type: text/csv 或 application/x-ndjson），或 multipart 的 file 欄位
+    - 查詢參數：model（預設模型，檔案中可用 model 欄位覆寫）、format（輸入格式，預設依檔名 / Content-Type 判斷）、
+      output（csv 或 ndjson，預設 csv）、persist（預設 1，0 表示不寫入 Supabase）
+    - 邊讀取邊計算邊回傳，記憶體用量與檔案筆數無關；每筆的錯誤會寫在結果中，不會中止整個匯入
+    """
+    route = request.args.get("model", "Co2BYTKM")
+    if route not in model_registry:
+        return jsonify({"status": "error", "message": f"未知的模型: {route}"}), 400
+    output = request.args.get("output", "csv")
+    if output not in bulk_import.FORMATS:
+        return jsonify({"status": "error", "message": f"不支援的輸出格式: {output}"}), 400
+    upload = request.files.get("file")
+    if upload is not None:
+        # 回應是串流的，Flask 在 view 回傳後就會關閉 request.files：先把檔案取出，讀完後再自行關閉
+        stream, filename, content_type = upload.stream, upload.filename, upload.content_type
+        upload.stream = io.BytesIO()
+    else:
+        stream, filename, content_type = request.stream, None, request.content_type
+    fmt = request.args.get("format") or bulk_import.detect_format(filename, content_type)
+    if fmt not in bulk_import.FORMATS:
+        return jsonify({"status": "error", "message": f"不支援的輸入格式: {fmt}"}), 400
+    persist = request.args.get("persist", "1") not in ("0", "false", "no")
+    release = _acquire_stream_slot()
+    if release is None:
+        if upload is not None:
+            stream.close()
+        return _streams_busy()
+
+    records = bulk_import.read_records(stream, fmt, model_registry, route,
+                                       chunk_size=IMPORT_CHUNK_SIZE, max_rows=IMPORT_MAX_ROWS or None)
+    results = import_results(records, persist=persist)
+    summary = bulk_import.ImportSummary()
+    if output == "csv":
+        body = bulk_import.format_csv(results, summary, bulk_import.result_fields(model_registry))
+        mimetype = "text/csv"
+    else:
+        body = bulk_import.format_ndjson(results, summary)
+        mimetype = "application/x-ndjson"
+
+    def stream_results():
+        try:
+            yield from body
+        finally:
+            if upload is not None:
+                stream.close()
+        logger.info("import finished: %s", summary.to_dict())
+
+    return _stream_response(stream_results(), release, mimetype=mimetype,
+                            headers={"Content-Disposition": f"attachment; filename=results.{output}"})
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """API endpoint: /jobs，送出非同步計算工作並立即回傳 job id（HTTP 202）。
+
+    - 請求內容 (JSON): { model: "Co2BYTKM" | "Co2BYOilKM" | …（見 /models）, inputs: {...} } 或 { model, items: [{...}, ...] }
+    - 之後以 GET /jobs/<id> 查詢狀態與進度，或以 GET /jobs/<id>/events 接收 Server-Sent Events
+    """
+    data = request.get_json(silent=True) or {}
+    route = data.get("model")
+    if route not in model_registry:
+        return jsonify({"status": "error", "message": f"未知的模型: {route}"}), 400
+    items = data.get("items")
+    if items is None:
+        items = [data.get("inputs") or {}]
+    if not isinstance(items, list) or not items or not all(isinstance(i, dict) for i in items):
+        return jsonify({"status": "error", "message": "items 必須是非空的物件陣列"}), 400
+    if len(items) > JOB_MAX_ITEMS:
+        return jsonify({"status": "error", "message": f"筆數超過上限 {JOB_MAX_ITEMS}"}), 413
+    required = model_registry[route].required
+    for index, inputs in enumerate(items):
+        if any(inputs.get(f) is None for f in required):
+            return jsonify({"status": "error", "message": f"第 {index} 筆缺少參數"}), 400
+
+    try:
+        job = job_manager.submit(_calculation_job, route, items, total=len(items))
+    except JobQueueFull as e:
+        response = jsonify({"status": "error", "message": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+
+    return jsonify({
+        "status": "ok",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """API endpoint: /jobs/<id>，回傳工作狀態、進度與已完成的結果。"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "找不到工作"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """API endpoint: /jobs/<id>（DELETE），取消工作；執行中的計算會中止並 dispose。"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "找不到工作"}), 404
+    return jsonify(job.to_dict(with_results=False))
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """API endpoint: /jobs/<id>/events，以 Server-Sent Events 推送工作狀態與每筆完成的結果。"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "找不到工作"}), 404
+    release = _acquire_stream_slot()
+    if release is None:
+        return _streams_busy()
+
+    def stream():
+        sent = 0
+        while True:
+            sent, events = job.wait_events(sent, timeout=15)
+            if not events:
+                if job.status in ("done", "error", "cancelled"):
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return _stream_response(stream(), release, mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/db/status", methods=["GET"])
+def db_status():
+    """API endpoint: /db/status，回傳 Supabase 背景寫入佇列的狀態。"""
+    if not supabase_writer:
+        return jsonify({"status": "disabled"})
+    return jsonify({"status": "ok", "writer": supabase_writer.stats()})
+
+def _parse_time(value, default):
+    """查詢參數的時間：epoch 秒或 ISO 8601（沒有時區時視為 UTC）。"""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"無法解析的時間: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _split_param(name):
+    return [v.strip() for v in request.args.get(name, "").split(",") if v.strip()]
+
+@app.route("/history", methods=["GET"])
+def history():
+    """API endpoint: /history，從本機彙總查詢一段時間內的排放量統計（不掃描 Supabase 的原始資料）。
+
+    - 查詢參數：
+      - from / to：時間範圍（epoch 秒或 ISO 8601，預設為最近 30 天）
+      - resolution：hour 或 day（預設 day）
+      - model：模型（endpoint 名稱如 Co2BYTKM 或模型名稱，逗號分隔）；category：衝擊類別（逗號分隔）
+      - group_by：分組欄位，bucket / model / category 的組合（預設全部；例如 model 表示整段期間依模型合計）
+      - percentiles：要估計的百分位數（預設 50,95，相對誤差約 1%）
+    - 回傳每組的 count、sum、mean、min、max 與百分位數
+    """
+    if not history_store:
+        return jsonify({"status": "disabled", "message": "HISTORY_PATH not configured"}), 404
+    try:
+        end = _parse_time(request.args.get("to"), time.time())
+        start = _parse_time(request.args.get("from"), end - 30 * 86400)
+        percentiles = [float(p) for p in _split_param("percentiles") or ("50", "95")]
+        if any(not 0 <= p <= 100 for p in percentiles):
+            raise ValueError("percentiles 必須介於 0 到 100")
+        models = [model_registry[m].model if m in model_registry else m for m in _split_param("model")]
+        rows = history_store.query(
+            start, end,
+            resolution=request.args.get("resolution", "day"),
+            models=models or None,
+            categories=_split_param("category") or None,
+            group_by=_split_param("group_by") or ("bucket", "model", "category"),
+            percentiles=percentiles,
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except sqlite3.Error as e:
+        # 其他 worker 正在寫入或維護 SQLite 檔案：暫時無法查詢，請 client 稍後重試
+        logger.warning("history query failed: %s", e)
+        response = jsonify({"status": "error", "message": f"歷史資料暫時無法查詢: {e}"})
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+        return response, 503
+    for row in rows:
+        if "bucket" in row:
+            row["start"] = datetime.fromtimestamp(row["bucket"], timezone.utc).isoformat()
+    return jsonify({
+        "status": "ok",
+        "from": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+        "to": datetime.fromtimestamp(end, timezone.utc).isoformat(),
+        "rows": rows,
     })
 
+@app.route("/pool", methods=["GET"])
+def pool_status():
+    """API endpoint: /pool，回傳各 openLCA IPC server 的健康狀態與進行中請求數。"""
+    return jsonify({"status": "ok", "pool": client_pool.stats()})
+
+# region: 暖機與健康檢查
+# WARMUP：啟動後在背景依序執行的暖機步驟（逗號分隔，預設 "pool,models,discover,probe,supabase"；設為 0 停用）
+#   - pool：建立連線池並確認至少一台 openLCA IPC server 可連線
+#   - models：預先解析 WARMUP_MODELS 中各 endpoint 的模型、參數、單位與衝擊評估方法，並編譯參數綁定
+#   - discover：自動註冊未宣告的產品系統（MODEL_DISCOVERY=0 時略過）
+#   - probe：以模型的預設參數試算一次（不寫入結果快取），確認計算流程可用
+#   - supabase：建立 Supabase client 與背景寫入佇列
+# WARMUP_MODELS：暖機的 endpoint（逗號分隔，預設為 MODEL_SPECS 中宣告的全部 endpoint）
+# WARMUP_RETRY_SECONDS：步驟失敗（例如 openLCA 尚未啟動）後重試的間隔秒數
+STARTED_AT = time.time()
+WARMUP_MODELS = [r.strip() for r in os.environ.get("WARMUP_MODELS", ",".join(s.route for s in MODEL_SPECS)).split(",")
+                 if r.strip()]
+
+def _warm_pool():
+    client_pool.instance()
+    if local_client is None:
+        stats = client_pool.check_health()
+        if not any(m["healthy"] for m in stats["members"]):
+            raise PoolUnavailable("沒有可連線的 openLCA IPC server")
+
+def _warm_models():
+    resolved = []
+    for route in WARMUP_MODELS:
+        try:
+            resolved.append(model_registry.compile(route))
+        except (KeyError, ValueError) as e:
+            # 模型或方法不存在、參數無法綁定是設定問題，重試也不會成功
+            logger.warning("warm-up: %s", e)
+    if not resolved:
+        raise SkipStep("沒有可解析的模型")
+    return resolved
+
+def _warm_discover():
+    if not model_registry.discover_enabled:
+        raise SkipStep("MODEL_DISCOVERY 已停用")
+    return model_registry.discover()
+
+def _warm_probe():
+    for route in WARMUP_MODELS:
+        try:
+            meta = model_registry.compile(route).meta
+        except (KeyError, ValueError):
+            continue
+        setup = meta.build_setup(1.0, [p.value if p.value is not None else 1.0 for p in meta.parameters])
+        _run_calculation(setup)
+        return
+    raise SkipStep("沒有可試算的模型")
+
+WARMUP_STEPS = {
+    "pool": _warm_pool,
+    "models": _warm_models,
+    "discover": _warm_discover,
+    "probe": _warm_probe,
+    "supabase": supabase_writer.instance,
+}
+_warmup_names = [n.strip() for n in os.environ.get("WARMUP", ",".join(WARMUP_STEPS)).split(",")
+                 if n.strip() and n.strip() != "0"]
+for _name in _warmup_names:
+    if _name not in WARMUP_STEPS:
+        logger.warning("Unknown warm-up step ignored: %s", _name)
+warm_up = WarmUp(
+    [(n, WARMUP_STEPS[n]) for n in _warmup_names if n in WARMUP_STEPS],
+    retry_interval=float(os.environ.get("WARMUP_RETRY_SECONDS", "5")),
+)
+atexit.register(warm_up.stop)
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """API endpoint: /healthz（liveness），只要行程能回應就是 200，不會呼叫 openLCA 或資料庫。"""
+    return jsonify({"status": "ok", "uptime": round(time.time() - STARTED_AT, 3)})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """API endpoint: /readyz（readiness），暖機完成且連線池中至少一台 server 健康時回傳 200，否則 503。"""
+    ready = warm_up.ready
+    body = {"warmup": warm_up.status()}
+    if client_pool.initialized:
+        pool = client_pool.stats()
+        body["pool"] = {"healthy": sum(1 for m in pool["members"] if m["healthy"]), "members": len(pool["members"])}
+        ready = ready and body["pool"]["healthy"] > 0
+    body["status"] = "ready" if ready else "not ready"
+    return jsonify(body), 200 if ready else 503
+
+# endregion
+
+# region: 多行程部署（serve.py）
+# serve.py 會先在主行程 import 本模組並呼叫 preload_metadata()，再 fork 出 worker 行程：
+# - 模型中繼資料（以及 local 模式已編譯的模型與係數索引）在 fork 前解析完成，各 worker 以 copy-on-write 共用這份唯讀快照
+# - 連線池、Supabase client 與背景執行緒不會跨行程共用：每個 worker 在 after_fork() 後第一次使用時各自建立
+# - 結果快取在各 worker 的記憶體中各自保存；設定 RESULT_CACHE_PATH 時透過同一個 SQLite 檔案共用
+
+def preload_metadata():
+    """在主行程（fork 前）預先解析模型中繼資料，回傳成功解析的模型名稱；openLCA 無法連線時回傳空列表。"""
+    try:
+        resolved = [compiled.spec.model for compiled in _warm_models()]
+        if model_registry.discover_enabled:
+            resolved += model_registry.discover()
+    except (SkipStep, PoolUnavailable) as e:
+        logger.warning("metadata preload skipped: %s", e)
+        resolved = []
+    except Exception as e:
+        logger.warning("metadata preload failed: %s", e)
+        resolved = []
+    # 主行程不處理請求：關閉為了預先解析而建立的連線，worker 會各自重新建立
+    if client_pool.initialized:
+        client_pool.close()
+        client_pool.reset()
+    return resolved
+
+def after_fork():
+    """在 worker 行程 fork 之後呼叫：丟棄從父行程複製來的連線，並在本行程啟動暖機。"""
+    client_pool.reset()
+    supabase_writer.reset()
+    history_store.reset()
+    result_cache.reopen()
+    warm_up.start()
+
+def shutdown(timeout=10.0):
+    """關閉 worker：停止接收計算、等待進行中的計算結束，最後 dispose 仍未釋放的 openLCA 結果。"""
+    warm_up.stop()
+    jobs.begin_shutdown()
+    job_manager.shutdown(wait=False)
+    compare_executor.shutdown(wait=False, cancel_futures=True)
+    deadline = time.monotonic() + timeout
+    while jobs.outstanding_count() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    disposed = jobs.dispose_outstanding()
+    if disposed:
+        logger.warning("disposed %d outstanding results on shutdown", disposed)
+    if client_pool.initialized:
+        client_pool.close()
+    if supabase_writer.initialized and supabase_writer:
+        supabase_writer.stop(timeout=max(0.0, deadline - time.monotonic()))
+    if history_store.initialized and history_store:
+        history_store.stop()
+    logger.info("worker %d shut down", os.getpid())
+
+# endregion
+
+# FLASK_DEBUG：以 python my_flask1.py 啟動時是否啟用 debug 與自動重新載入（預設開啟）
+FLASK_DEBUG = os.environ.get("FLASK_DEBUG", "1") not in ("0", "false", "no")
+# WARMUP_AUTOSTART：import 時是否立即在背景暖機（serve.py 設為 0，改由各 worker 在 after_fork() 中啟動）
+WARMUP_AUTOSTART = os.environ.get("WARMUP_AUTOSTART", "1") not in ("0", "false", "no")
+# 自動重新載入時，監看檔案的父行程不處理請求，不需要暖機
+if WARMUP_AUTOSTART and not (__name__ == "__main__" and FLASK_DEBUG and os.environ.get("WERKZEUG_RUN_MAIN") != "true"):
+    warm_up.start()
+
 if __name__ == "__main__":
     # debug=True 會啟用自動重新載入 (code change 後自動重啟)
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    app.run(host="0.0.0.0", port=5001, debug=FLASK_DEBUG)
@@ -0,0 +1,221 @@
+"""response_formats.py
+
+簡介：
+- 計算結果的精簡回應格式，依 Accept 標頭（或 ?format= 查詢參數）選擇：
+  - application/json（預設）：原本的格式，每個衝擊類別一個 {category, value, unit} 物件
+  - application/vnd.lca.columnar+json（format=columnar）：欄式 JSON，衝擊類別與單位只列一次，
+    數值依類別分欄（每欄一個陣列）
+  - application/msgpack（format=msgpack，需要 msgpack 套件）：數值矩陣直接以 NumPy 的 float64 位元組傳送
+  - application/vnd.apache.arrow.stream（format=arrow，需要 pyarrow 套件）：Arrow IPC stream，每個衝擊類別一欄，
+    欄位 metadata 帶單位；pandas / polars / DuckDB 可以直接讀取
+- ResultTable 以 NumPy 矩陣（筆數 × 衝擊類別數）保存結果，序列化時直接使用陣列的緩衝區，不建立每筆的 dict。
+- compress()：依 Accept-Encoding 以 zstd（需要 zstandard 套件）或 gzip 壓縮回應。
+- 精簡格式不回傳 inputs 與 db_status 的詳細內容（只保留寫入狀態）。
+
+用法（client 端）：
+    requests.post(url, json=payload, headers={"Accept": "application/vnd.apache.arrow.stream"})
+    pyarrow.ipc.open_stream(response.content).read_all()
+    msgpack.unpackb(response.content)["values"] → numpy.frombuffer(data, dtype).reshape(shape)
+
+可客製化項目：
+- FORMATS：?format= 的名稱與對應的 media type
+- COMPRESS_MIN_BYTES：小於此大小的回應不壓縮
+- GZIP_LEVEL / ZSTD_LEVEL：壓縮等級
+"""
+
+import gzip
+import json
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# msgpack / pyarrow / zstandard 都是可選的：未安裝時對應的格式或壓縮方式不提供
+# （Accept 要求該格式時退回 JSON；以 ?format= 指定時回 406）
+try:
+    import msgpack
+except Exception:
+    msgpack = None
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except Exception:
+    pa = None
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+JSON = "application/json"
+COLUMNAR = "application/vnd.lca.columnar+json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+FORMATS = {"json": JSON, "columnar": COLUMNAR, "msgpack": MSGPACK, "arrow": ARROW}
+# 部分 client 使用的舊 media type
+ALIASES = {"application/x-msgpack": MSGPACK}
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+
+def available():
+    """目前環境可以輸出的 media type（依偏好順序，JSON 在最前面）。"""
+    types = [JSON, COLUMNAR]
+    if msgpack is not None:
+        types.append(MSGPACK)
+    if pa is not None:
+        types.append(ARROW)
+    return types
+
+
+def negotiate(accept, fmt=None):
+    """依 ?format= 或 Accept（werkzeug 的 MIMEAccept）選出回應格式。
+
+    Accept 中沒有可提供的格式時退回 JSON；只有 ?format= 指定了無法提供的格式，
+    或 Accept 明確排除 JSON（application/json;q=0）時才回傳 None（406）。
+    """
+    types = available()
+    if fmt:
+        media_type = FORMATS.get(fmt.lower(), fmt.lower())
+        return media_type if media_type in types else None
+    if not accept:
+        return JSON
+    # 別名只在對應的格式可以提供時才列入（未安裝 msgpack 時 application/x-msgpack 也不能選）
+    aliases = [alias for alias, media_type in ALIASES.items() if media_type in types]
+    match = accept.best_match(types + aliases, default=None)
+    if match is not None:
+        return ALIASES.get(match, match)
+    return None if _excludes(accept, JSON) else JSON
+
+
+def _excludes(accept, media_type):
+    """Accept 是否明確以 q=0 排除 media_type（只列出其他格式不算排除）。"""
+    return any(value.lower() == media_type and quality == 0 for value, quality in accept)
+
+
+@dataclass
+class ResultTable:
+    """欄式的計算結果：categories / units 各列一次，values 為 筆數 × 衝擊類別數 的 float64 矩陣。
+
+    inputs 為可選的輸入欄位（每欄一個長度為筆數的陣列），labels 為可選的列名稱（例如情境名稱），
+    meta 為附加在回應最外層的欄位（status、model、count…）。
+    """
+
+    categories: list
+    units: list
+    values: np.ndarray
+    inputs: dict = field(default_factory=dict)
+    labels: list | None = None
+    meta: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_matrix(cls, categories, values, **kwargs):
+        """categories 為 [{category, unit}, ...]（calculate_batch 的回傳值）。"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(categories))
+        return cls([c["category"] for c in categories], [c["unit"] for c in categories], values, **kwargs)
+
+    @classmethod
+    def from_impacts(cls, rows, **kwargs):
+        """rows 為每筆的 impacts（[{category, value, unit}, ...]），各筆的類別順序相同。"""
+        first = rows[0] if rows else []
+        values = np.array([[i["value"] for i in row] for row in rows], dtype=np.float64)
+        return cls.from_matrix([{"category": i["category"], "unit": i["unit"]} for i in first], values, **kwargs)
+
+    def unit_dictionary(self):
+        """(不重複的單位列表, 每個類別的單位索引)。"""
+        units = list(dict.fromkeys(self.units))
+        index = {u: i for i, u in enumerate(units)}
+        return units, [index[u] for u in self.units]
+
+
+# region: 序列化
+
+def _columnar(table):
+    units, unit_index = table.unit_dictionary()
+    body = {
+        **table.meta,
+        "count": len(table.values),
+        "categories": table.categories,
+        "units": units,
+        "unit_index": unit_index,
+        "columns": [column.tolist() for column in table.values.T],
+    }
+    if table.labels is not None:
+        body["labels"] = table.labels
+    if table.inputs:
+        body["inputs"] = {name: np.asarray(column).tolist() for name, column in table.inputs.items()}
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _ndarray(array):
+    """以 little-endian 位元組傳送 NumPy 陣列（client 以 numpy.frombuffer(data, dtype).reshape(shape) 還原）。"""
+    array = np.ascontiguousarray(array, dtype="<f8")
+    return {"dtype": "<f8", "shape": list(array.shape), "data": array.data.cast("B")}
+
+
+def _msgpack(table):
+    units, unit_index = table.unit_dictionary()
+    body = {
+        **table.meta,
+        "count": len(table.values),
+        "categories": table.categories,
+        "units": units,
+        "unit_index": unit_index,
+        "values": _ndarray(table.values),
+    }
+    if table.labels is not None:
+        body["labels"] = table.labels
+    if table.inputs:
+        body["inputs"] = {name: _ndarray(column) for name, column in table.inputs.items()}
+    return msgpack.packb(body, use_bin_type=True)
+
+
+def _arrow(table):
+    columns, fields = [], []
+    if table.labels is not None:
+        columns.append(pa.array(table.labels, type=pa.string()))
+        fields.append(pa.field("label", pa.string()))
+    for name, column in table.inputs.items():
+        columns.append(pa.array(np.asarray(column, dtype=np.float64)))
+        fields.append(pa.field(name, pa.float64(), metadata={"role": "input"}))
+    for category, unit, column in zip(table.categories, table.units, table.values.T):
+        # 矩陣的欄不是連續記憶體：複製成連續陣列後 pa.array 不必再轉換
+        columns.append(pa.array(np.ascontiguousarray(column)))
+        fields.append(pa.field(category, pa.float64(), metadata={"role": "impact", "unit": unit}))
+    metadata = {k: json.dumps(v, ensure_ascii=False) for k, v in table.meta.items()}
+    batch = pa.RecordBatch.from_arrays(columns, schema=pa.schema(fields, metadata=metadata))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {COLUMNAR: _columnar, MSGPACK: _msgpack, ARROW: _arrow}
+
+
+def encode(table, media_type):
+    """把 ResultTable 序列化為 media_type（COLUMNAR / MSGPACK / ARROW）的位元組。"""
+    return ENCODERS[media_type](table)
+
+# endregion
+
+
+# region: 壓縮
+
+def choose_encoding(accept_encodings):
+    """依 Accept-Encoding（werkzeug 的 Accept）選擇 zstd 或 gzip；都不接受時回傳 None。"""
+    if zstandard is not None and accept_encodings.quality("zstd") > 0:
+        return "zstd"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+# endregion
@@ -0,0 +1,234 @@
+"""result_cache.py
+
+簡介：
+- 以「標準化後的計算輸入」為鍵，快取 openLCA 計算結果，相同的 (模型, 方法, 參數, amount) 不必重算。
+- 鍵值：CalculationSetup 轉成 dict 後排序、數值統一為 float 並四捨五入到 12 位有效數字，再取 SHA-256。
+- 記憶體中以 LRU 淘汰，並支援 TTL 過期；可選擇寫入本機 SQLite 檔案，重新啟動後仍可命中。
+- SQLite 使用 WAL，多個 worker 行程可以同時讀取；讀取時不寫入檔案，最後存取時間累積後隨下一次寫入批次更新。
+- SQLite 發生錯誤（檔案被鎖住、磁碟已滿…）時只記錄警告，快取退回只使用記憶體，不影響計算。
+
+可客製化項目：
+- maxsize：記憶體中最多保留幾筆（0 表示停用快取）
+- ttl：結果有效秒數（None 表示永不過期）
+- path：SQLite 檔案路徑（None 表示只使用記憶體）
+- DB_TIMEOUT：等待其他行程寫入交易的秒數
+- TOUCH_BATCH：累積多少筆最後存取時間後寫回檔案
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DB_TIMEOUT = 30
+TOUCH_BATCH = 100
+
+
+def _normalize(value):
+    """遞迴標準化：dict 依 key 排序、數值轉為 float（12 位有效數字）。"""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(f"{float(value):.12g}")
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return str(value)
+
+
+def _strip_ref(ref):
+    """參照只保留 @id（沒有 @id 時保留 name），忽略描述性欄位。"""
+    if not isinstance(ref, dict):
+        return ref
+    if ref.get("@id"):
+        return {"@id": ref["@id"]}
+    return {"name": ref.get("name")}
+
+
+def make_key(setup, version=None):
+    """產生 CalculationSetup 的標準化雜湊鍵。
+
+    version 可傳入模型的 (version, lastChange)，模型更新後舊結果就不會再命中。
+    """
+    data = setup.to_dict() if hasattr(setup, "to_dict") else dict(setup)
+    for field in ("target", "impactMethod", "unit", "flowProperty", "nwSet"):
+        if field in data:
+            data[field] = _strip_ref(data[field])
+    # 參數重新定義的順序不影響結果，依 (context, name) 排序
+    params = [
+        {"name": p.get("name"), "context": _strip_ref(p.get("context")), "value": p.get("value")}
+        for p in data.get("parameters") or []
+    ]
+    data["parameters"] = sorted(params, key=lambda p: (json.dumps(p["context"], sort_keys=True), p["name"] or ""))
+    data["version"] = version
+    canonical = json.dumps(_normalize(data), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """有上限的 LRU + TTL 結果快取，可選擇以 SQLite 持久化。"""
+
+    def __init__(self, maxsize=1024, ttl=3600, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        # 從檔案讀到的鍵 → 最後存取時間，等下一次寫入時一起更新
+        self._touched = {}
+        self._db = None
+        if path and maxsize > 0:
+            self._db = self._connect(path)
+
+    @staticmethod
+    def _connect(path):
+        # timeout：多個 worker 行程同時寫入時等待對方的交易結束
+        db = sqlite3.connect(path, timeout=DB_TIMEOUT, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        db.commit()
+        return db
+
+    def reopen(self):
+        """重新建立 SQLite 連線（fork 出的 worker 行程不能沿用父行程的連線）；記憶體中的快取保留。"""
+        with self._lock:
+            if self._db is not None:
+                self._db = self._connect(self.path)
+                self._touched.clear()
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    key = staticmethod(make_key)
+
+    def get(self, key):
+        """取得快取結果；未命中或已過期時回傳 None。"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self._expired(item[1], now):
+                del self._items[key]
+                item = None
+            if item is None and self._db is not None:
+                item = self._load(key, now)
+                if item is not None:
+                    self._store(key, item)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(item[0])
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._store(key, (copy.deepcopy(value), now))
+            if self._db is None:
+                return
+            self._touched.pop(key, None)
+            try:
+                self._flush_touched()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now),
+                )
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._prune_db(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("result cache write failed: %s", e)
+                self._rollback()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._touched.clear()
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM results")
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning("result cache clear failed: %s", e)
+                    self._rollback()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "evictions": self.evictions,
+            }
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def _store(self, key, item):
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self, key, now):
+        """從檔案讀取一筆；過期的資料留給 _prune_db 刪除，讀取路徑不寫入檔案（存取時間批次更新）。"""
+        try:
+            row = self._db.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("result cache read failed: %s", e)
+            return None
+        if row is None or self._expired(row[1], now):
+            return None
+        self._touched[key] = now
+        if len(self._touched) >= TOUCH_BATCH:
+            try:
+                self._flush_touched()
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("result cache write failed: %s", e)
+                self._rollback()
+        return json.loads(row[0]), row[1]
+
+    def _flush_touched(self):
+        if self._touched:
+            touched, self._touched = self._touched, {}
+            self._db.executemany("UPDATE results SET accessed = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+
+    def _rollback(self):
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _prune_db(self, now):
+        """刪除過期資料，並讓檔案中的筆數不超過 maxsize（依最後存取時間淘汰；呼叫前已寫回累積的存取時間）。"""
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM results WHERE key NOT IN (SELECT key FROM results ORDER BY accessed DESC LIMIT ?)",
+            (self.maxsize,),
+        )
@@ -0,0 +1,263 @@
+"""serve.py
+
+簡介：
+- 正式環境的啟動入口：以多個 worker 行程 × 每個行程多個執行緒提供 my_flask1 服務，
+  取代 app.run() 的單行程開發伺服器（debug 與自動重新載入都不會啟用）。
+- 有安裝 gunicorn 時使用 gunicorn（gthread worker + preload_app）；否則使用內建的 prefork 伺服器（需要 os.fork）：
+  主行程綁定 socket、預先解析模型中繼資料後 fork 出 worker，worker 異常結束時自動補上。
+- 每個 worker 有自己的 openLCA IPC 連線池（第一次使用或暖機時建立），不同行程的請求不會共用同一個 socket；
+  模型中繼資料在 fork 前解析，各 worker 以 copy-on-write 共用這份唯讀快照。
+- 收到 SIGTERM / SIGINT 時優雅關閉：停止接收新連線、等待進行中的請求，最後 dispose 尚未釋放的 openLCA 結果。
+- 指標（/metrics）與記憶體中的結果快取是每個 worker 各自的。
+
+用法：
+    python serve.py                                   # 預設 worker 數 = CPU 核心數
+    python serve.py --workers 4 --threads 8 --bind 0.0.0.0:5001
+    python serve.py --engine prefork                  # 不使用 gunicorn
+
+可客製化項目：
+- SERVE_WORKERS / SERVE_THREADS / SERVE_BIND / SERVE_GRACEFUL_TIMEOUT / SERVE_ENGINE（對應命令列參數）
+- OPENLCA_IPC_CONCURRENCY、JOB_WORKERS 等設定是「每個 worker」的值，總並行數要乘上 worker 數
+- 串流回應（/sweep、/import、/jobs/<id>/events）會在傳輸期間佔住一個執行緒：my_flask1 以 STREAM_MAX_CONCURRENT 限制
+  每個 worker 的串流數（預設為 --threads 的一半），其餘執行緒保留給一般請求
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger("serve")
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # 每個連線處理完一個請求就關閉：閒置的 keep-alive 連線不會佔住有限的執行緒（長連線請交給前端的反向代理）
+    protocol_version = "HTTP/1.0"
+
+
+class _PooledWSGIServer(BaseWSGIServer):
+    """同時最多以 threads 個執行緒處理請求的 werkzeug server。
+
+    ThreadedWSGIServer 每個連線開一個新執行緒、沒有上限；這裡所有執行緒都忙碌時暫停 accept()，
+    連線會留在共用的 listen socket 上，由其他有空的 worker 接手。
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads=8, fd=None):
+        self._slots = threading.BoundedSemaphore(threads)
+        self._active = 0
+        self._idle = threading.Condition()
+        super().__init__(host, port, app, handler=_RequestHandler, fd=fd)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        with self._idle:
+            self._active += 1
+        threading.Thread(target=self._process, args=(request, client_address), daemon=True).start()
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._idle:
+                self._active -= 1
+                self._idle.notify_all()
+            self._slots.release()
+
+    def drain(self, timeout):
+        """等待進行中的請求完成，回傳是否全部完成。"""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._active and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+            return self._active == 0
+
+
+# region: 內建 prefork 伺服器
+
+def _serve(app_module, server, timeout):
+    """在目前行程執行 server 直到收到 SIGTERM / SIGINT，接著優雅關閉。"""
+    def stop(signum, frame):
+        logger.info("worker %d received signal %d, shutting down", os.getpid(), signum)
+        # shutdown() 會等待 serve_forever() 結束，不能在執行 serve_forever() 的主執行緒中直接呼叫
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        deadline = time.monotonic() + timeout
+        if not server.drain(timeout):
+            logger.warning("worker %d: requests still running after %.1fs", os.getpid(), timeout)
+        app_module.shutdown(timeout=max(1.0, deadline - time.monotonic()))
+
+
+def _run_worker(app_module, sock, host, port, threads, timeout):
+    app_module.after_fork()
+    server = _PooledWSGIServer(host, port, app_module.app, threads=threads, fd=sock.fileno())
+    logger.info("worker %d serving with %d threads", os.getpid(), threads)
+    _serve(app_module, server, timeout)
+
+
+def _spawn(app_module, sock, host, port, threads, timeout):
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        _run_worker(app_module, sock, host, port, threads, timeout)
+    except BaseException:
+        logger.exception("worker %d crashed", os.getpid())
+        code = 1
+    finally:
+        logging.shutdown()
+        os._exit(code)
+
+
+def run_prefork(app_module, host, port, workers, threads, timeout):
+    """主行程綁定 socket 並預先解析中繼資料，fork 出 workers 個 worker，直到收到 SIGTERM / SIGINT。"""
+    sock = socket.create_server((host, port), backlog=1024)
+    preloaded = app_module.preload_metadata()
+    logger.info("listening on %s:%d, %d workers x %d threads, preloaded models: %s",
+                host, port, workers, threads, ", ".join(preloaded) or "none")
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+    children = {}
+    for _ in range(workers):
+        children[_spawn(app_module, sock, host, port, threads, timeout)] = time.monotonic()
+
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if not pid:
+            time.sleep(0.5)
+            continue
+        started = children.pop(pid, None)
+        if stopping:
+            break
+        logger.warning("worker %d exited with status %d, restarting", pid, os.waitstatus_to_exitcode(status))
+        if started is not None and time.monotonic() - started < 1.0:
+            # 啟動後立即結束（例如設定錯誤）：稍等再重啟，避免不斷 fork
+            time.sleep(1.0)
+        children[_spawn(app_module, sock, host, port, threads, timeout)] = time.monotonic()
+
+    logger.info("stopping %d workers", len(children))
+    sock.close()
+    for pid in children:
+        _kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout * 2 + 5
+    while children and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in children:
+        logger.warning("worker %d did not exit in time, killing", pid)
+        _kill(pid, signal.SIGKILL)
+
+
+def _kill(pid, sig):
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
+
+# endregion
+
+
+def run_gunicorn(app_module, bind, workers, threads, timeout):
+    """以 gunicorn（gthread worker）執行；中繼資料在 preload 時解析，各 worker fork 後各自建立連線。"""
+    from gunicorn.app.base import BaseApplication
+
+    options = {
+        "bind": bind,
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "preload_app": True,
+        "graceful_timeout": timeout,
+        "post_fork": lambda server, worker: app_module.after_fork(),
+        "worker_exit": lambda server, worker: app_module.shutdown(timeout=timeout),
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            preloaded = app_module.preload_metadata()
+            logger.info("preloaded models: %s", ", ".join(preloaded) or "none")
+            return app_module.app
+
+    Application().run()
+
+
+def _parse_bind(bind):
+    host, _, port = bind.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以多個 worker 行程執行 my_flask1")
+    parser.add_argument("--bind", default=os.environ.get("SERVE_BIND", "0.0.0.0:5001"), help="host:port")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SERVE_WORKERS", "0")) or os.cpu_count() or 1,
+                        help="worker 行程數（預設為 CPU 核心數）")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("SERVE_THREADS", "8")),
+                        help="每個 worker 的執行緒數")
+    parser.add_argument("--graceful-timeout", type=float,
+                        default=float(os.environ.get("SERVE_GRACEFUL_TIMEOUT", "30")),
+                        help="關閉時等待進行中請求的秒數")
+    parser.add_argument("--engine", choices=("auto", "gunicorn", "prefork"),
+                        default=os.environ.get("SERVE_ENGINE", "auto"))
+    args = parser.parse_args(argv)
+
+    # 暖機改由各 worker 在 fork 之後啟動（主行程不處理請求，也不應該持有連線或背景執行緒）
+    os.environ["WARMUP_AUTOSTART"] = "0"
+    # 串流回應的上限（STREAM_MAX_CONCURRENT）預設依每個 worker 的執行緒數計算
+    os.environ["SERVE_THREADS"] = str(args.threads)
+    import my_flask1
+
+    engine = args.engine
+    if engine == "auto":
+        try:
+            import gunicorn  # noqa: F401
+            engine = "gunicorn"
+        except ImportError:
+            engine = "prefork"
+    if engine == "gunicorn":
+        run_gunicorn(my_flask1, args.bind, args.workers, args.threads, args.graceful_timeout)
+        return 0
+
+    host, port = _parse_bind(args.bind)
+    if not hasattr(os, "fork"):
+        logger.warning("os.fork is not available on this platform; serving with a single process")
+        my_flask1.after_fork()
+        server = _PooledWSGIServer(host, port, my_flask1.app, threads=args.threads)
+        _serve(my_flask1, server, args.graceful_timeout)
+        return 0
+    run_prefork(my_flask1, host, port, args.workers, args.threads, args.graceful_timeout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
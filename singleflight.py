@@ -0,0 +1,88 @@
+"""singleflight.py
+
+簡介：
+- SingleFlight：相同鍵值的並行呼叫只執行一次，其他呼叫者等待並共用同一個結果；
+  執行失敗時，同一個例外會丟給所有等待者。
+- my_flask1 以 result_cache 的鍵值（標準化後的 CalculationSetup）呼叫 do()：參數相同的請求同時到達
+  （例如多個 client 同時送出、或重複點擊比較按鈕）時只送出一次 openLCA 計算。
+- 每個鍵值有逾時：等待者最多等 timeout 秒（丟出 SingleFlightTimeout）；已執行超過 timeout 的計算
+  不再讓新的呼叫者共用，新的呼叫者會重新計算。
+
+可客製化項目：
+- timeout：預設的逾時秒數（None 表示不逾時），可在 do() 中針對單一鍵值覆寫
+"""
+
+import threading
+import time
+
+from metrics import REGISTRY
+
+CALLS = REGISTRY.counter(
+    "lca_singleflight_calls_total", "Calls through the single-flight layer by outcome.", ("outcome",))
+
+
+class SingleFlightTimeout(TimeoutError):
+    """等待共用的計算逾時。"""
+
+
+class _Call:
+    __slots__ = ("started", "done", "result", "error", "waiters")
+
+    def __init__(self, started):
+        self.started = started
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合併相同鍵值的並行呼叫。"""
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """執行 fn()（或等待進行中的相同呼叫），回傳 (結果, 是否共用其他呼叫者的結果)。"""
+        timeout = self.timeout if timeout is None else timeout
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None or (timeout is not None and now - call.started >= timeout)
+            if leader:
+                call = self._calls[key] = _Call(now)
+            else:
+                call.waiters += 1
+
+        if leader:
+            CALLS.inc(outcome="leader")
+            try:
+                call.result = fn()
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+
+        CALLS.inc(outcome="shared")
+        remaining = None if timeout is None else max(0.0, call.started + timeout - time.monotonic())
+        if not call.done.wait(remaining):
+            CALLS.inc(outcome="timeout")
+            raise SingleFlightTimeout(f"等待相同參數的計算逾時（{timeout} 秒）")
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "waiters": sum(c.waiters for c in self._calls.values()),
+                "timeout": self.timeout,
+            }
@@ -0,0 +1,331 @@
+"""supabase_writer.py
+
+簡介：
+- 非同步 (write-behind) 寫入 Supabase：請求只把資料放進有上限的佇列就回應，不再等待兩次網路寫入。
+- 背景執行緒把佇列中的資料合併成多筆一次的 insert：先批次寫入 IPCC table，再依模型分組寫入 Co2 table。
+- IPCC 的 id 在本機以 uuid 產生，Co2 資料的 CarbonEmissionID 直接引用，不必等待 IPCC insert 的回傳值。
+- 寫入失敗時以指數退避重試；仍失敗（或佇列已滿）時寫入本機 journal 檔 (NDJSON)，之後自動重送。
+- 多個 worker 行程（serve.py）共用同一個 journal：寫入與認領以 <journal>.lock 的 fcntl.flock 互斥，
+  重送時先把 journal 改名為各行程專屬的 <journal>.replay-<pid>-<隨機碼> 並持有該檔的鎖；
+  行程中斷而留下（沒有行程持有鎖）的重送檔會在下一次重送時合併回 journal。
+- MemorySupabase 提供與 supabase client 相同用法（table(...).insert(...).execute()）的記憶體替代品，方便測試。
+
+可客製化項目：
+- batch_size / flush_interval：每批最多幾筆、最多等待幾秒就寫入
+- max_queue：佇列上限（超過時直接寫入 journal）
+- max_retries / backoff：重試次數與第一次重試前等待秒數（之後每次加倍）
+- journal_path：journal 檔路徑（None 表示不使用 journal，重試失敗的資料會被丟棄）
+- id_column：IPCC table 的主鍵欄位名稱（預設 "id"）
+"""
+
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+
+from metrics import stage
+
+# fcntl 只有 POSIX 提供；Windows 上只會有單一行程（serve.py 的 prefork 需要 os.fork），行程內的鎖已足夠
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _lock(handle, blocking=True):
+    """以 flock 鎖定已開啟的檔案（關閉檔案時釋放）；non-blocking 且已被其他行程鎖定時回傳 False。"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+@dataclass
+class WriteRecord:
+    """一筆待寫入的資料；已寫入的部分會被設為 None，重試時只送剩下的部分。"""
+
+    ipcc: dict | None
+    co2_table: str | None
+    co2: dict | None
+
+    def to_json(self):
+        return json.dumps({"ipcc": self.ipcc, "co2_table": self.co2_table, "co2": self.co2}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line):
+        data = json.loads(line)
+        return cls(data.get("ipcc"), data.get("co2_table"), data.get("co2"))
+
+
+class SupabaseWriter:
+    """以背景執行緒批次寫入 Supabase 的 write-behind 佇列。"""
+
+    def __init__(self, client, ipcc_table, batch_size=100, flush_interval=1.0, max_queue=10000,
+                 max_retries=5, backoff=0.5, journal_path=None, id_column="id", replay_interval=30.0):
+        self.client = client
+        self.ipcc_table = ipcc_table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.journal_path = journal_path
+        self.id_column = id_column
+        self.replay_interval = replay_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._thread = None
+        self._journal_lock = threading.Lock()
+        # 本行程正在重送的檔案（沒有 fcntl 時用來避免把自己正在重送的檔案當成中斷留下的檔案）
+        self._replaying = set()
+        self._last_replay = 0.0
+        self.written = 0
+        self.journaled = 0
+        self.failures = 0
+        self.last_error = None
+
+    def submit(self, ipcc_row, co2_table, co2_row, block=False, timeout=None):
+        """把一筆資料放進佇列，回傳本機產生的 IPCC id（不會等待資料庫）。
+
+        block=True 時佇列已滿會等待（最多 timeout 秒）背景執行緒消化，大量匯入時用來限制生產速度。
+        """
+        ipcc_id = str(uuid.uuid4())
+        ipcc = {**ipcc_row, self.id_column: ipcc_id}
+        co2 = {**co2_row, "CarbonEmissionID": ipcc_id} if co2_row is not None else None
+        record = WriteRecord(ipcc, co2_table, co2)
+        try:
+            self._queue.put(record, block=block, timeout=timeout)
+        except queue.Full:
+            # 佇列已滿：直接寫入 journal，讓請求不被資料庫拖慢
+            self._journal([record])
+        return ipcc_id
+
+    # region: 背景執行緒
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name="supabase-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """停止背景執行緒，並在 timeout 內盡量寫完佇列中剩下的資料。"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        remaining = self._drain(block=False, limit=None)
+        if remaining:
+            self._journal(remaining)
+
+    def flush(self):
+        """同步寫入佇列中所有資料（測試或關閉時使用）。"""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+            if self.journal_path and time.monotonic() - self._last_replay >= self.replay_interval:
+                self._last_replay = time.monotonic()
+                self.replay()
+
+    def _drain(self, block, limit=-1):
+        """從佇列取出一批資料；block 時最多等待 flush_interval 秒。"""
+        limit = self.batch_size if limit == -1 else limit
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while limit is None or len(batch) < limit:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # endregion
+
+    # region: 寫入
+
+    def _write(self, records):
+        """寫入一批資料，失敗時重試；重試用盡則寫入 journal。回傳是否成功。"""
+        attempt = 0
+        while True:
+            try:
+                self._insert_batch(records)
+                self.written += len(records)
+                return True
+            except Exception as e:
+                attempt += 1
+                self.failures += 1
+                self.last_error = str(e)
+                logger.warning("Supabase batch insert failed (attempt %d): %s", attempt, e)
+                if attempt > self.max_retries or self._stopped.wait(self.backoff * 2 ** (attempt - 1)):
+                    self._journal([r for r in records if r.ipcc is not None or r.co2 is not None])
+                    return False
+
+    def _insert_batch(self, records):
+        # 1) IPCC table：一次寫入整批（以 upsert 避免重試時重複）
+        ipcc_rows = [r for r in records if r.ipcc is not None]
+        if ipcc_rows:
+            with stage("supabase_insert_ipcc"):
+                self._execute(self.client.table(self.ipcc_table).upsert([r.ipcc for r in ipcc_rows]))
+            for r in ipcc_rows:
+                r.ipcc = None
+
+        # 2) Co2 table：依 table 分組後各自一次寫入
+        groups = defaultdict(list)
+        for r in records:
+            if r.co2 is not None and r.co2_table:
+                groups[r.co2_table].append(r)
+        for table, group in groups.items():
+            with stage("supabase_insert_co2"):
+                self._execute(self.client.table(table).insert([r.co2 for r in group]))
+            for r in group:
+                r.co2 = None
+
+    @staticmethod
+    def _execute(query):
+        res = query.execute()
+        if isinstance(res, dict) and res.get("error"):
+            raise RuntimeError(str(res.get("error")))
+        return res
+
+    # endregion
+
+    # region: journal
+
+    def _journal(self, records):
+        if not records:
+            return
+        if not self.journal_path:
+            logger.error("Supabase writer: dropped %d records (no journal configured)", len(records))
+            return
+        with self._journal_lock, open(self.journal_path + ".lock", "a") as lock:
+            _lock(lock)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                for r in records:
+                    f.write(r.to_json() + "\n")
+            self.journaled += len(records)
+
+    def _claim_journal(self):
+        """把 journal 改名為本行程專屬的重送檔並鎖定，回傳 (路徑, 持有鎖的檔案)；沒有資料時回傳 None。"""
+        with self._journal_lock, open(self.journal_path + ".lock", "a") as lock:
+            _lock(lock)
+            # 其他行程（或上次執行）中斷時留下的重送檔：沒有行程持有鎖的才合併回 journal
+            for orphan in glob.glob(glob.escape(self.journal_path) + ".replay*"):
+                if orphan in self._replaying:
+                    continue
+                with open(orphan, encoding="utf-8") as src:
+                    if not _lock(src, blocking=False):
+                        continue
+                    with open(self.journal_path, "a", encoding="utf-8") as dst:
+                        dst.write(src.read())
+                    os.remove(orphan)
+            if not os.path.exists(self.journal_path) or not os.path.getsize(self.journal_path):
+                return None
+            claimed = f"{self.journal_path}.replay-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            os.replace(self.journal_path, claimed)
+            handle = open(claimed, encoding="utf-8")
+            _lock(handle)
+            self._replaying.add(claimed)
+        return claimed, handle
+
+    def replay(self):
+        """重送 journal 中的資料；仍失敗的資料會重新寫回 journal。回傳重送成功的筆數。"""
+        if not self.journal_path:
+            return 0
+        claim = self._claim_journal()
+        if claim is None:
+            return 0
+        claimed, handle = claim
+        sent = 0
+        try:
+            batch = []
+            for line in handle:
+                if line.strip():
+                    batch.append(WriteRecord.from_json(line))
+                if len(batch) >= self.batch_size:
+                    sent += len(batch) if self._write(batch) else 0
+                    batch = []
+            if batch:
+                sent += len(batch) if self._write(batch) else 0
+            os.remove(claimed)
+        finally:
+            handle.close()
+            self._replaying.discard(claimed)
+        return sent
+
+    # endregion
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "journaled": self.journaled,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "journal_pending": bool(self.journal_path and os.path.exists(self.journal_path)),
+        }
+
+
+class MemorySupabase:
+    """記憶體中的 Supabase 替代品，只實作 writer 用到的 table().insert/upsert().execute()。
+
+    fail_next 設為 n 時，接下來 n 次 execute() 會丟出例外（模擬資料庫無法連線）。
+    """
+
+    def __init__(self):
+        self.tables = defaultdict(list)
+        self.fail_next = 0
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return _MemoryTable(self, name)
+
+
+class _MemoryTable:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self._rows = []
+        self._upsert = False
+
+    def insert(self, rows):
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows):
+        self._upsert = True
+        return self.insert(rows)
+
+    def execute(self):
+        with self.db._lock:
+            if self.db.fail_next > 0:
+                self.db.fail_next -= 1
+                raise ConnectionError("MemorySupabase: simulated failure")
+            table = self.db.tables[self.name]
+            for row in self._rows:
+                if self._upsert and "id" in row:
+                    table[:] = [r for r in table if r.get("id") != row["id"]]
+                table.append(dict(row))
+            return {"data": [dict(r) for r in self._rows]}
@@ -0,0 +1,355 @@
+"""sweep.py
+
+簡介：
+- 參數掃描 (grid sweep) 與蒙地卡羅 (Monte Carlo) 敏感度分析的共用工具。
+- 取樣點以 generator 逐一產生（grid 用 itertools.product，蒙地卡羅用 NumPy 亂數），不會一次建立全部樣本。
+- bounded_imap() 以固定數量的進行中工作把樣本送進執行緒池，結果完成一筆就回傳一筆，記憶體用量與樣本數無關。
+- SweepSummary 以增量方式計算統計量：平均、標準差、最小/最大值（Welford）、百分位數（P² 演算法）、
+  各參數與結果的相關係數，以及 grid 掃描的單因子 (one-at-a-time) 主效應。
+
+可客製化項目：
+- PERCENTILES：回報的百分位數
+- MAX_LEVELS：單因子主效應每個參數最多追蹤幾個不同數值
+"""
+
+import itertools
+import math
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+PERCENTILES = (5, 25, 50, 75, 95)
+MAX_LEVELS = 1000
+
+
+# region: 取樣
+
+def _axis_length(spec):
+    """grid 單一參數的取值數，只以算術計算、不建立數值列表（先檢查樣本數上限，再產生樣本）。"""
+    if isinstance(spec, (list, tuple)):
+        return len(spec)
+    if isinstance(spec, dict):
+        start, stop = float(spec["start"]), float(spec["stop"])
+        try:
+            if "num" in spec:
+                return int(spec["num"])
+            step = float(spec["step"])
+            if not step > 0:
+                raise ValueError("step 必須大於 0")
+            return int(math.floor((stop - start) / step + 1e-9)) + 1
+        except OverflowError:
+            raise ValueError("grid 參數的取值數過多")
+    return 1
+
+
+def _levels(spec):
+    """grid 的參數值：可為數值陣列，或 {start, stop, num} / {start, stop, step}。"""
+    if isinstance(spec, (list, tuple)):
+        return [float(v) for v in spec]
+    if isinstance(spec, dict):
+        start, stop = float(spec["start"]), float(spec["stop"])
+        count = _axis_length(spec)
+        if "num" in spec:
+            return np.linspace(start, stop, count).tolist()
+        step = float(spec["step"])
+        return [start + i * step for i in range(count)]
+    return [float(spec)]
+
+
+def grid_size(grid):
+    """grid 的組合數；任一參數沒有取值時丟出 ValueError。"""
+    try:
+        lengths = [_axis_length(spec) for spec in grid.values()]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"參數設定不完整: {e}")
+    if any(n < 1 for n in lengths):
+        raise ValueError("grid 參數至少需要一個值")
+    return math.prod(lengths)
+
+
+def grid_points(base, grid):
+    """依序產生 grid 中每個組合（其他欄位取 base 的值）。"""
+    names = list(grid)
+    levels = [_levels(grid[n]) for n in names]
+    for combo in itertools.product(*levels):
+        yield {**base, **dict(zip(names, combo))}
+
+
+def _sampler(rng, spec):
+    """把分布設定轉成 sampler(size) 函式。"""
+    kind = spec.get("type", "uniform")
+    if kind == "uniform":
+        return lambda n: rng.uniform(spec["min"], spec["max"], n)
+    if kind == "normal":
+        return lambda n: rng.normal(spec["mean"], spec["sd"], n)
+    if kind == "lognormal":
+        # gmean / gsd：幾何平均與幾何標準差（與 openLCA 的 log-normal 定義相同）
+        return lambda n: rng.lognormal(math.log(spec["gmean"]), math.log(spec["gsd"]), n)
+    if kind == "triangular":
+        return lambda n: rng.triangular(spec["min"], spec["mode"], spec["max"], n)
+    if kind == "fixed":
+        return lambda n: np.full(n, float(spec["value"]))
+    raise ValueError(f"不支援的分布類型: {kind}")
+
+
+def integer(value, name, minimum=1):
+    """請求中的整數設定（samples、summary_every…）；不是整數或小於 minimum 時丟出 ValueError。"""
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} 必須是整數")
+    if not number.is_integer() or number < minimum:
+        raise ValueError(f"{name} 必須是大於或等於 {minimum} 的整數")
+    return int(number)
+
+
+def _finite(value):
+    if isinstance(value, bool):
+        raise TypeError(f"不是數值: {value}")
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"不是有限數值: {value}")
+    return value
+
+
+def validate(grid=None, distributions=None):
+    """在開始串流前檢查 grid / 分布設定，錯誤時丟出 ValueError。
+
+    grid 只檢查取值數與明確列出的數值，不展開 {start, stop, num|step}（樣本數上限要在產生樣本前檢查）。
+    """
+    try:
+        for spec in (grid or {}).values():
+            if isinstance(spec, (list, tuple)):
+                [_finite(v) for v in spec]
+            elif isinstance(spec, dict):
+                [_finite(spec[k]) for k in ("start", "stop", "num", "step") if k in spec]
+            else:
+                _finite(spec)
+        if grid:
+            grid_size(grid)
+        rng = np.random.default_rng(0)
+        for name, spec in (distributions or {}).items():
+            if not isinstance(spec, dict):
+                raise ValueError(f"{name} 的分布設定必須是物件")
+            sample = _sampler(rng, spec)(1)
+            if not np.isfinite(sample).all():
+                raise ValueError(f"{name} 的分布設定產生了非有限數值")
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"參數設定不完整: {e}")
+
+
+def monte_carlo_points(base, distributions, samples, seed=None, chunk=1024):
+    """產生蒙地卡羅樣本：每次以 NumPy 抽一小段 (chunk)，再逐筆輸出。"""
+    rng = np.random.default_rng(seed)
+    names = list(distributions)
+    samplers = [_sampler(rng, distributions[n]) for n in names]
+    remaining = samples
+    while remaining > 0:
+        size = min(chunk, remaining)
+        columns = [s(size) for s in samplers]
+        for i in range(size):
+            yield {**base, **{n: float(c[i]) for n, c in zip(names, columns)}}
+        remaining -= size
+
+
+def chunked(iterable, size):
+    """把 generator 切成固定大小的 list。"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bounded_imap(executor, fn, iterable, max_in_flight):
+    """以最多 max_in_flight 個進行中工作執行 fn，依完成順序回傳 (item, result, exception)。"""
+    pending = {}
+    iterator = iter(iterable)
+    for item in itertools.islice(iterator, max_in_flight):
+        pending[executor.submit(fn, item)] = item
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            item = pending.pop(future)
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+            for nxt in itertools.islice(iterator, 1):
+                pending[executor.submit(fn, nxt)] = nxt
+
+# endregion
+
+
+# region: 增量統計
+
+class P2Quantile:
+    """P² 演算法：以 5 個標記點估計百分位數，記憶體固定 (Jain & Chlamtac, 1985)。"""
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.q = []
+        self.n = [0, 1, 2, 3, 4]
+        self.np = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.dn = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self.q
+        self.count += 1
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            self.n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+        for i in (1, 2, 3):
+            d = self.np[i] - self.n[i]
+            if (d >= 1 and self.n[i + 1] - self.n[i] > 1) or (d <= -1 and self.n[i - 1] - self.n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = self._parabolic(i, d)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + d * (q[i + d] - q[i]) / (self.n[i + d] - self.n[i])
+                q[i] = candidate
+                self.n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if not self.q:
+            return None
+        if self.count <= 5:
+            # 前 5 筆保存的是排序後的完整樣本，直接取精確的百分位數；之後才使用 P² 的中間標記
+            index = min(len(self.q) - 1, max(0, int(round(self.p * (len(self.q) - 1)))))
+            return self.q[index]
+        return self.q[2]
+
+
+class RunningStats:
+    """Welford 演算法：平均、變異數、最小/最大值。"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    @property
+    def sd(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class _Covariance:
+    """參數 x 與結果 y 的增量共變異數（用於相關係數）。"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.cxy = 0.0
+        self.cxx = 0.0
+        self.cyy = 0.0
+
+    def add(self, x, y):
+        self.count += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.count
+        dy = y - self.mean_y
+        self.mean_y += dy / self.count
+        self.cxy += dx * (y - self.mean_y)
+        self.cxx += dx * (x - self.mean_x)
+        self.cyy += dy * (y - self.mean_y)
+
+    def correlation(self):
+        if self.cxx <= 0 or self.cyy <= 0:
+            return None
+        return self.cxy / math.sqrt(self.cxx * self.cyy)
+
+
+class SweepSummary:
+    """各衝擊類別的增量統計與各參數的敏感度。"""
+
+    def __init__(self, parameters, percentiles=PERCENTILES):
+        self.parameters = list(parameters)
+        self.percentiles = percentiles
+        self.count = 0
+        self.errors = 0
+        self._stats = {}
+        self._quantiles = {}
+        self._cov = {}
+        self._levels = {}
+
+    def add(self, inputs, impacts):
+        self.count += 1
+        for impact in impacts:
+            category, y = impact["category"], impact["value"]
+            if category not in self._stats:
+                self._stats[category] = RunningStats()
+                self._quantiles[category] = [P2Quantile(p / 100) for p in self.percentiles]
+                self._cov[category] = {name: _Covariance() for name in self.parameters}
+                self._levels[category] = {name: {} for name in self.parameters}
+            self._stats[category].add(y)
+            for q in self._quantiles[category]:
+                q.add(y)
+            for name in self.parameters:
+                x = float(inputs[name])
+                self._cov[category][name].add(x, y)
+                levels = self._levels[category][name]
+                if x in levels or len(levels) < MAX_LEVELS:
+                    total, count = levels.get(x, (0.0, 0))
+                    levels[x] = (total + y, count + 1)
+
+    def result(self):
+        categories = {}
+        for category, stats in self._stats.items():
+            sensitivity = {}
+            for name in self.parameters:
+                r = self._cov[category][name].correlation()
+                levels = self._levels[category][name]
+                means = [total / count for total, count in levels.values()]
+                sensitivity[name] = {
+                    "correlation": r,
+                    # 一階 Sobol 指標的估計：在參數獨立且模型近似線性時等於相關係數平方
+                    "first_order": r * r if r is not None else None,
+                    # 單因子主效應：各參數值下結果平均的最大差距（grid 掃描時有意義）
+                    "main_effect": (max(means) - min(means)) if len(means) > 1 and len(levels) < MAX_LEVELS else None,
+                }
+            categories[category] = {
+                "count": stats.count,
+                "mean": stats.mean,
+                "sd": stats.sd,
+                "min": stats.min,
+                "max": stats.max,
+                "percentiles": {f"p{p}": q.value() for p, q in zip(self.percentiles, self._quantiles[category])},
+                "sensitivity": sensitivity,
+            }
+        return {"count": self.count, "errors": self.errors, "categories": categories}
+
+# endregion
@@ -0,0 +1,43 @@
+"""測試共用的 fixture。
+
+client：以 fake_ipc_server 取代 openLCA、ipc 模式的 my_flask1 測試 client（整個測試階段共用一個）。
+my_flask1 在 import 時讀取環境變數，因此必須在 import 前設定好。
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def fake_ipc():
+    from fake_ipc_server import FakeIpcServer
+
+    server = FakeIpcServer(port=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="session")
+def app_module(fake_ipc):
+    os.environ.update(
+        LCA_BACKEND="ipc",
+        OPENLCA_IPC_ENDPOINTS=fake_ipc.url,
+        WARMUP_AUTOSTART="0",
+        SUPABASE_JOURNAL="",
+        HISTORY_PATH="",
+        RESULT_CACHE_PATH="",
+        LOG_LEVEL="ERROR",
+    )
+    import my_flask1
+
+    return my_flask1
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,28 @@
+"""依 amount 縮放快取的每單位結果（my_flask1._calculate_impacts）。
+
+執行：python -m pytest tests
+"""
+
+import pytest
+
+TKM = {"distance": 7, "factor": 2, "load": 3}
+
+
+def _calculate(client, amount, **overrides):
+    response = client.post("/calculate/Co2BYTKM", json={**TKM, **overrides, "amount": amount})
+    assert response.status_code == 200
+    return response.json
+
+
+def test_other_amounts_scale_the_cached_per_unit_result(client, app_module, fake_ipc):
+    app_module.result_cache.clear()
+    calculations = fake_ipc.stats()["calls"].get("result/calculate", {}).get("count", 0)
+    first = _calculate(client, 5, distance=11)
+    assert first["cache"]["source"] == "computed"
+    second = _calculate(client, 12.5, distance=11)
+    assert second["cache"]["hit"] and second["cache"]["source"] == "scaled"
+    assert first["impacts"][0]["value"] == pytest.approx(330.0)
+    assert second["impacts"][0]["value"] == pytest.approx(825.0)
+    # 所有衝擊類別都依相同比例縮放，只送出一次 openLCA 計算
+    assert [i["value"] / 12.5 for i in second["impacts"]] == pytest.approx([i["value"] / 5 for i in first["impacts"]])
+    assert fake_ipc.stats()["calls"]["result/calculate"]["count"] == calculations + 1
@@ -0,0 +1,39 @@
+"""/calculate/<model>/batch 的批次格式解析與驗證。
+
+執行：python -m pytest tests
+"""
+
+import json
+
+import pytest
+
+ROW = {"distance": 7, "factor": 2, "load": 3, "amount": 5}
+
+
+def _post(client, body):
+    # json.dumps 會把 float("nan") 輸出成 NaN（Python 的 json 解析也接受），模擬不嚴格的 client
+    return client.post("/calculate/Co2BYTKM/batch", data=json.dumps(body), content_type="application/json")
+
+
+@pytest.mark.parametrize("body", [
+    [ROW, {**ROW, "distance": 1}],
+    {"rows": [ROW, {**ROW, "distance": 1}]},
+    {"columns": {f: [v, 1 if f == "distance" else v] for f, v in ROW.items()}},
+])
+def test_batch_formats(client, body):
+    response = _post(client, body)
+    assert response.status_code == 200
+    assert response.json["count"] == 2
+    assert [row[0] for row in response.json["values"]] == [210.0, 30.0]
+
+
+@pytest.mark.parametrize("body", [
+    [{**ROW, "distance": float("nan")}],
+    [{**ROW, "load": "Infinity"}],
+    {"columns": {**{f: [v, v] for f, v in ROW.items()}, "factor": [2, float("nan")]}},
+    {"columns": {**{f: [v] for f, v in ROW.items()}, "amount": [float("-inf")]}},
+])
+def test_non_finite_values_are_rejected(client, body):
+    response = _post(client, body)
+    assert response.status_code == 400
+    assert "有限數值" in response.json["message"]
@@ -0,0 +1,50 @@
+"""bulk_import.py 的串流解析與驗證，以及 /import 的結果輸出。
+
+執行：python -m pytest tests
+"""
+
+import io
+import json
+import math
+
+import bulk_import
+from model_registry import ModelSpec, Param
+
+ROUTES = {"Co2BYTKM": ModelSpec("Co2BYTKM", "廚餘處理量", (
+    Param("factor", "cofficient"), Param("distance", "KM"), Param("load", "ton")))}
+
+
+def _records(text, fmt="csv"):
+    return list(bulk_import.read_records(io.BytesIO(text.encode()), fmt, ROUTES, "Co2BYTKM", chunk_size=2))
+
+
+def test_aliases_and_validation():
+    records = _records("KM,Coefficient,ton,amount,id\n1,2,3,4,a\n1,x,3,4,b\n1,2,nan,4,c\n")
+    assert [r.error is None for r in records] == [True, False, False]
+    assert records[0].inputs == {"factor": 2.0, "distance": 1.0, "load": 3.0, "amount": 4.0}
+    assert records[0].id == "a"
+    # 錯誤的資料保留原始值，方便對照上傳的檔案
+    assert records[1].inputs["factor"] == "x"
+    assert all(isinstance(r.error, str) for r in records[1:])
+
+
+def test_ndjson_lines_never_contain_nan():
+    line = bulk_import._line({"value": 1.0})
+    assert json.loads(line) == {"value": 1.0}
+    try:
+        bulk_import._line({"value": math.nan})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("NaN 不應輸出到 NDJSON")
+
+
+def test_import_route_bypasses_result_cache(client, app_module):
+    before = app_module.result_cache.stats()
+    response = client.post("/import?model=Co2BYTKM&persist=0&output=ndjson",
+                           data="distance,factor,load,amount\n201,2,3,4\n202,x,3,4\n", content_type="text/csv")
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line["type"] for line in lines if "index" in line) == ["error", "result"]
+    after = app_module.result_cache.stats()
+    assert (after["size"], after["misses"]) == (before["size"], before["misses"])
@@ -0,0 +1,57 @@
+"""cf_index.py 的索引建立與查詢（以小型的 JSON-LD 匯出測試）。
+
+執行：python -m pytest tests
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+import cf_index
+
+# 非 UUID 的長 ID：與另一個 ID 只在第 36 個字元之後不同
+LONG = "flow-" + "x" * 40 + "-long"
+SHORT = "00000000-0000-0000-0000-000000000001"
+PREFIX = LONG[:36]
+
+
+def _write(root, folder, uid, doc):
+    path = root / folder
+    path.mkdir(exist_ok=True)
+    (path / f"{uid}.json").write_text(json.dumps({"@id": uid, **doc}), encoding="utf-8")
+
+
+@pytest.fixture
+def root(tmp_path):
+    kg, t = "unit-kg", "unit-t-" + "y" * 40
+    _write(tmp_path, "unit_groups", "mass", {"units": [
+        {"@id": kg, "conversionFactor": 1.0}, {"@id": t, "conversionFactor": 1000.0}]})
+    for uid in (LONG, SHORT, PREFIX):
+        _write(tmp_path, "flows", uid, {"flowProperties": [{"flowProperty": {"@id": "mass-prop"}, "conversionFactor": 2.0}]})
+    _write(tmp_path, "lcia_categories", "gwp", {"impactFactors": [
+        {"flow": {"@id": LONG}, "value": 3.0, "unit": {"@id": t}, "flowProperty": {"@id": "mass-prop"}},
+        {"flow": {"@id": SHORT}, "value": 5.0, "unit": {"@id": kg}},
+    ]})
+    _write(tmp_path, "lcia_methods", "ipcc", {"name": "IPCC", "impactCategories": [{"@id": "gwp", "name": "GWP"}]})
+    return tmp_path
+
+
+def test_long_ids_are_not_truncated(root):
+    index = cf_index.load(str(root))
+    assert index.unit_factor("unit-t-" + "y" * 40) == 1000.0
+    assert index.property_factor(LONG, "mass-prop") == 2.0
+    assert index.property_factor(LONG + "?", "mass-prop") is None
+    c = index.matrix(["gwp"], [LONG, SHORT, PREFIX, "missing"]).toarray()
+    # 每 t 3.0 → 每 kg 0.003，再依流屬性換算係數 2.0 換算為流的參考單位 → 0.006
+    assert c == pytest.approx(np.array([[0.006, 5.0, 0.0, 0.0]]))
+    assert index.method_id(name="IPCC") == "ipcc"
+
+
+def test_index_is_reused_until_sources_change(root):
+    first = cf_index.load(str(root))
+    assert cf_index.load(str(root)).manifest == first.manifest
+    _write(root, "lcia_categories", "gwp", {"version": "2", "impactFactors": [{"flow": {"@id": LONG}, "value": 1.0}]})
+    index = cf_index.load(str(root))
+    assert index.manifest["content_fingerprint"] != first.manifest["content_fingerprint"]
+    assert index.matrix(["gwp"], [LONG]).toarray() == pytest.approx(np.array([[1.0]]))
@@ -0,0 +1,41 @@
+"""/compare 的輸入驗證與差值計算（fake_ipc_server：結果為 amount × 各參數的乘積）。
+
+執行：python -m pytest tests
+"""
+
+import json
+
+import pytest
+
+BASELINE = {"distance": 1, "factor": 2, "load": 3, "amount": 1}
+
+
+def _compare(client, baseline, scenarios):
+    return client.post("/compare", json={"model": "Co2BYTKM", "baseline": baseline, "scenarios": scenarios})
+
+
+def test_compare_deltas(client):
+    response = _compare(client, BASELINE, [{"name": "far", "distance": "4"}])
+    assert response.status_code == 200
+    scenario = response.json["scenarios"][0]
+    assert scenario["name"] == "far"
+    assert scenario["inputs"]["distance"] == 4.0
+    delta = scenario["deltas"][0]
+    assert (delta["baseline"], delta["value"], delta["delta"], delta["pct_change"]) == (6.0, 24.0, 18.0, 300.0)
+
+
+@pytest.mark.parametrize("baseline, scenarios", [
+    ({**BASELINE, "distance": "abc"}, [{"distance": 2}]),
+    ({**BASELINE, "distance": None}, [{"distance": 2}]),
+    (BASELINE, [{"distance": "x"}]),
+    (BASELINE, [{"inputs": {"load": float("inf")}}]),
+    (BASELINE, [{"distance": True}]),
+    (BASELINE, ["far"]),
+])
+def test_compare_rejects_invalid_inputs(client, baseline, scenarios):
+    # 以 json.dumps 送出：請求內容可以包含 Infinity
+    body = json.dumps({"model": "Co2BYTKM", "baseline": baseline, "scenarios": scenarios})
+    response = client.post("/compare", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert response.json["status"] == "error"
+
@@ -0,0 +1,76 @@
+"""formula.py 的公式轉換、相依排序、範圍與向量化求值。
+
+執行：python -m pytest tests
+"""
+
+import ast
+
+import numpy as np
+import pytest
+
+from formula import GLOBAL, CompiledFormulas, FormulaError, parse, translate
+
+
+def _param(name, value=0.0, formula=None):
+    p = {"name": name, "value": value}
+    if formula:
+        p.update(formula=formula, isInputParameter=False)
+    return p
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("2 ^ 3", "2 ** 3"),
+    ("if(a > 1; b; c)", "_if(a > 1, b, c)"),
+    ("AND(a; NOT(b))", "_and(a, _not(b))"),
+])
+def test_translate(formula, expected):
+    # untokenize 的空白不固定：以 ast.unparse 正規化後比較
+    assert ast.unparse(ast.parse(translate(formula))) == expected
+
+
+@pytest.mark.parametrize("formula", ["a +", "__import__('os')", "a.b", "'text'", "foo(a)", "max(a, key=b)"])
+def test_parse_rejects_unsupported_syntax(formula):
+    with pytest.raises(FormulaError):
+        parse(formula)
+
+
+def test_parse_collects_lowercase_names():
+    _, names = parse("KM * Ton + sqrt(x) + pi")
+    assert names == {"km", "ton", "x", "pi"}
+
+
+def test_dependent_parameters_are_evaluated_in_order():
+    compiled = CompiledFormulas(
+        [_param("total", formula="tkm * factor"), _param("tkm", formula="km * ton"),
+         _param("km", 10), _param("ton", 2), _param("factor", 0.5)],
+        {}, [(GLOBAL, "total", None), (GLOBAL, None, 7.0), (GLOBAL, "if(km > 5; 1; 0)", None)])
+    assert compiled.evaluate().tolist() == [10.0, 7.0, 1.0]
+
+
+def test_process_scope_overrides_global_parameter():
+    compiled = CompiledFormulas(
+        [_param("km", 10)], {"p1": [_param("KM", 3)]},
+        [("p1", "km * 2", None), ("p2", "km * 2", None)])
+    assert compiled.evaluate().tolist() == [6.0, 20.0]
+    assert compiled.evaluate({("p1", "Km"): 4.0, (GLOBAL, "km"): 1.0}).tolist() == [8.0, 2.0]
+
+
+def test_vectorized_evaluation():
+    compiled = CompiledFormulas(
+        [_param("km", 1), _param("ton", 1), _param("tkm", formula="km * ton")], {},
+        [(GLOBAL, "tkm", None), (GLOBAL, None, 5.0), (GLOBAL, "max(km; ton; 3)", None)])
+    km = np.array([1.0, 2.0, 4.0])
+    out = compiled.evaluate({(GLOBAL, "km"): km, (GLOBAL, "ton"): 2.0}, n=3)
+    assert out.shape == (3, 3)
+    assert out[0].tolist() == [2.0, 4.0, 8.0]
+    assert out[1].tolist() == [5.0, 5.0, 5.0]
+    assert out[2].tolist() == [3.0, 3.0, 4.0]
+
+
+@pytest.mark.parametrize("parameters, expression", [
+    ([_param("a", formula="b + 1"), _param("b", formula="a * 2")], "a"),
+    ([_param("a", 1)], "missing * 2"),
+])
+def test_invalid_parameter_graphs(parameters, expression):
+    with pytest.raises(FormulaError):
+        CompiledFormulas(parameters, {}, [(GLOBAL, expression, None)])
@@ -0,0 +1,59 @@
+"""history_store.py 的彙總、查詢與 /history 在 SQLite 無法讀取時的回應。
+
+執行：python -m pytest tests
+"""
+
+import sqlite3
+
+import pytest
+
+from history_store import HistoryStore
+
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.sqlite3"), hour_retention=None)
+
+
+def _totals(rows):
+    return {(r["model"], r["category"]): (r["count"], r["sum"]) for r in rows}
+
+
+def test_query_merges_pending_rollups_without_flushing(store):
+    store.record("m", {"gwp": 2.0, "other": 1.0}, timestamp=DAY + 10)
+    store.flush()
+    store.record("m", {"gwp": 3.0}, timestamp=DAY + 20)
+    rows = store.query(0, 3 * DAY, categories=["gwp"])
+    assert _totals(rows) == {("m", "gwp"): (2, 5.0)}
+    assert store.flushes == 1 and store.stats()["pending_rollups"]
+    # 寫入 SQLite 後結果相同（不重複計算）
+    store.flush()
+    assert store.query(0, 3 * DAY, categories=["gwp"]) == rows
+
+
+def test_group_by_and_percentiles(store):
+    for i, value in enumerate([1.0, 2.0, 3.0, 100.0]):
+        store.record("a" if i % 2 else "b", {"gwp": value}, timestamp=i * DAY)
+    rows = store.query(0, 10 * DAY, group_by=("category",), percentiles=(50, 100))
+    assert len(rows) == 1
+    assert rows[0]["count"] == 4 and rows[0]["max"] == 100.0
+    assert rows[0]["p50"] == pytest.approx(2.0, rel=0.02)
+    assert rows[0]["p100"] == 100.0
+    hourly = store.query(0, 10 * DAY, resolution="hour", models=["a"])
+    assert [r["bucket"] for r in hourly] == [DAY, 3 * DAY]
+
+
+class _LockedConnection:
+    def execute(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_history_returns_503_when_database_is_locked(client, app_module, monkeypatch, store):
+    store.record("m", {"gwp": 1.0})
+    monkeypatch.setattr(store, "_db", _LockedConnection())
+    monkeypatch.setattr(app_module, "history_store", store)
+    response = client.get("/history")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
@@ -0,0 +1,121 @@
+"""ipc_pool.py 的排程、剔除與重試、逾時與 backpressure（以 fake_ipc_server 作為 openLCA）。
+
+執行：python -m pytest tests
+"""
+
+import socket
+import threading
+import time
+
+import olca_schema as o
+import pytest
+
+from fake_ipc_server import FakeIpcServer
+from ipc_pool import IpcClientPool, PoolOverloaded, PoolUnavailable
+
+
+@pytest.fixture
+def servers():
+    started = [FakeIpcServer(port=0).start() for _ in range(2)]
+    yield started
+    for server in started:
+        server.stall = 0.0
+        server.stop()
+
+
+def _closed_port_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def _pool(endpoints, **kwargs):
+    options = {"health_interval": None, "request_timeout": 0.3, "probe_timeout": 0.3, "acquire_timeout": 2.0}
+    return IpcClientPool(endpoints=endpoints, **{**options, **kwargs})
+
+
+def _member(pool, url):
+    return next(m for m in pool.members if m.endpoint == url)
+
+
+def _find_model(pool):
+    return pool.get(o.ProductSystem, name="廚餘處理量")
+
+
+def test_failover_from_unreachable_server(servers):
+    dead = _closed_port_url()
+    pool = _pool([dead, servers[0].url])
+    for _ in range(3):
+        assert _find_model(pool).name == "廚餘處理量"
+    assert not _member(pool, dead).healthy
+    assert _member(pool, servers[0].url).served == 3
+
+
+def test_hung_server_times_out_and_is_ejected(servers):
+    hung, good = servers
+    hung.stall = 2.0
+    pool = _pool([hung.url, good.url])
+    start = time.monotonic()
+    for _ in range(2):
+        assert _find_model(pool).name == "廚餘處理量"
+    assert time.monotonic() - start < 1.5
+    status = _member(pool, hung.url).status()
+    assert not status["healthy"] and "timed out" in status["last_error"].lower()
+
+
+def test_all_servers_down_raises_pool_unavailable():
+    pool = _pool([_closed_port_url(), _closed_port_url()])
+    with pytest.raises(PoolUnavailable):
+        _find_model(pool)
+
+
+def test_health_check_probes_in_parallel_and_recovers(servers):
+    for server in servers:
+        server.stall = 2.0
+    pool = _pool([s.url for s in servers])
+    start = time.monotonic()
+    stats = pool.check_health()
+    assert time.monotonic() - start < 1.5
+    assert [m["healthy"] for m in stats["members"]] == [False, False]
+    for server in servers:
+        server.stall = 0.0
+    assert [m["healthy"] for m in pool.check_health()["members"]] == [True, True]
+
+
+def test_least_outstanding_member_is_chosen(servers):
+    pool = _pool([s.url for s in servers])
+    with pool.acquire() as first, pool.acquire() as second:
+        assert first is not second
+        assert pool.stats()["outstanding"] == 2
+
+
+def _hold(pool, release, ready):
+    with pool.acquire():
+        ready.set()
+        release.wait(5)
+
+
+def test_shedding_when_waiting_queue_is_full():
+    pool = IpcClientPool(clients=[object()], max_concurrency=1, max_waiting=1, acquire_timeout=5.0)
+    release, holding = threading.Event(), threading.Event()
+    holder = threading.Thread(target=_hold, args=(pool, release, holding))
+    holder.start()
+    assert holding.wait(5)
+    waiter = threading.Thread(target=lambda: pool.acquire().__enter__())
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while pool.waiting < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        with pytest.raises(PoolOverloaded):
+            with pool.acquire(shed=True):
+                pass
+        # 不 shed 的呼叫者照常排隊（這裡等到逾時）
+        with pytest.raises(PoolUnavailable) as error:
+            with pool.acquire(timeout=0.1):
+                pass
+        assert not isinstance(error.value, PoolOverloaded)
+    finally:
+        release.set()
+        holder.join(5)
+        waiter.join(5)
@@ -0,0 +1,82 @@
+"""jobs.py 的工作狀態、取消、佇列上限與事件紀錄，以及 /jobs 的筆數上限。
+
+執行：python -m pytest tests
+"""
+
+import threading
+
+import pytest
+
+from jobs import CANCELLED, DONE, ERROR, Job, JobCancelled, JobManager, JobQueueFull
+
+
+def _wait(job):
+    job.future.result(timeout=5)
+    return job
+
+
+def test_job_runs_and_collects_results():
+    manager = JobManager(max_workers=1)
+
+    def work(job, values):
+        for v in values:
+            job.add_result({"value": v})
+
+    job = _wait(manager.submit(work, [1, 2], total=2))
+    assert job.status == DONE and job.progress == 1.0
+    assert [r["value"] for r in job.to_dict()["results"]] == [1, 2]
+    _, events = job.wait_events(0, timeout=0)
+    assert [e for e, _ in events] == ["status", "result", "result", DONE]
+
+
+@pytest.mark.parametrize("error, status", [(ValueError("boom"), ERROR), (JobCancelled("stop"), CANCELLED)])
+def test_failed_job_records_error(error, status):
+    def work(job):
+        raise error
+
+    job = _wait(JobManager(max_workers=1).submit(work))
+    assert job.status == status and job.error == str(error)
+
+
+def test_queue_limit_and_cancel_pending_job():
+    manager = JobManager(max_workers=1, max_pending=2)
+    release = threading.Event()
+    running = manager.submit(lambda job: release.wait(5))
+    pending = manager.submit(lambda job: None)
+    with pytest.raises(JobQueueFull):
+        manager.submit(lambda job: None)
+    manager.cancel(pending.id)
+    assert pending.status == CANCELLED
+    release.set()
+    assert _wait(running).status == DONE
+    assert manager.stats()["jobs"] == {DONE: 1, CANCELLED: 1}
+
+
+def test_event_history_is_bounded():
+    job = Job(total=10, max_events=3)
+    for i in range(10):
+        job.add_result({"value": i})
+    assert len(job.events) == 3 and job.dropped == 7
+    # 落後的讀取者從仍保留的最舊事件繼續，序號照常遞增
+    end, events = job.wait_events(2, timeout=0)
+    assert end == 10
+    assert [data["value"] for _, data in events] == [7, 8, 9]
+    end, events = job.wait_events(9, timeout=0)
+    assert (end, [data["value"] for _, data in events]) == (10, [9])
+
+
+def test_submit_rejects_too_many_items(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "JOB_MAX_ITEMS", 2)
+    items = [{"distance": 1, "factor": 2, "load": 3, "amount": 1}] * 3
+    response = client.post("/jobs", json={"model": "Co2BYTKM", "items": items})
+    assert response.status_code == 413
+    response = client.post("/jobs", json={"model": "Co2BYTKM", "items": items[:2]})
+    assert response.status_code == 202
+
+
+def test_events_stream_until_job_finishes(client):
+    items = [{"distance": d, "factor": 2, "load": 3, "amount": 1} for d in (1, 2)]
+    job_id = client.post("/jobs", json={"model": "Co2BYTKM", "items": items}).json["job_id"]
+    body = client.get(f"/jobs/{job_id}/events").get_data(as_text=True)
+    names = [line.split(": ", 1)[1] for line in body.splitlines() if line.startswith("event: ")]
+    assert names.count("result") == 2 and names[-1] == DONE
@@ -0,0 +1,60 @@
+"""metrics.py 的 Prometheus 輸出、階段計時與 Server-Timing。
+
+執行：python -m pytest tests
+"""
+
+import threading
+
+import pytest
+
+import metrics
+from metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("h_seconds", "help", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="x")
+    text = registry.render()
+    assert 'h_seconds_bucket{stage="x",le="0.1"} 1' in text
+    assert 'h_seconds_bucket{stage="x",le="1.0"} 2' in text
+    assert 'h_seconds_bucket{stage="x",le="+Inf"} 3' in text
+    assert 'h_seconds_count{stage="x"} 3' in text
+
+
+def test_counter_labels_are_escaped_and_gauge_errors_are_skipped():
+    registry = Registry()
+    registry.counter("c_total", "help", ("path",)).inc(path='a"b')
+    registry.gauge("g", "help", lambda: 1 / 0)
+    registry.gauge("g2", "help", lambda: {("a",): 2, ("b",): None}, ("k",))
+    text = registry.render()
+    assert 'c_total{path="a\\"b"} 1' in text
+    assert "# TYPE g gauge" in text and "\ng " not in text
+    assert 'g2{k="a"} 2' in text and 'k="b"' not in text
+
+
+def test_stages_are_recorded_per_request():
+    token = metrics.begin_request()
+    with metrics.stage("lookup"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.stage("calculate"):
+            raise ValueError
+    with metrics.stage("lookup"):
+        pass
+    # 其他執行緒的階段不會混入目前的請求
+    thread = threading.Thread(target=lambda: metrics.stage("other").__enter__())
+    thread.start()
+    thread.join()
+    stages = metrics.end_request(token)
+    assert [name for name, _ in stages] == ["lookup", "calculate", "lookup"]
+    header = metrics.server_timing([("lookup", 0.001), ("lookup", 0.002), ("calculate", 0.5)], total=1.0)
+    assert header == "lookup;dur=3.00, calculate;dur=500.00, total;dur=1000.00"
+
+
+def test_metrics_endpoint(client):
+    client.post("/calculate/Co2BYTKM", json={"distance": 7, "factor": 2, "load": 3, "amount": 5})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'lca_stage_duration_seconds_count{stage="result_cache"}' in response.get_data(as_text=True)
@@ -0,0 +1,104 @@
+"""model_cache.py 的過期檢查與鎖：呼叫 openLCA 時不持有整個快取的鎖。
+
+執行：python -m pytest tests
+"""
+
+import threading
+import time
+
+import olca_schema as o
+
+from model_cache import ModelMetadataCache
+
+
+class SlowClient:
+    """olca_ipc.Client 的替身：查詢 blocked 中的模型時等待 release。"""
+
+    def __init__(self):
+        self.versions = {"a": "1", "b": "1"}
+        self.blocked = set()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.lookups = []
+
+    def get(self, model_type, uid=None, name=None):
+        if model_type is o.ImpactMethod:
+            return o.ImpactMethod(id="m", name=name)
+        key = name or uid
+        self.lookups.append(key)
+        if key in self.blocked:
+            self.started.set()
+            self.release.wait(5)
+        return o.ProductSystem(id=key, name=key, version=self.versions[key])
+
+    def get_parameters(self, model_type, uid):
+        return []
+
+    def find(self, model_type, name):
+        return None
+
+
+def _cache(client, revalidate_after=None):
+    cache = ModelMetadataCache(client, revalidate_after=revalidate_after)
+    cache.get("a")
+    cache.get("b")
+    client.lookups.clear()
+    return cache
+
+
+def _in_thread(fn):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", fn()))
+    thread.start()
+    return thread, result
+
+
+def test_revalidating_one_model_does_not_block_others():
+    client = SlowClient()
+    cache = _cache(client, revalidate_after=0)
+    client.blocked.add("a")
+    thread, _ = _in_thread(lambda: cache.get("a"))
+    assert client.started.wait(5)
+    start = time.monotonic()
+    assert cache.get("b").name == "b"
+    assert cache.models()
+    assert time.monotonic() - start < 1
+    client.release.set()
+    thread.join(5)
+
+
+def test_concurrent_misses_resolve_once():
+    client = SlowClient()
+    cache = _cache(client)
+    cache.invalidate("a")
+    client.blocked.add("a")
+    threads = [_in_thread(lambda: cache.get("a")) for _ in range(4)]
+    assert client.started.wait(5)
+    client.release.set()
+    for thread, _ in threads:
+        thread.join(5)
+    assert client.lookups == ["a"]
+    assert len({id(result["value"]) for _, result in threads}) == 1
+
+
+def test_stale_model_is_replaced():
+    client = SlowClient()
+    cache = _cache(client, revalidate_after=0)
+    old = cache.get("a")
+    client.versions["a"] = "2"
+    assert cache.get("a").version == "2"
+    assert cache.get("a") is not old
+
+
+def test_invalidate_during_resolve_is_not_overwritten():
+    client = SlowClient()
+    cache = _cache(client)
+    cache.invalidate("a")
+    client.blocked.add("a")
+    thread, result = _in_thread(lambda: cache.get("a"))
+    assert client.started.wait(5)
+    cache.invalidate("a")
+    client.release.set()
+    thread.join(5)
+    assert result["value"].name == "a"
+    assert "a" not in [m["name"] for m in cache.models()]
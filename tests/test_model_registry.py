@@ -0,0 +1,117 @@
+"""model_registry.py 的參數綁定（依名稱 / 依位置）與 ModelSpec 驗證。
+
+執行：python -m pytest tests
+"""
+
+import os
+import sys
+
+import olca_schema as o
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_cache import ModelMetadata  # noqa: E402
+from model_registry import BindingError, ModelRegistry, ModelSpec, Param  # noqa: E402
+
+
+def _parameter(name, context=None):
+    return o.ParameterRedef(name=name, value=1.0, context=o.Ref(id=context, name=context) if context else None)
+
+
+class FakeCache:
+    """只提供 get() 的 model_cache；set() 模擬模型被修改後重新解析。"""
+
+    def __init__(self):
+        self.metas = {}
+
+    def set(self, name, *parameters, version="1"):
+        self.metas[name] = ModelMetadata(
+            name, o.ProductSystem(id=name, name=name), list(parameters), None,
+            o.ImpactMethod(id="m", name="m"), version=version)
+
+    def get(self, name):
+        return self.metas[name]
+
+
+@pytest.fixture
+def cache():
+    cache = FakeCache()
+    cache.set("tkm", _parameter("cofficient"), _parameter("KM"), _parameter("ton"))
+    return cache
+
+
+def _redefs(setup):
+    return {p.name: p.value for p in setup.parameters}
+
+
+def test_binds_by_name_regardless_of_order(cache):
+    registry = ModelRegistry(cache, [ModelSpec("tkm", "tkm", (
+        Param("distance", "km"), Param("load", "TON"), Param("factor", "cofficient")))], discover=False)
+    compiled = registry.compile("tkm")
+    setup = compiled.setup({"distance": 7.0, "load": 3.0, "factor": 2.0, "amount": 5.0})
+    assert _redefs(setup) == {"KM": 7.0, "ton": 3.0, "cofficient": 2.0}
+    assert setup.amount == 5.0
+    # 同一個模型版本只編譯一次
+    assert registry.compile("tkm") is compiled
+
+
+def test_missing_parameter_raises_binding_error(cache):
+    registry = ModelRegistry(cache, [ModelSpec("tkm", "tkm", (Param("oilUse", "oil"),))], discover=False)
+    with pytest.raises(BindingError):
+        registry.compile("tkm")
+
+
+def test_ambiguous_parameter_needs_context(cache):
+    cache.set("ctx", _parameter("x", "a"), _parameter("x", "b"))
+    registry = ModelRegistry(cache, [
+        ModelSpec("ambiguous", "ctx", (Param("x", "x"),)),
+        ModelSpec("scoped", "ctx", (Param("x", "x", context="b"),)),
+    ], discover=False)
+    with pytest.raises(BindingError):
+        registry.compile("ambiguous")
+    assert registry.compile("scoped").parameters[0].context.id == "b"
+
+
+def test_positional_binding_is_pinned_to_names(cache):
+    cache.set("oil", _parameter("cofficient"), _parameter("distance"), _parameter("oil"), _parameter("ton"))
+    spec = ModelSpec("oil", "oil", (Param("factor"), Param("oilUse"), Param("distance"), Param("load")),
+                     binding="position")
+    registry = ModelRegistry(cache, [spec], discover=False)
+    first = registry.compile("oil").bindings()
+    assert first == {"factor": "cofficient", "oilUse": "distance", "distance": "oil", "load": "ton"}
+    # 模型重新解析後參數順序改變：仍然依第一次固定下來的名稱綁定
+    cache.set("oil", _parameter("ton"), _parameter("oil"), _parameter("distance"), _parameter("cofficient"),
+              version="2")
+    assert registry.compile("oil").bindings() == first
+
+
+def test_positional_binding_needs_enough_parameters(cache):
+    spec = ModelSpec("tkm", "tkm", tuple(Param(f) for f in "abcd"), binding="position")
+    with pytest.raises(BindingError):
+        ModelRegistry(cache, [spec], discover=False).compile("tkm")
+
+
+@pytest.mark.parametrize("params, binding", [
+    ((Param("a"),), "name"),
+    ((Param("a"), Param("b", "b")), "position"),
+    ((Param("a", "x"), Param("a", "y")), "name"),
+])
+def test_invalid_specs(params, binding):
+    with pytest.raises(ValueError):
+        ModelSpec("r", "m", params, binding=binding)
+
+
+def test_validate_rejects_non_finite_and_non_numeric():
+    spec = ModelSpec("r", "m", (Param("a", "a"),))
+    assert spec.validate({"a": "2", "amount": 1}) == {"a": 2.0, "amount": 1.0}
+    for bad in ({"a": "x", "amount": 1}, {"a": float("nan"), "amount": 1}, {"a": True, "amount": 1}, {"a": 1}):
+        with pytest.raises(ValueError):
+            spec.validate(bad)
+
+
+def test_unknown_route_has_no_side_effects(cache):
+    registry = ModelRegistry(cache, [], discover=True)
+    assert "nope" not in registry
+    with pytest.raises(KeyError):
+        registry["nope"]
@@ -0,0 +1,105 @@
+"""response_formats.py 的格式協商、欄式序列化與壓縮。
+
+執行：python -m pytest tests
+"""
+
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import response_formats  # noqa: E402
+from response_formats import ARROW, COLUMNAR, JSON, MSGPACK, ResultTable  # noqa: E402
+
+
+def _accept(header):
+    return parse_accept_header(header, MIMEAccept)
+
+
+@pytest.fixture
+def without_optional(monkeypatch):
+    """模擬沒有安裝 msgpack / pyarrow 的環境。"""
+    monkeypatch.setattr(response_formats, "msgpack", None)
+    monkeypatch.setattr(response_formats, "pa", None)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, JSON),
+    ("*/*", JSON),
+    ("text/csv", JSON),
+    (COLUMNAR, COLUMNAR),
+    (f"{JSON};q=0.5, {COLUMNAR}", COLUMNAR),
+    (MSGPACK, JSON),
+    ("application/x-msgpack", JSON),
+    (ARROW, JSON),
+    (f"{MSGPACK}, {JSON};q=0", None),
+    ("Application/JSON;q=0", None),
+])
+def test_negotiate_without_optional_packages(without_optional, header, expected):
+    assert response_formats.negotiate(_accept(header) if header else None) == expected
+
+
+def test_negotiate_format_parameter(without_optional):
+    assert response_formats.negotiate(_accept(MSGPACK), "columnar") == COLUMNAR
+    assert response_formats.negotiate(_accept(COLUMNAR), "JSON") == JSON
+    assert response_formats.negotiate(None, "msgpack") is None
+    assert response_formats.negotiate(None, "csv") is None
+
+
+def test_alias_maps_to_msgpack_when_installed(monkeypatch):
+    monkeypatch.setattr(response_formats, "msgpack", object())
+    assert response_formats.negotiate(_accept("application/x-msgpack")) == MSGPACK
+
+
+def test_columnar_round_trip():
+    table = ResultTable.from_impacts(
+        [
+            [{"category": "a", "unit": "kg", "value": 1.0}, {"category": "b", "unit": "t", "value": 2.0}],
+            [{"category": "a", "unit": "kg", "value": 3.0}, {"category": "b", "unit": "t", "value": 4.0}],
+        ],
+        labels=["x", "y"], inputs={"distance": np.array([1.0, 2.0])}, meta={"status": "ok"})
+    body = json.loads(response_formats.encode(table, COLUMNAR))
+    assert body["count"] == 2
+    assert body["categories"] == ["a", "b"]
+    assert [body["units"][i] for i in body["unit_index"]] == ["kg", "t"]
+    assert body["columns"] == [[1.0, 3.0], [2.0, 4.0]]
+    assert body["labels"] == ["x", "y"]
+    assert body["inputs"] == {"distance": [1.0, 2.0]}
+    assert body["status"] == "ok"
+
+
+def test_unit_dictionary_lists_each_unit_once():
+    table = ResultTable(["a", "b", "c"], ["kg", "t", "kg"], np.zeros((1, 3)))
+    assert table.unit_dictionary() == (["kg", "t"], [0, 1, 0])
+
+
+def test_gzip_compression(monkeypatch):
+    monkeypatch.setattr(response_formats, "zstandard", None)
+    assert response_formats.choose_encoding(parse_accept_header("gzip, zstd")) == "gzip"
+    assert response_formats.choose_encoding(parse_accept_header("identity")) is None
+    body = b"x" * 4096
+    assert gzip.decompress(response_formats.compress(body, "gzip")) == body
+    assert response_formats.compress(body, None) is body
+
+
+@pytest.mark.parametrize("header", [MSGPACK, "application/x-msgpack", ARROW])
+def test_calculate_falls_back_to_json_without_optional_packages(client, without_optional, header):
+    response = client.post("/calculate/Co2BYTKM", json={"distance": 7, "factor": 2, "load": 3, "amount": 5},
+                           headers={"Accept": header})
+    assert response.status_code == 200
+    assert response.mimetype == JSON
+    assert response.json["impacts"][0]["value"] == 210.0
+    assert "Accept" in response.vary and "Accept-Encoding" in response.vary
+
+
+def test_calculate_rejects_explicitly_excluded_json(client, without_optional):
+    response = client.post("/calculate/Co2BYTKM", json={"distance": 7, "factor": 2, "load": 3, "amount": 5},
+                           headers={"Accept": f"{MSGPACK}, {JSON};q=0"})
+    assert response.status_code == 406
@@ -0,0 +1,62 @@
+"""result_cache.py 的鍵值標準化、LRU / TTL 與 SQLite 持久化。
+
+執行：python -m pytest tests
+"""
+
+import olca_schema as o
+import pytest
+
+import result_cache
+from result_cache import ResultCache, make_key
+
+
+def _setup(amount=1.0, *params, target_name="model"):
+    return o.CalculationSetup(
+        target=o.Ref(id="ps", name=target_name), amount=amount,
+        impact_method=o.Ref(id="m", name="method"),
+        parameters=[o.ParameterRedef(name=n, value=v) for n, v in params])
+
+
+def test_key_ignores_parameter_order_and_descriptive_fields():
+    key = make_key(_setup(1.0, ("a", 1), ("b", 2)))
+    assert make_key(_setup(1.0, ("b", 2), ("a", 1), target_name="renamed")) == key
+    assert make_key(_setup(1.0, ("a", 1.0000000000001), ("b", 2))) == key
+    assert make_key(_setup(1.0, ("a", 1), ("b", 3))) != key
+    assert make_key(_setup(2.0, ("a", 1), ("b", 2))) != key
+    assert make_key(_setup(1.0, ("a", 1), ("b", 2)), version=("2", None)) != key
+
+
+def test_lru_eviction_and_copies():
+    cache = ResultCache(maxsize=2, ttl=None)
+    cache.put("a", [{"value": 1}])
+    cache.put("b", [{"value": 2}])
+    cache.get("a")[0]["value"] = 99
+    cache.put("c", [{"value": 3}])
+    assert cache.get("b") is None
+    assert cache.get("a") == [{"value": 1}]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    cache = ResultCache(maxsize=10, ttl=60)
+    cache.put("a", 1)
+    now[0] += 61
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache(maxsize=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None and not cache.enabled
+
+
+def test_sqlite_persists_across_instances(tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    ResultCache(maxsize=10, ttl=None, path=path).put("a", [{"value": 1.5}])
+    cache = ResultCache(maxsize=10, ttl=None, path=path)
+    assert cache.get("a") == [{"value": 1.5}]
+    cache.clear()
+    assert ResultCache(maxsize=10, ttl=None, path=path).get("a") is None
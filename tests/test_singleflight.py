@@ -0,0 +1,96 @@
+"""singleflight.py 的並行呼叫合併、例外傳遞與逾時。
+
+執行：python -m pytest tests
+"""
+
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, SingleFlightTimeout
+
+
+def _leader(flight, key, fn):
+    """在背景執行緒中以 fn 成為 key 的 leader，回傳 (thread, 結果 dict)。"""
+    result = {}
+
+    def run():
+        try:
+            result["value"] = flight.do(key, fn)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def _blocking(started, release, value=None, error=None):
+    def fn():
+        started.set()
+        release.wait(5)
+        if error is not None:
+            raise error
+        return value
+    return fn
+
+
+def _wait_for_waiters(flight, n):
+    deadline = time.monotonic() + 5
+    while flight.stats()["waiters"] < n and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    leader, leader_result = _leader(flight, "k", _blocking(started, release, value="x"))
+    assert started.wait(5)
+    followers = [_leader(flight, "k", lambda: calls.append(1)) for _ in range(3)]
+    _wait_for_waiters(flight, 3)
+    release.set()
+    leader.join(5)
+    for thread, _ in followers:
+        thread.join(5)
+    assert leader_result["value"] == ("x", False)
+    assert [r["value"] for _, r in followers] == [("x", True)] * 3
+    assert calls == []
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+    # 完成後不保留結果：再次呼叫會重新執行
+    assert flight.do("a", lambda: 3) == (3, False)
+
+
+def test_error_is_raised_to_all_waiters():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    leader, leader_result = _leader(flight, "k", _blocking(started, release, error=ValueError("boom")))
+    assert started.wait(5)
+    follower, follower_result = _leader(flight, "k", lambda: "unused")
+    _wait_for_waiters(flight, 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert isinstance(leader_result["error"], ValueError)
+    assert follower_result["error"] is leader_result["error"]
+    assert flight.do("k", lambda: "ok") == ("ok", False)
+
+
+def test_waiter_times_out_and_late_caller_recomputes():
+    flight = SingleFlight(timeout=0.2)
+    started, release = threading.Event(), threading.Event()
+    leader, _ = _leader(flight, "k", _blocking(started, release, value="slow"))
+    assert started.wait(5)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("k", lambda: "unused")
+    # 進行中的計算已超過逾時：新的呼叫者不再等待它，而是自己重新計算
+    assert flight.do("k", lambda: "fresh") == ("fresh", False)
+    release.set()
+    leader.join(5)
@@ -0,0 +1,143 @@
+"""supabase_writer.py 的批次寫入、重試、journal 與重送（以 MemorySupabase 取代 Supabase）。
+
+執行：python -m pytest tests
+"""
+
+import glob
+import os
+import threading
+
+from supabase_writer import MemorySupabase, SupabaseWriter, WriteRecord
+
+
+def _writer(db, tmp_path, **kwargs):
+    options = {"max_retries": 2, "backoff": 0.0, "journal_path": str(tmp_path / "journal.ndjson")}
+    return SupabaseWriter(db, "IPCC", **{**options, **kwargs})
+
+
+def _submit(writer, n, table="Co2ByDistance"):
+    return [writer.submit({"value": i}, table, {"distance": i}) for i in range(n)]
+
+
+def test_batches_link_co2_rows_to_ipcc_ids(tmp_path):
+    db = MemorySupabase()
+    writer = _writer(db, tmp_path)
+    ids = _submit(writer, 3)
+    writer.flush()
+    assert [r["id"] for r in db.tables["IPCC"]] == ids
+    assert [r["CarbonEmissionID"] for r in db.tables["Co2ByDistance"]] == ids
+    assert writer.written == 3
+
+
+def test_retries_transient_failures(tmp_path):
+    db = MemorySupabase()
+    db.fail_next = 2
+    writer = _writer(db, tmp_path)
+    _submit(writer, 2)
+    writer.flush()
+    assert len(db.tables["IPCC"]) == 2 and len(db.tables["Co2ByDistance"]) == 2
+    assert writer.failures == 2
+    assert not os.path.exists(writer.journal_path)
+
+
+def test_failed_batches_go_to_journal_and_are_replayed(tmp_path):
+    db = MemorySupabase()
+    db.fail_next = 100
+    writer = _writer(db, tmp_path)
+    _submit(writer, 3)
+    writer.flush()
+    assert writer.journaled == 3
+    assert writer.stats()["journal_pending"]
+
+    db.fail_next = 0
+    assert writer.replay() == 3
+    assert len(db.tables["IPCC"]) == 3 and len(db.tables["Co2ByDistance"]) == 3
+    assert not writer.stats()["journal_pending"]
+    assert glob.glob(writer.journal_path + "*") == [writer.journal_path + ".lock"]
+    # 沒有資料時重送不做任何事
+    assert writer.replay() == 0
+
+
+def test_partial_failure_only_resends_remaining_rows(tmp_path):
+    db = MemorySupabase()
+    writer = _writer(db, tmp_path, max_retries=0)
+    _submit(writer, 2)
+    # IPCC 寫入成功、Co2 寫入失敗：journal 只保留 Co2 的部分
+    original = db.table
+
+    def table(name):
+        if name == "Co2ByDistance" and not db.tables["Co2ByDistance"] and writer.failures == 0:
+            db.fail_next = 1
+        return original(name)
+
+    db.table = table
+    writer.flush()
+    with open(writer.journal_path, encoding="utf-8") as f:
+        records = [WriteRecord.from_json(line) for line in f]
+    assert [r.ipcc for r in records] == [None, None]
+    db.table = original
+    assert writer.replay() == 2
+    assert len(db.tables["IPCC"]) == 2 and len(db.tables["Co2ByDistance"]) == 2
+
+
+def test_orphaned_replay_file_is_merged_back(tmp_path):
+    db = MemorySupabase()
+    writer = _writer(db, tmp_path)
+    record = WriteRecord({"id": "a", "value": 1}, "Co2ByDistance", {"CarbonEmissionID": "a"})
+    # 其他 worker 重送到一半就結束：留下沒有行程持有鎖的重送檔
+    with open(writer.journal_path + ".replay-1-dead", "w", encoding="utf-8") as f:
+        f.write(record.to_json() + "\n")
+    assert writer.replay() == 1
+    assert db.tables["IPCC"] == [{"id": "a", "value": 1}]
+    assert not glob.glob(writer.journal_path + ".replay*")
+
+
+class _BlockingSupabase(MemorySupabase):
+    """第一次 execute() 等待 release，模擬一個 worker 重送到一半。"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def table(self, name):
+        table = super().table(name)
+        execute = table.execute
+
+        def blocking_execute():
+            if not self.started.is_set():
+                self.started.set()
+                self.release.wait(5)
+            return execute()
+
+        table.execute = blocking_execute
+        return table
+
+
+def test_workers_sharing_a_journal_do_not_resend_each_others_rows(tmp_path):
+    db = _BlockingSupabase()
+    # 兩個 writer 代表兩個 worker 行程：各自的行程內鎖，共用同一個 journal 檔
+    first, second = _writer(db, tmp_path), _writer(db, tmp_path)
+    first._journal([WriteRecord({"id": str(i)}, "Co2ByDistance", {"CarbonEmissionID": str(i)}) for i in range(3)])
+
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("first", first.replay()))
+    thread.start()
+    assert db.started.wait(5)
+    # first 正在重送：second 不會把 first 認領的檔案當成中斷留下的檔案合併回來
+    second._journal([WriteRecord({"id": "new"}, "Co2ByDistance", {"CarbonEmissionID": "new"})])
+    assert second.replay() == 1
+    db.release.set()
+    thread.join(5)
+
+    assert result["first"] == 3
+    assert sorted(r["id"] for r in db.tables["IPCC"]) == ["0", "1", "2", "new"]
+    assert len(db.tables["Co2ByDistance"]) == 4
+
+
+def test_full_queue_goes_to_journal(tmp_path):
+    writer = _writer(MemorySupabase(), tmp_path, max_queue=1)
+    _submit(writer, 3)
+    assert writer.journaled == 2
+    writer.flush()
+    assert writer.written == 1
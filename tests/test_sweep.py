@@ -0,0 +1,58 @@
+"""sweep.py 的增量統計與 grid 大小檢查。
+
+執行：python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sweep  # noqa: E402
+
+SAMPLES = [6.55, 1.2, 9.8, 3.3, 7.1, 0.4]
+
+
+@pytest.mark.parametrize("n", range(1, 7))
+def test_p2_quantile_small_samples(n):
+    data = SAMPLES[:n]
+    estimators = {p: sweep.P2Quantile(p / 100) for p in sweep.PERCENTILES}
+    for x in data:
+        for estimator in estimators.values():
+            estimator.add(x)
+    values = [estimators[p].value() for p in sweep.PERCENTILES]
+    ordered = sorted(data)
+    if n <= 5:
+        # 5 筆以內是精確的樣本百分位數
+        expected = [ordered[round(p / 100 * (n - 1))] for p in sweep.PERCENTILES]
+        assert values == expected
+    else:
+        assert values == sorted(values)
+        assert ordered[0] <= values[0] and values[-1] <= ordered[-1]
+    if n >= 3:
+        assert len(set(values)) > 1
+
+
+def test_grid_size_is_arithmetic():
+    grid = {"distance": {"start": 0, "stop": 1, "num": 10 ** 10}, "load": {"start": 0, "stop": 1, "step": 1e-12}}
+    assert sweep.grid_size(grid) > 10 ** 20
+
+
+@pytest.mark.parametrize("spec", [
+    {"start": 0, "stop": 1, "step": 0},
+    {"start": 0, "stop": 1, "step": -1},
+    {"start": 1, "stop": 0, "step": 1},
+    {"start": 0, "stop": 1, "num": 0},
+    {"start": 0, "stop": 1},
+])
+def test_grid_size_rejects_invalid_axes(spec):
+    with pytest.raises(ValueError):
+        sweep.grid_size({"distance": spec})
+
+
+def test_grid_points_match_size():
+    grid = {"distance": {"start": 0, "stop": 1, "step": 0.25}, "load": [1, 2]}
+    points = list(sweep.grid_points({"factor": 1}, grid))
+    assert len(points) == sweep.grid_size(grid) == 10
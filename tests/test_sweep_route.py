@@ -0,0 +1,100 @@
+"""/sweep 的請求驗證：所有錯誤都必須在開始串流前以 400 / 413 回傳。
+
+執行：python -m pytest tests
+"""
+
+import json
+import threading
+
+import pytest
+
+BASE = {"factor": 2, "load": 3, "amount": 1}
+UNIFORM = {"distance": {"type": "uniform", "min": 1, "max": 2}}
+
+
+def _sweep(client, **body):
+    return client.post("/sweep", data=json.dumps({"model": "Co2BYTKM", "base": BASE, **body}),
+                       content_type="application/json")
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_grid_sweep_streams_results_and_summary(client):
+    response = _sweep(client, grid={"distance": [1, 2, 3]}, summary_every=2)
+    assert response.status_code == 200
+    lines = _lines(response)
+    assert lines[0] == {"type": "start", "model": "廚餘處理量", "total": 3, "parameters": ["distance"]}
+    results = sorted(l["impacts"]["IPCC 2021 GWP 100"] for l in lines if l["type"] == "result")
+    assert results == [6.0, 12.0, 18.0]
+    assert [l["type"] for l in lines].count("progress") == 1
+    assert lines[-1]["type"] == "summary" and lines[-1]["count"] == 3
+
+
+def test_monte_carlo_is_reproducible_with_seed(client):
+    first = _lines(_sweep(client, distributions=UNIFORM, samples=5, seed=7, results=False))[-1]
+    second = _lines(_sweep(client, distributions=UNIFORM, samples="5", seed=7.0, results=False))[-1]
+    assert first["count"] == 5
+    # 結果依完成順序加入統計：樣本相同，但累加順序可能不同
+    for category, stats in first["categories"].items():
+        other = second["categories"][category]
+        assert (stats["min"], stats["max"]) == (other["min"], other["max"])
+        assert stats["mean"] == pytest.approx(other["mean"])
+
+
+@pytest.mark.parametrize("body", [
+    {"distributions": UNIFORM, "samples": None},
+    {"distributions": UNIFORM, "samples": -5},
+    {"distributions": UNIFORM, "samples": 0},
+    {"distributions": UNIFORM, "samples": 1.5},
+    {"distributions": UNIFORM, "samples": "many"},
+    {"distributions": {"distance": 5}},
+    {"distributions": {"distance": {"type": "normal", "mean": 1}}},
+    {"distributions": {"distance": {"type": "beta"}}},
+    {"distributions": UNIFORM, "summary_every": "x"},
+    {"distributions": UNIFORM, "summary_every": -1},
+    {"distributions": UNIFORM, "seed": "abc"},
+    {"distributions": UNIFORM, "seed": -1},
+    {"distributions": UNIFORM, "base": {**BASE, "load": "heavy"}},
+    {"distributions": UNIFORM, "base": {"factor": 2, "amount": 1}},
+    {"distributions": UNIFORM, "base": [1, 2]},
+    {"distributions": ["distance"]},
+    {"grid": {"distance": {"start": 1, "stop": 2, "step": 0}}},
+    {"grid": {"distance": ["a", 2]}},
+    {"grid": {"distance": []}},
+    {"grid": {"unknown": [1]}},
+    {"grid": {"distance": [1]}, "distributions": UNIFORM},
+])
+def test_invalid_requests_return_400(client, body):
+    response = _sweep(client, **body)
+    assert response.status_code == 400
+    assert response.json["status"] == "error"
+
+
+def test_too_many_samples_returns_413(client, app_module):
+    response = _sweep(client, grid={"distance": {"start": 0, "stop": 1, "num": app_module.SWEEP_MAX_SAMPLES + 1}})
+    assert response.status_code == 413
+
+
+def test_sweep_points_bypass_result_cache(client, app_module):
+    before = app_module.result_cache.stats()
+    response = _sweep(client, grid={"distance": {"start": 100, "stop": 150, "num": 51}}, results=False)
+    assert _lines(response)[-1]["count"] == 51
+    after = app_module.result_cache.stats()
+    assert (after["size"], after["hits"], after["misses"]) == (before["size"], before["hits"], before["misses"])
+
+
+def test_concurrent_streams_are_limited_per_worker(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "_stream_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(app_module, "STREAM_MAX_CONCURRENT", 1)
+    # 尚未讀完的串流佔住唯一的名額
+    streaming = client.post("/sweep", json={"model": "Co2BYTKM", "base": BASE, "grid": {"distance": [1]}},
+                            buffered=False)
+    assert streaming.status_code == 200
+    busy = _sweep(client, grid={"distance": [1]})
+    assert busy.status_code == 503 and "Retry-After" in busy.headers
+    # 一般請求不受影響
+    assert client.post("/calculate/Co2BYTKM", json={**BASE, "distance": 1}).status_code == 200
+    streaming.close()
+    assert _sweep(client, grid={"distance": [1]}).status_code == 200
@@ -0,0 +1,57 @@
+"""warmup.py 的延遲建立 (Lazy) 與背景暖機步驟。
+
+執行：python -m pytest tests
+"""
+
+from warmup import FAILED, READY, Lazy, SkipStep, WarmUp
+
+
+def test_lazy_creates_once_and_can_be_disabled():
+    created = []
+    lazy = Lazy(lambda: created.append(1) or {"value": 1}, "thing")
+    assert not lazy.initialized
+    assert lazy.get("value") == 1 and lazy.get("value") == 1
+    assert created == [1]
+    lazy.reset()
+    assert lazy.instance() == {"value": 1} and created == [1, 1]
+    disabled = Lazy(lambda: None)
+    assert not disabled and disabled.initialized
+
+
+def test_steps_retry_until_they_succeed():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("openLCA not started")
+
+    warm = WarmUp([("pool", flaky), ("models", lambda: None)], retry_interval=0.0).start()
+    assert warm.wait(5)
+    status = warm.status()
+    assert status["state"] == READY
+    assert status["steps"]["pool"]["attempts"] == 3 and status["steps"]["pool"]["error"] is None
+
+
+def test_skipped_step_does_not_block_and_failed_step_stops():
+    def skip():
+        raise SkipStep("model missing")
+
+    def fail():
+        raise RuntimeError("bad config")
+
+    assert WarmUp([("models", skip), ("probe", lambda: None)]).start().wait(5)
+    warm = WarmUp([("pool", fail), ("probe", lambda: None)], retry_interval=0.0, max_attempts=2)
+    assert not warm.start().wait(5)
+    status = warm.status()
+    assert status["state"] == FAILED
+    assert status["steps"]["pool"]["status"] == FAILED and status["steps"]["probe"]["attempts"] == 0
+
+
+def test_readiness_follows_warm_up(client, app_module, monkeypatch):
+    assert client.get("/healthz").status_code == 200
+    monkeypatch.setattr(app_module, "warm_up", WarmUp([("pool", lambda: None)]))
+    response = client.get("/readyz")
+    assert response.status_code == 503 and response.json["warmup"]["state"] == "pending"
+    app_module.warm_up.run()
+    assert client.get("/readyz").status_code == 200
@@ -0,0 +1,155 @@
+"""warmup.py
+
+簡介：
+- Lazy：延遲建立的物件（例如 IPC 連線池、Supabase client），第一次使用時才建立，
+  屬性存取會轉交給建立好的物件，因此呼叫端可以照原本的方式使用（pool.run(...)、writer.submit(...)）；
+  Lazy 本身只有 instance() / initialized / reset() 三個公開成員。
+- WarmUp：在背景執行緒依序執行暖機步驟（建立連線、預先解析模型、試算一次…），
+  失敗的步驟會間隔一段時間重試（例如 openLCA 尚未啟動），不會阻塞程式啟動或 import。
+- status() 提供 /readyz 使用：所有步驟完成後才算 ready，協調器 (orchestrator) 等快取熱了才導入流量。
+
+可客製化項目：
+- retry_interval：步驟失敗後等待幾秒再重試
+- max_attempts：每個步驟最多嘗試幾次（None 表示一直重試）
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+
+class SkipStep(Exception):
+    """步驟無法完成但不需要重試（例如設定中的模型不存在），不影響 ready 狀態。"""
+
+
+class Lazy:
+    """第一次使用時才呼叫 factory() 建立物件；factory 可回傳 None（表示功能停用）。"""
+
+    def __init__(self, factory, name=None):
+        self._factory = factory
+        self._name = name or getattr(factory, "__name__", "lazy")
+        self._value = None
+        self._created = False
+        self._lock = threading.Lock()
+
+    def instance(self):
+        """回傳（必要時建立）物件。名稱刻意避開被包裝物件常見的方法（例如連線池的 get()）。"""
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    self._value = self._factory()
+                    self._created = True
+        return self._value
+
+    @property
+    def initialized(self):
+        return self._created
+
+    def reset(self):
+        """丟棄已建立的物件，下次使用時重新建立（例如 fork 之後）。"""
+        with self._lock:
+            self._value = None
+            self._created = False
+
+    def __bool__(self):
+        return self.instance() is not None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        value = self.instance()
+        if value is None:
+            raise AttributeError(f"{self._name} is disabled")
+        return getattr(value, name)
+
+
+class WarmUp:
+    """在背景依序執行暖機步驟，記錄每個步驟的狀態與耗時。"""
+
+    def __init__(self, steps, retry_interval=5.0, max_attempts=None):
+        self.steps = list(steps)
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self.state = PENDING if self.steps else DISABLED
+        self.started_at = None
+        self.ready_at = None
+        self._steps = {name: {"status": PENDING, "attempts": 0, "seconds": None, "error": None}
+                       for name, _ in self.steps}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.state in (READY, DISABLED)
+
+    def start(self):
+        """啟動背景暖機（重複呼叫不會建立多個執行緒）。"""
+        with self._lock:
+            if self._thread is not None or not self.steps:
+                return self
+            self._thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def wait(self, timeout=None):
+        """等待暖機結束（測試或在 serve 前預熱時使用），回傳是否 ready。"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def run(self):
+        self.state = RUNNING
+        self.started_at = time.time()
+        for name, fn in self.steps:
+            if not self._run_step(name, fn):
+                self.state = FAILED
+                return
+        self.state = READY
+        self.ready_at = time.time()
+        logger.info("warm-up finished in %.2fs", self.ready_at - self.started_at)
+
+    def _run_step(self, name, fn):
+        step = self._steps[name]
+        while not self._stopped.is_set():
+            step["status"] = RUNNING
+            step["attempts"] += 1
+            start = time.perf_counter()
+            try:
+                fn()
+            except SkipStep as e:
+                step.update(status="skipped", error=str(e), seconds=round(time.perf_counter() - start, 4))
+                logger.warning("warm-up step %s skipped: %s", name, e)
+                return True
+            except Exception as e:
+                step.update(status=PENDING, error=str(e), seconds=round(time.perf_counter() - start, 4))
+                if self.max_attempts is not None and step["attempts"] >= self.max_attempts:
+                    step["status"] = FAILED
+                    logger.error("warm-up step %s failed: %s", name, e)
+                    return False
+                logger.warning("warm-up step %s failed (attempt %d), retrying in %.1fs: %s",
+                               name, step["attempts"], self.retry_interval, e)
+                self._stopped.wait(self.retry_interval)
+                continue
+            step.update(status=READY, error=None, seconds=round(time.perf_counter() - start, 4))
+            return True
+        return False
+
+    def status(self):
+        return {
+            "state": self.state,
+            "started_at": self.started_at,
+            "ready_at": self.ready_at,
+            "steps": {name: dict(step) for name, step in self._steps.items()},
+        }